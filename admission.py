@@ -0,0 +1,220 @@
+"""Admission Control und Überlastschutz.
+
+Neue Verbindungen werden gegen drei Obergrenzen geprüft: pro Prozess, pro
+Room und pro Username. Wer darüber liegt, wird schon im Handshake abgelehnt,
+vor ``accept()``: mit HTTP 503 (bzw. 429 beim Username-Limit),
+``Retry-After`` und ``{"type": "rejected", "reason", "retry_after"}`` als
+Body, wo der Server das kann, sonst mit Close-Code 1013 ("Try Again Later")
+bzw. 1008 (HTTP 403 für den Client).
+
+Ein Monitor-Task misst alle ``check_ms`` die Verzögerung der Event-Loop und
+die tiefste Send-Queue. Liegt die Queue über ihrer Schwelle oder die
+Verzögerung ``OVERLOAD_CHECKS`` Messungen in Folge über ihrer, schaltet der
+Prozess in den Degraded-Modus (eine einzelne GC-Pause reicht dafür nicht):
+
+- ``throttle``: ``object_move``/``object_move_batch`` höchstens alle
+  ``move_interval_ms`` pro Verbindung
+- ``chat_only``: nur noch Chat (und Steuernachrichten) wird verteilt
+
+Neue Verbindungen werden im Degraded-Modus abgelehnt. Zurück geht es erst,
+wenn beide Werte eine Weile unter der halben Schwelle liegen.
+"""
+import asyncio
+from typing import Callable, Dict, Optional, Tuple
+
+from rooms import RoomRegistry
+
+# Close-Codes (RFC 6455)
+TRY_AGAIN_LATER = 1013
+POLICY_VIOLATION = 1008
+
+# Degraded-Modi
+THROTTLE = "throttle"
+CHAT_ONLY = "chat_only"
+MODES = (THROTTLE, CHAT_ONLY)
+
+# Nachrichten, die nie abgeworfen werden (Antwort nur an den Absender)
+CONTROL_TYPES = frozenset({"chat", "scene_request", "time_sync", "interest", "subscribe"})
+MOVE_TYPES = frozenset({"object_move", "object_move_batch"})
+
+# So viele Messungen in Folge über der Lag-Schwelle → Degraded-Modus
+OVERLOAD_CHECKS = 3
+
+# So viele Messungen in Folge unter der halben Schwelle → wieder normal
+RECOVER_CHECKS = 8
+
+Refusal = Tuple[str, int]
+
+
+class AdmissionStats:
+    __slots__ = (
+        "rejected_process",
+        "rejected_room",
+        "rejected_user",
+        "rejected_overloaded",
+        "degraded",
+        "degraded_entered",
+        "loop_lag_ms",
+        "queue_depth",
+    )
+
+    def __init__(self) -> None:
+        self.rejected_process = 0
+        self.rejected_room = 0
+        self.rejected_user = 0
+        self.rejected_overloaded = 0
+        self.degraded = 0
+        self.degraded_entered = 0
+        # letzte Messung
+        self.loop_lag_ms = 0
+        self.queue_depth = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+stats = AdmissionStats()
+
+
+class Admission:
+    """Obergrenzen für neue Verbindungen und Degraded-Modus unter Last."""
+
+    def __init__(
+        self,
+        rooms: RoomRegistry,
+        max_connections: int,
+        max_room_members: Callable[[str], int],
+        max_user_connections: int,
+        retry_after: int,
+        check_ms: float,
+        max_loop_lag_ms: float,
+        max_queue_depth: int,
+        mode: str,
+        move_interval_ms: float,
+        on_change: Callable[[bool], None],
+    ) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Degraded-Modus muss eines von {MODES} sein, nicht {mode!r}")
+        self.rooms = rooms
+        self.max_connections = max_connections
+        self._max_room_members = max_room_members
+        self.max_user_connections = max_user_connections
+        self.retry_after = retry_after
+        self.interval = check_ms / 1000.0
+        self.max_loop_lag = max_loop_lag_ms / 1000.0
+        self.max_queue_depth = max_queue_depth
+        self.mode = mode
+        self.move_interval = move_interval_ms / 1000.0
+        # bekommt den neuen Zustand (True = degraded)
+        self._on_change = on_change
+        self.degraded = False
+        # Messungen in Folge über der Lag-Schwelle bzw. unter der halben
+        self._lagging = 0
+        self._calm = 0
+        self._task: Optional[asyncio.Task] = None
+
+    # -- neue Verbindungen -------------------------------------------------
+
+    def check(self, room: str, username: str) -> Optional[Refusal]:
+        """``None`` = annehmen, sonst (Grund, Close-Code)."""
+        if self.degraded:
+            stats.rejected_overloaded += 1
+            return "overloaded", TRY_AGAIN_LATER
+        if self.max_connections and len(self.rooms) >= self.max_connections:
+            stats.rejected_process += 1
+            return "server_full", TRY_AGAIN_LATER
+        limit = self._max_room_members(room)
+        if limit and self.rooms.count(room) >= limit:
+            stats.rejected_room += 1
+            return "room_full", TRY_AGAIN_LATER
+        if (
+            self.max_user_connections
+            and len(self.rooms.by_user(username)) >= self.max_user_connections
+        ):
+            stats.rejected_user += 1
+            return "too_many_sessions", POLICY_VIOLATION
+        return None
+
+    def throttle(self) -> "Throttle":
+        """Drossel für eine neue Verbindung (wirkt nur im Degraded-Modus)."""
+        return Throttle(self)
+
+    # -- Überlast-Erkennung --------------------------------------------------
+
+    def start(self) -> None:
+        if self.interval > 0 and (self.max_loop_lag or self.max_queue_depth):
+            if self._task is None:
+                self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - start - self.interval, 0.0)
+            depth = max((conn.pending for conn in self.rooms), default=0)
+            self.observe(lag, depth)
+
+    def observe(self, lag: float, depth: int) -> None:
+        """Eine Messung auswerten und ggf. den Modus wechseln."""
+        stats.loop_lag_ms = round(lag * 1000)
+        stats.queue_depth = depth
+        if self.max_loop_lag and lag > self.max_loop_lag:
+            self._lagging += 1
+        else:
+            self._lagging = 0
+        over_lag = self._lagging >= OVERLOAD_CHECKS
+        over_depth = self.max_queue_depth and depth > self.max_queue_depth
+        if over_lag or over_depth:
+            self._calm = 0
+            if not self.degraded:
+                self._switch(True)
+            return
+        if not self.degraded:
+            return
+        calm_lag = not self.max_loop_lag or lag < self.max_loop_lag / 2
+        calm_depth = not self.max_queue_depth or depth < self.max_queue_depth / 2
+        self._calm = self._calm + 1 if calm_lag and calm_depth else 0
+        if self._calm >= RECOVER_CHECKS:
+            self._switch(False)
+
+    def _switch(self, degraded: bool) -> None:
+        self.degraded = degraded
+        self._calm = 0
+        stats.degraded = int(degraded)
+        if degraded:
+            stats.degraded_entered += 1
+        self._on_change(degraded)
+
+
+class Throttle:
+    """Entscheidet pro Verbindung, was im Degraded-Modus noch durchgeht."""
+
+    __slots__ = ("admission", "next_move")
+
+    def __init__(self, admission: Admission) -> None:
+        self.admission = admission
+        # Loop-Zeit, ab der wieder eine Bewegung angenommen wird
+        self.next_move = 0.0
+
+    def admit(self, msg_type: str, now: float) -> bool:
+        admission = self.admission
+        if not admission.degraded or msg_type in CONTROL_TYPES:
+            return True
+        if admission.mode == CHAT_ONLY:
+            return False
+        if msg_type not in MOVE_TYPES:
+            return True
+        if now < self.next_move:
+            return False
+        self.next_move = now + admission.move_interval
+        return True
@@ -0,0 +1,161 @@
+"""HTML-Seiten und statische Dateien aus dem Speicher, vorkomprimiert.
+
+Beim Start werden ``templates/`` und ``static/`` einmal gelesen und mit gzip
+(und Brotli, falls installiert) komprimiert. Jede Variante bekommt ein
+starkes ETag; passende ``If-None-Match``-Anfragen bekommen ``304``.
+
+Statische Dateien sind zusätzlich unter einem Namen mit Inhalts-Hash
+erreichbar (``/static/style.3f2a9c1d.css``). Die Templates verweisen beim
+Laden auf diese Namen, deshalb dürfen Browser sie unbegrenzt cachen
+(``immutable``). Nach einem Deploy ändert sich der Hash und damit die URL.
+"""
+import gzip
+import hashlib
+import mimetypes
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - abhängig von der Umgebung
+    brotli = None
+
+# Cache-Control für Seiten und ungehashte Pfade: immer kurz nachfragen
+REVALIDATE = "no-cache"
+# Cache-Control für gehashte statische URLs
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# Kleinere Dateien lohnen die Kompression nicht
+MIN_COMPRESS_BYTES = 256
+
+
+def _content_type(path: Path) -> str:
+    content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    if content_type.startswith("text/") or content_type in (
+        "application/javascript",
+        "application/json",
+    ):
+        content_type += "; charset=utf-8"
+    return content_type
+
+
+def _accepts(accept_encoding: str) -> Tuple[bool, bool]:
+    """(gzip ok, br ok) aus einem ``Accept-Encoding``-Header."""
+    gz = br = False
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if params.replace(" ", "").lower() in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        if coding in ("gzip", "*"):
+            gz = True
+        if coding in ("br", "*"):
+            br = True
+    return gz, br
+
+
+class Asset:
+    """Eine Datei mit allen Varianten (roh, gzip, br) und ETags."""
+
+    __slots__ = ("body", "content_type", "digest", "gzip", "br")
+
+    def __init__(self, body: bytes, content_type: str) -> None:
+        self.body = body
+        self.content_type = content_type
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.gzip: Optional[bytes] = None
+        self.br: Optional[bytes] = None
+        if len(body) >= MIN_COMPRESS_BYTES:
+            # mtime=0: gleicher Inhalt → gleiche Bytes in jedem Worker
+            packed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(packed) < len(body):
+                self.gzip = packed
+            if brotli is not None:
+                packed = brotli.compress(body, quality=11)
+                if len(packed) < len(body):
+                    self.br = packed
+
+    @property
+    def short_hash(self) -> str:
+        return self.digest[:8]
+
+    def variant(self, accept_encoding: str) -> Tuple[bytes, Optional[str], str]:
+        """Beste Variante für den Client: (Body, Content-Encoding, ETag)."""
+        gz, br = _accepts(accept_encoding)
+        tag = self.digest[:16]
+        if br and self.br is not None:
+            return self.br, "br", f'"{tag}-br"'
+        if gz and self.gzip is not None:
+            return self.gzip, "gzip", f'"{tag}-gz"'
+        return self.body, None, f'"{tag}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class AssetCache:
+    """Templates und statische Dateien im Speicher."""
+
+    def __init__(self, base_dir: Path) -> None:
+        self.base_dir = base_dir
+        # Template-Name → Seite
+        self.pages: Dict[str, Asset] = {}
+        # Dateiname (roh und gehasht) → (Datei, gehasht?)
+        self.static: Dict[str, Tuple[Asset, bool]] = {}
+        # "/static/style.css" → "/static/style.<hash>.css"
+        self.urls: Dict[str, str] = {}
+
+    def load(self) -> None:
+        """Alles einlesen und komprimieren (einmal beim Start)."""
+        static: Dict[str, Tuple[Asset, bool]] = {}
+        urls: Dict[str, str] = {}
+        for path in sorted((self.base_dir / "static").iterdir()):
+            if not path.is_file():
+                continue
+            asset = Asset(path.read_bytes(), _content_type(path))
+            hashed = f"{path.stem}.{asset.short_hash}{path.suffix}"
+            static[path.name] = (asset, False)
+            static[hashed] = (asset, True)
+            urls[f"/static/{path.name}"] = f"/static/{hashed}"
+
+        pages: Dict[str, Asset] = {}
+        for path in sorted((self.base_dir / "templates").glob("*.html")):
+            html = path.read_text(encoding="utf-8")
+            for plain, hashed in urls.items():
+                html = html.replace(f'"{plain}"', f'"{hashed}"')
+            pages[path.name] = Asset(html.encode("utf-8"), _content_type(path))
+
+        self.static, self.urls, self.pages = static, urls, pages
+
+    def page(self, request: Request, name: str) -> Response:
+        return self._respond(request, self.pages[name], REVALIDATE)
+
+    def static_file(self, request: Request, name: str) -> Response:
+        entry = self.static.get(name)
+        if entry is None:
+            return Response(status_code=404)
+        asset, hashed = entry
+        return self._respond(request, asset, IMMUTABLE if hashed else REVALIDATE)
+
+    @staticmethod
+    def _respond(request: Request, asset: Asset, cache_control: str) -> Response:
+        headers = request.headers
+        body, encoding, etag = asset.variant(headers.get("accept-encoding", ""))
+        out = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if _etag_matches(headers.get("if-none-match", ""), etag):
+            return Response(status_code=304, headers=out)
+        if encoding is not None:
+            out["Content-Encoding"] = encoding
+        return Response(body, media_type=asset.content_type, headers=out)
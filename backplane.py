@@ -0,0 +1,280 @@
+"""Pub/Sub-Backplane: verteilt Room-Broadcasts zwischen Worker-Prozessen.
+
+Jeder Worker stellt Nachrichten nur an seine lokalen Room-Mitglieder zu und
+veröffentlicht den bereits kodierten Frame zusätzlich auf dem Backplane.
+Frames anderer Worker kommen über den Handler zurück und werden ebenfalls nur
+lokal zugestellt. Der Username des Absenders reist mit, damit Empfänger das
+Echo unterdrücken können, ohne den Frame zu parsen.
+
+Backends:
+
+- ``local``  – ein einzelner Prozess, nichts zu verteilen (Standard)
+- ``memory`` – mehrere Backplanes im selben Prozess (für Tests)
+- ``unix``   – lokaler Broker über ein Unix-Socket; der erste Worker, der die
+  Lock-Datei bekommt, wird Broker, alle anderen verbinden sich als Clients
+
+Ein externer Broker (z.B. Redis) passt als weitere ``Backplane``-Unterklasse
+in ``create_backplane``.
+
+Fehler im Handler oder beim Dekodieren kosten nur das eine Paket (gezählt in
+``dropped``); die Verbindung zum Broker bleibt bestehen und wird nach jedem
+Abbruch neu aufgebaut.
+"""
+import asyncio
+import fcntl
+import logging
+import os
+import struct
+from typing import Callable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# (room, frame, absender) → lokal zustellen
+Handler = Callable[[str, str, Optional[str]], None]
+
+# Paket: Länge Room-Name (uint16), Länge Absender (uint16, 0 = keiner) und
+# Länge Frame (uint32), dann die Bytes
+_HEADER = struct.Struct("!HHI")
+
+# Ab so vielen gepufferten Bytes pro Peer werden Frames verworfen
+MAX_PEER_BUFFER = 8 * 1024 * 1024
+
+
+class Backplane:
+    """Basisklasse: ein einzelner Worker, nichts zu verteilen."""
+
+    def __init__(self) -> None:
+        self._handler: Optional[Handler] = None
+        # Frames, die nicht weitergegeben werden konnten
+        self.dropped = 0
+
+    def set_handler(self, handler: Handler) -> None:
+        self._handler = handler
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def publish(self, room: str, frame: str, sender: Optional[str] = None) -> None:
+        """Frame an alle anderen Worker weitergeben (ohne zu warten)."""
+
+    def _deliver(self, room: str, frame: str, sender: Optional[str] = None) -> None:
+        if self._handler is None:
+            return
+        try:
+            self._handler(room, frame, sender)
+        except Exception:
+            # ein kaputter Frame darf den Empfang nicht beenden
+            self.dropped += 1
+            logger.exception("Backplane-Frame für Room %r nicht zugestellt", room)
+
+
+class InProcessBackplane(Backplane):
+    """Verbindet mehrere Backplanes im selben Prozess über einen Bus."""
+
+    def __init__(self, bus: Optional[List["InProcessBackplane"]] = None) -> None:
+        super().__init__()
+        self._bus = bus if bus is not None else _default_bus
+
+    async def start(self) -> None:
+        self._bus.append(self)
+
+    async def stop(self) -> None:
+        if self in self._bus:
+            self._bus.remove(self)
+
+    def publish(self, room: str, frame: str, sender: Optional[str] = None) -> None:
+        for peer in tuple(self._bus):
+            if peer is not self:
+                peer._deliver(room, frame, sender)
+
+
+_default_bus: List[InProcessBackplane] = []
+
+
+def _pack(room: str, frame: str, sender: Optional[str]) -> bytes:
+    room_b = room.encode()
+    sender_b = sender.encode() if sender else b""
+    frame_b = frame.encode()
+    header = _HEADER.pack(len(room_b), len(sender_b), len(frame_b))
+    return header + room_b + sender_b + frame_b
+
+
+class UnixSocketBackplane(Backplane):
+    """Lokaler Broker über ein Unix-Socket (ein Host, mehrere Worker)."""
+
+    def __init__(self, path: str, reconnect_delay: float = 0.5) -> None:
+        super().__init__()
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self.is_broker = False
+        self._lock_fd: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        # Broker: verbundene Worker
+        self._peers: Set[asyncio.StreamWriter] = set()
+        # Client: Verbindung zum Broker
+        self._upstream: Optional[asyncio.StreamWriter] = None
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+        # Kurz auf Broker/Verbindung warten, damit frühe Broadcasts ankommen
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=2.0)
+        except asyncio.TimeoutError:
+            pass
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+        for writer in (*self._peers, self._upstream):
+            if writer is not None:
+                writer.close()
+        self._peers.clear()
+        self._upstream = None
+        if self._server is not None:
+            self._server.close()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def publish(self, room: str, frame: str, sender: Optional[str] = None) -> None:
+        packet = _pack(room, frame, sender)
+        if self.is_broker:
+            for writer in tuple(self._peers):
+                self._write(writer, packet)
+        elif self._upstream is not None:
+            self._write(self._upstream, packet)
+        else:
+            self.dropped += 1
+
+    def _write(self, writer: asyncio.StreamWriter, packet: bytes) -> None:
+        if writer.transport.get_write_buffer_size() > MAX_PEER_BUFFER:
+            self.dropped += 1
+            return
+        writer.write(packet)
+
+    # -- Broker-Wahl und Verbindungen --------------------------------------
+
+    def _try_lock(self) -> bool:
+        """Lock-Datei exklusiv sperren; wer sie hält, ist Broker.
+
+        Das Lock hängt am Prozess und wird beim Absturz vom Kernel freigegeben.
+        """
+        fd = os.open(self.path + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if await self._session():
+                    return
+            except Exception:
+                logger.exception("Backplane-Verbindung abgebrochen")
+            # Broker weg (oder Fehler) → neu wählen bzw. neu verbinden
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def _session(self) -> bool:
+        """Broker werden oder bis zum Verbindungsende vom Broker lesen.
+
+        ``True`` = dieser Worker ist jetzt Broker (der Server läuft weiter).
+        """
+        if self._try_lock():
+            try:
+                # Verwaistes Socket eines abgestürzten Brokers entfernen
+                try:
+                    os.unlink(self.path)
+                except FileNotFoundError:
+                    pass
+                self._server = await asyncio.start_unix_server(
+                    self._serve_peer, path=self.path
+                )
+            except BaseException:
+                # Lock wieder freigeben, sonst sperrt es den nächsten Versuch
+                os.close(self._lock_fd)  # type: ignore[arg-type]
+                self._lock_fd = None
+                raise
+            self.is_broker = True
+            self._ready.set()
+            return True
+
+        try:
+            reader, writer = await asyncio.open_unix_connection(self.path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return False
+
+        self._upstream = writer
+        self._ready.set()
+        try:
+            await self._read_packets(reader, origin=None)
+        finally:
+            self._upstream = None
+            writer.close()
+        return False
+
+    async def _serve_peer(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._peers.add(writer)
+        try:
+            await self._read_packets(reader, origin=writer)
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+    async def _read_packets(
+        self,
+        reader: asyncio.StreamReader,
+        origin: Optional[asyncio.StreamWriter],
+    ) -> None:
+        try:
+            while True:
+                header = await reader.readexactly(_HEADER.size)
+                room_len, sender_len, frame_len = _HEADER.unpack(header)
+                body = await reader.readexactly(room_len + sender_len + frame_len)
+
+                if origin is not None:
+                    # Broker: an alle anderen Worker weiterreichen
+                    packet = header + body
+                    for writer in tuple(self._peers):
+                        if writer is not origin:
+                            self._write(writer, packet)
+
+                try:
+                    room = body[:room_len].decode()
+                    sender = body[room_len:room_len + sender_len].decode() or None
+                    frame = body[room_len + sender_len:].decode()
+                except UnicodeDecodeError:
+                    self.dropped += 1
+                    logger.warning("Backplane-Paket mit ungültigem UTF-8 verworfen")
+                    continue
+                self._deliver(room, frame, sender)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+
+
+def create_backplane(kind: str, path: str) -> Backplane:
+    if kind == "local":
+        return Backplane()
+    if kind == "memory":
+        return InProcessBackplane()
+    if kind == "unix":
+        return UnixSocketBackplane(path)
+    raise ValueError(f"Unbekanntes Backplane {kind!r} (local, memory, unix)")
@@ -0,0 +1,136 @@
+"""Benchmark: Batching gegen den ungebatchten Versand.
+
+Startet die App lokal (uvicorn, in-process), verbindet ``--clients`` Clients
+pro Szenario mit einem eigenen Room und lässt einen davon ``--messages``
+Chat-Nachrichten senden (so schnell wie möglich oder mit ``--rate``). Gemessen werden Frames und
+Nachrichten pro Empfänger sowie die Dauer, bis alles angekommen ist.
+
+    python bench/batching.py --clients 50 --messages 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Room → Room-Config (siehe WS_ROOM_CONFIG)
+SCENARIOS = {
+    "bench-unbatched": {},
+    "bench-batch5": {"batch_ms": 5},
+    "bench-batch16": {"batch_ms": 16},
+}
+
+
+async def receive_all(ws, expected: int, idle_timeout: float):
+    frames = messages = 0
+    last = time.perf_counter()
+    while messages < expected:
+        try:
+            raw = await asyncio.wait_for(ws.recv(), idle_timeout)
+        except asyncio.TimeoutError:
+            break
+        last = time.perf_counter()
+        frames += 1
+        data = json.loads(raw)
+        messages += len(data) if isinstance(data, list) else 1
+    return frames, messages, last
+
+
+async def run_scenario(
+    port: int, room: str, clients: int, messages: int, rate: float
+):
+    import websockets
+
+    url = f"ws://127.0.0.1:{port}/ws/{room}/"
+    conns = [await websockets.connect(url + f"u{i}") for i in range(clients)]
+    try:
+        started = time.perf_counter()
+        receivers = [
+            asyncio.create_task(receive_all(ws, messages, idle_timeout=2.0))
+            for ws in conns
+        ]
+        sender = conns[0]
+        for i in range(messages):
+            await sender.send(json.dumps({"type": "chat", "text": f"m{i}"}))
+            if rate:
+                await asyncio.sleep(1.0 / rate)
+        results = await asyncio.gather(*receivers)
+        # bis zur letzten empfangenen Nachricht (ohne Idle-Timeout)
+        elapsed = max(last for _, _, last in results) - started
+    finally:
+        for ws in conns:
+            await ws.close()
+
+    frames = [f for f, _, _ in results]
+    received = [m for _, m, _ in results]
+    return {
+        "room": room,
+        "clients": clients,
+        "messages": messages,
+        "frames_per_client": statistics.mean(frames),
+        "messages_per_frame": sum(received) / max(sum(frames), 1),
+        "lost": clients * messages - sum(received),
+        "elapsed_s": round(elapsed, 3),
+        "deliveries_per_s": round(sum(received) / elapsed),
+    }
+
+
+async def run(args) -> list:
+    import uvicorn
+
+    config = uvicorn.Config("main:app", port=args.port, log_level="warning")
+    server = uvicorn.Server(config)
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    results = []
+    try:
+        for room in SCENARIOS:
+            results.append(
+                await run_scenario(
+                    args.port, room, args.clients, args.messages, args.rate
+                )
+            )
+    finally:
+        server.should_exit = True
+        await serving
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument(
+        "--rate", type=float, default=0, help="Nachrichten/s des Senders (0 = max)"
+    )
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--json", action="store_true", help="Ergebnis als JSON")
+    args = parser.parse_args()
+
+    # Szenarien als Room-Overrides, bevor die App importiert wird
+    os.environ["WS_ROOM_CONFIG"] = json.dumps(SCENARIOS)
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'room':<18}{'frames/client':>14}{'msgs/frame':>12}"
+          f"{'lost':>8}{'time s':>9}{'deliv/s':>10}")
+    for r in results:
+        print(f"{r['room']:<18}{r['frames_per_client']:>14.0f}"
+              f"{r['messages_per_frame']:>12.1f}{r['lost']:>8}"
+              f"{r['elapsed_s']:>9.2f}{r['deliveries_per_s']:>10}")
+
+
+if __name__ == "__main__":
+    main()
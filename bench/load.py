@@ -0,0 +1,346 @@
+"""Lastgenerator: Durchsatz und Broadcast-Latenz bei wachsenden Rooms.
+
+Startet die App lokal (uvicorn, in-process) oder nutzt mit ``--url`` einen
+laufenden Server. Pro Szenario verteilt er ``--clients`` simulierte Clients
+auf ``--rooms`` Rooms. Ein Teil davon (``--three``) sind Three.js-Clients,
+die ``object_move`` senden; die übrigen senden Chat-Nachrichten. Jeder
+Client sendet ``--rate`` Nachrichten/s für ``--duration`` Sekunden und
+empfängt alles aus seinem Room.
+
+Gemessen wird die Latenz vom Senden bis zum Empfang bei jedem Mitglied
+(End-to-End, inkl. Broadcast) als p50/p95/p99, dazu der Durchsatz. Mit
+``--baseline`` wird gegen ein früheres ``--json``-Ergebnis verglichen; der
+Exit-Code ist 1 bei einer Regression.
+
+    python bench/load.py --clients 100 --rooms 4 --rate 10
+    python bench/load.py --json > before.json
+    python bench/load.py --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Szenario → Room-Config (siehe WS_ROOM_CONFIG) und Wire-Format der Clients.
+# Neue Broadcast-Modi hier eintragen, dann laufen sie mit denselben Lasten.
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "direct": {"room": {}},
+    "batch5": {"room": {"batch_ms": 5}},
+    "tick30": {"room": {"tick_hz": 30}},
+    "f32": {"room": {}, "wire": "transform.f32.v2"},
+}
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    k = min(len(values) - 1, max(0, round(p / 100.0 * (len(values) - 1))))
+    return values[k]
+
+
+class Probe:
+    """Sendezeitpunkte und gemessene Latenzen eines Szenarios."""
+
+    def __init__(self) -> None:
+        # (Room, Objekt-ID, Sequenz) → Sendezeit für object_move
+        self.moves: Dict[tuple, float] = {}
+        self.latencies: List[float] = []
+        self.sent = 0
+        self.received = 0
+        self.expected = 0
+        self.last = 0.0
+
+    def record(self, sent_at: float) -> None:
+        now = time.perf_counter()
+        self.latencies.append(now - sent_at)
+        self.received += 1
+        self.last = now
+
+
+class Client:
+    def __init__(self, probe: Probe, room: str, name: str, three: bool, wire_format):
+        self.probe = probe
+        self.room = room
+        self.name = name
+        self.three = three
+        self.wire_format = wire_format
+        self.obj_id = f"obj-{name}"
+        # Objekt-Index des Rooms (nur Binär-Clients)
+        self.index = None
+        self.ws = None
+
+    async def connect(self, base: str) -> None:
+        import websockets
+
+        import wire
+
+        protocols = [self.wire_format] if self.wire_format else None
+        self.ws = await websockets.connect(
+            f"{base}/ws/{self.room}/{self.name}", subprotocols=protocols,
+            max_queue=None,
+        )
+        if self.wire_format:
+            self.index = wire.ObjectIndex()
+
+    def _on_message(self, msg: Dict[str, Any]) -> None:
+        kind = msg.get("type")
+        probe = self.probe
+        if kind == "chat":
+            text = msg.get("text", "")
+            if text.startswith("t="):
+                probe.record(float(text[2:]))
+        elif kind == "object_move":
+            seq = int(msg.get("position", {}).get("x", -1))
+            sent_at = probe.moves.get((self.room, msg.get("id"), seq))
+            if sent_at is not None:
+                probe.record(sent_at)
+        elif kind == "object_ids" and self.index is not None:
+            for obj_id, idx in msg["ids"].items():
+                names = self.index.names
+                names.extend([""] * (idx + 1 - len(names)))
+                names[idx] = obj_id
+
+    def _on_binary(self, payload: bytes) -> None:
+        import wire
+        from connection import BATCH_KIND
+
+        if payload[:1] == bytes((BATCH_KIND,)):
+            pos = 1
+            while pos < len(payload):
+                size = int.from_bytes(payload[pos:pos + 2], "little")
+                self._on_binary(payload[pos + 2:pos + 2 + size])
+                pos += 2 + size
+            return
+        msg = wire.decode_move(payload, self.index)
+        if msg is not None:
+            self._on_message(msg)
+
+    async def receive(self, idle_timeout: float, done: asyncio.Event) -> None:
+        while True:
+            try:
+                raw = await asyncio.wait_for(self.ws.recv(), idle_timeout)
+            except asyncio.TimeoutError:
+                if done.is_set():
+                    return
+                continue
+            except Exception:
+                # Verbindung zu
+                return
+            if isinstance(raw, bytes):
+                self._on_binary(raw)
+                continue
+            data = json.loads(raw)
+            for msg in data if isinstance(data, list) else (data,):
+                self._on_message(msg)
+
+    async def send_loop(self, rate: float, duration: float, room_size: int) -> None:
+        probe = self.probe
+        interval = 1.0 / rate
+        # Phasen verteilen, damit nicht alle im selben Moment senden
+        await asyncio.sleep(random.random() * interval)
+        start = time.perf_counter()
+        seq = 0
+        while True:
+            due = start + seq * interval
+            if due - start >= duration:
+                return
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            now = time.perf_counter()
+            if self.three:
+                probe.moves[(self.room, self.obj_id, seq)] = now
+                msg = {
+                    "type": "object_move",
+                    "id": self.obj_id,
+                    "position": {"x": seq, "y": 0.0, "z": 0.0},
+                    "rotation": {"x": 0.0, "y": random.random(), "z": 0.0},
+                }
+            else:
+                msg = {"type": "chat", "text": f"t={now:.9f}"}
+            await self.ws.send(json.dumps(msg))
+            probe.sent += 1
+            probe.expected += room_size
+            seq += 1
+
+
+async def run_scenario(base: str, name: str, args) -> Dict[str, Any]:
+    spec = SCENARIOS[name]
+    probe = Probe()
+    clients = []
+    for i in range(args.clients):
+        room = f"{name}-{i % args.rooms}"
+        three = i < args.clients * args.three
+        clients.append(Client(probe, room, f"u{i}", three, spec.get("wire")))
+    for client in clients:
+        await client.connect(base)
+    room_sizes: Dict[str, int] = {}
+    for client in clients:
+        room_sizes[client.room] = room_sizes.get(client.room, 0) + 1
+
+    done = asyncio.Event()
+    receivers = [
+        asyncio.create_task(client.receive(args.idle, done)) for client in clients
+    ]
+    # Erst verbinden lassen (Snapshots, Flow-Hinweise), dann messen
+    await asyncio.sleep(0.2)
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(c.send_loop(args.rate, args.duration, room_sizes[c.room]) for c in clients)
+    )
+    # Warten, bis nichts mehr ankommt
+    while time.perf_counter() - max(probe.last, started) < args.idle:
+        await asyncio.sleep(args.idle / 4)
+    done.set()
+    for client in clients:
+        await client.ws.close()
+    await asyncio.gather(*receivers, return_exceptions=True)
+
+    elapsed = max(probe.last, started + 1e-9) - started
+    latencies = sorted(probe.latencies)
+    ms = 1000.0
+    return {
+        "scenario": name,
+        "clients": args.clients,
+        "rooms": args.rooms,
+        "rate": args.rate,
+        "sent": probe.sent,
+        "delivered": probe.received,
+        "expected": probe.expected,
+        "lost_pct": round(100.0 * (1 - probe.received / max(probe.expected, 1)), 2),
+        "deliveries_per_s": round(probe.received / elapsed),
+        "p50_ms": round(percentile(latencies, 50) * ms, 3),
+        "p95_ms": round(percentile(latencies, 95) * ms, 3),
+        "p99_ms": round(percentile(latencies, 99) * ms, 3),
+        "max_ms": round((latencies[-1] if latencies else 0.0) * ms, 3),
+    }
+
+
+async def run(args) -> List[Dict[str, Any]]:
+    server = serving = None
+    base = args.url
+    if base is None:
+        import uvicorn
+
+        config = uvicorn.Config("main:app", port=args.port, log_level="warning")
+        server = uvicorn.Server(config)
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        base = f"ws://127.0.0.1:{args.port}"
+
+    results = []
+    try:
+        for name in args.scenarios:
+            results.append(await run_scenario(base, name, args))
+    finally:
+        if server is not None:
+            server.should_exit = True
+            await serving
+    return results
+
+
+def compare(results, baseline, tolerance: float) -> List[str]:
+    """Regressionen gegenüber ``baseline`` (gleiche Szenarien) finden."""
+    before = {r["scenario"]: r for r in baseline}
+    problems = []
+    for r in results:
+        old = before.get(r["scenario"])
+        if old is None:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if old[key] and r[key] > old[key] * (1 + tolerance):
+                problems.append(f"{r['scenario']}: {key} {old[key]} → {r[key]}")
+        if r["deliveries_per_s"] < old["deliveries_per_s"] * (1 - tolerance):
+            problems.append(
+                f"{r['scenario']}: deliveries_per_s "
+                f"{old['deliveries_per_s']} → {r['deliveries_per_s']}"
+            )
+    return problems
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    print(f"{'scenario':<10}{'sent':>8}{'deliv':>9}{'lost %':>8}{'deliv/s':>10}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for r in results:
+        print(f"{r['scenario']:<10}{r['sent']:>8}{r['delivered']:>9}"
+              f"{r['lost_pct']:>8.2f}{r['deliveries_per_s']:>10}"
+              f"{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+              f"{r['max_ms']:>9.2f}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=40, help="Clients pro Szenario")
+    parser.add_argument("--rooms", type=int, default=4)
+    parser.add_argument(
+        "--three", type=float, default=0.5, help="Anteil Three.js-Clients (0–1)"
+    )
+    parser.add_argument("--rate", type=float, default=5, help="Nachrichten/s pro Client")
+    parser.add_argument("--duration", type=float, default=5, help="Sendedauer in s")
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"Kommagetrennt aus: {', '.join(SCENARIOS)}",
+    )
+    parser.add_argument(
+        "--url", help="Laufenden Server nutzen (z.B. ws://host:8000), sonst lokal"
+    )
+    parser.add_argument("--port", type=int, default=8798)
+    parser.add_argument("--idle", type=float, default=1.0, help="Nachlaufzeit in s")
+    parser.add_argument(
+        "--keep-rate-limits",
+        action="store_true",
+        help="Rate-Limits und Degraded-Modus des Servers nicht abschalten (nur lokal)",
+    )
+    parser.add_argument("--json", action="store_true", help="Ergebnis als JSON")
+    parser.add_argument("--baseline", help="Früheres --json-Ergebnis zum Vergleich")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="Erlaubte Verschlechterung (0.2 = 20 %%)"
+    )
+    args = parser.parse_args(argv)
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unbekannte Szenarien: {unknown}")
+    if args.rooms < 1 or args.clients < 1 or args.rate <= 0:
+        parser.error("--clients, --rooms und --rate müssen positiv sein")
+
+    # Szenarien als Room-Overrides, bevor die App importiert wird
+    os.environ["WS_ROOM_CONFIG"] = json.dumps(
+        {
+            f"{name}-{m}": spec["room"]
+            for name, spec in SCENARIOS.items()
+            for m in range(args.rooms)
+        }
+    )
+    if not args.keep_rate_limits:
+        os.environ["WS_RATE_MSGS"] = "0"
+        os.environ["WS_OVERLOAD_LOOP_LAG_MS"] = "0"
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,457 @@
+"""Soak-Test: wie viele (meist stille) Verbindungen hält ein Prozess, und was kostet jede?
+
+Startet die App als eigenen Prozess (uvicorn mit ``WS_DEBUG_MEMORY=1``) oder
+nutzt mit ``--url`` einen laufenden Server mit freigeschaltetem
+``/debug/memory``. Die Verbindungen werden in Stufen von ``--step`` bis
+``--target`` aufgebaut, je ``--room-size`` pro Room. Ein Anteil ``--active``
+sendet Chat-Nachrichten (je ``--rate``/s), der Rest ist still und beantwortet
+nur Heartbeat-Pings.
+
+Nach jeder Stufe wird ``--hold`` Sekunden gehalten und dabei der Loop-Lag des
+Servers gemessen; danach RSS, tracemalloc-Speicher und die größten Zuwächse
+seit dem Start (pro Datei und Zeile). Daraus ergeben sich Bytes pro
+Verbindung, insgesamt und für den Zuwachs der Stufe. Mit ``--baseline`` wird
+gegen ein früheres ``--json``-Ergebnis verglichen; der Exit-Code ist 1 bei
+einer Regression.
+
+Die Clients sind schlank (ein ``asyncio.Protocol`` ohne Task pro
+Verbindung), damit auch 50k Sockets auf der Client-Seite passen. Über
+``PER_SOURCE`` Verbindungen hinaus verteilen sie sich auf mehrere
+Quelladressen (127.0.0.x), sonst gehen die lokalen Ports aus.
+
+    python bench/soak.py --target 10000 --step 2000
+    python bench/soak.py --target 50000 --step 5000 --json > before.json
+    python bench/soak.py --target 50000 --step 5000 --baseline before.json
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# So viele Verbindungen pro Quelladresse (lokaler Port-Bereich meist ~28k)
+PER_SOURCE = 25000
+
+PING = b'"type":"ping"'
+PONG = b'{"type":"pong"}'
+CHAT = b'{"type":"chat","text":"soak"}'
+
+
+def ws_frame(opcode: int, payload: bytes) -> bytes:
+    """Client-Frame, maskiert wie von RFC 6455 verlangt."""
+    mask = os.urandom(4)
+    size = len(payload)
+    if size < 126:
+        header = bytes((0x80 | opcode, 0x80 | size))
+    elif size < 1 << 16:
+        header = bytes((0x80 | opcode, 0x80 | 126)) + size.to_bytes(2, "big")
+    else:
+        header = bytes((0x80 | opcode, 0x80 | 127)) + size.to_bytes(8, "big")
+    return header + mask + bytes(b ^ mask[i & 3] for i, b in enumerate(payload))
+
+
+class SoakClient(asyncio.Protocol):
+    """Minimaler WebSocket-Client: Handshake, Pings beantworten, Rest verwerfen."""
+
+    def __init__(self, request: bytes, opened: asyncio.Future) -> None:
+        self.request = request
+        self.opened = opened
+        self.transport: Optional[asyncio.Transport] = None
+        self.closed = False
+        self._upgraded = False
+        self._buffer = bytearray()
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+        transport.write(self.request)
+
+    def connection_lost(self, exc) -> None:
+        self.closed = True
+        if not self.opened.done():
+            self.opened.set_exception(ConnectionError("vor dem Handshake getrennt"))
+
+    def data_received(self, data: bytes) -> None:
+        buffer = self._buffer
+        buffer += data
+        if not self._upgraded:
+            end = buffer.find(b"\r\n\r\n")
+            if end < 0:
+                return
+            if not buffer.startswith(b"HTTP/1.1 101"):
+                if not self.opened.done():
+                    status = bytes(buffer[: buffer.find(b"\r\n")]).decode(errors="replace")
+                    self.opened.set_exception(ConnectionError(status))
+                self.transport.close()
+                return
+            del buffer[: end + 4]
+            self._upgraded = True
+            if not self.opened.done():
+                self.opened.set_result(None)
+        self._parse()
+
+    def _parse(self) -> None:
+        # Server-Frames sind unmaskiert
+        buffer = self._buffer
+        while len(buffer) >= 2:
+            opcode = buffer[0] & 0x0F
+            size = buffer[1] & 0x7F
+            start = 2
+            if size == 126:
+                if len(buffer) < 4:
+                    return
+                size = int.from_bytes(buffer[2:4], "big")
+                start = 4
+            elif size == 127:
+                if len(buffer) < 10:
+                    return
+                size = int.from_bytes(buffer[2:10], "big")
+                start = 10
+            end = start + size
+            if len(buffer) < end:
+                return
+            if opcode == 0x1 and PING in buffer[start:end]:
+                self.send(PONG)
+            elif opcode == 0x9:
+                self.transport.write(ws_frame(0xA, bytes(buffer[start:end])))
+            elif opcode == 0x8:
+                self.transport.close()
+            del buffer[:end]
+
+    def send(self, payload: bytes) -> None:
+        if not self.closed:
+            self.transport.write(ws_frame(0x1, payload))
+
+    def close(self) -> None:
+        if not self.closed:
+            self.transport.write(ws_frame(0x8, (1000).to_bytes(2, "big")))
+            self.transport.close()
+
+
+class Soak:
+    def __init__(self, args, host: str, port: int, http: str) -> None:
+        self.args = args
+        self.host = host
+        self.port = port
+        self.http = http
+        self.clients: List[SoakClient] = []
+        self.failed = 0
+        self.errors: Dict[str, int] = {}
+
+    def _request(self, i: int) -> bytes:
+        args = self.args
+        path = f"/ws/soak-{i // args.room_size}/u{i}"
+        if args.topics:
+            path += f"?topics={args.topics}"
+        key = base64.b64encode(os.urandom(16)).decode()
+        return (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        ).encode()
+
+    def _source(self, i: int) -> Optional[tuple]:
+        if not self.host.startswith("127.") or self.args.target <= PER_SOURCE:
+            return None
+        return (f"127.0.0.{1 + i // PER_SOURCE}", 0)
+
+    async def _open(self, i: int, gate: asyncio.Semaphore) -> None:
+        loop = asyncio.get_running_loop()
+        async with gate:
+            opened = loop.create_future()
+            try:
+                _transport, client = await loop.create_connection(
+                    lambda: SoakClient(self._request(i), opened),
+                    self.host,
+                    self.port,
+                    local_addr=self._source(i),
+                )
+                await asyncio.wait_for(opened, self.args.connect_timeout)
+            except (OSError, asyncio.TimeoutError) as exc:
+                self.failed += 1
+                reason = type(exc).__name__ if not str(exc) else str(exc)[:60]
+                self.errors[reason] = self.errors.get(reason, 0) + 1
+                return
+            self.clients.append(client)
+
+    async def ramp(self, count: int) -> None:
+        gate = asyncio.Semaphore(self.args.concurrency)
+        first = len(self.clients) + self.failed
+        await asyncio.gather(*(self._open(first + n, gate) for n in range(count)))
+
+    async def chatter(self) -> None:
+        """Aktive Clients reihum: zusammen ``active × rate`` Nachrichten/s."""
+        args = self.args
+        while True:
+            active = self.clients[: int(len(self.clients) * args.active)]
+            if not active or args.rate <= 0:
+                await asyncio.sleep(0.5)
+                continue
+            interval = 1.0 / (len(active) * args.rate)
+            for client in active:
+                client.send(CHAT)
+                await asyncio.sleep(interval)
+
+    def open_count(self) -> int:
+        return sum(1 for client in self.clients if not client.closed)
+
+    async def sample(self, top: int, reset: bool = False) -> Dict[str, Any]:
+        url = f"{self.http}/debug/memory?top={top}&reset={str(reset).lower()}"
+        return await asyncio.to_thread(fetch, url)
+
+
+def fetch(url: str) -> Dict[str, Any]:
+    with urllib.request.urlopen(url, timeout=300) as response:
+        return json.load(response)
+
+
+def raise_fd_limit(needed: int) -> int:
+    """Soft-Limit für Dateideskriptoren anheben (gilt auch für den Server-Prozess)."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    want = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+    if soft != resource.RLIM_INFINITY and soft < want:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (want, hard))
+        soft = want
+    return soft
+
+
+def start_server(args) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        WS_DEBUG_MEMORY="1",
+        WS_TRACEMALLOC_FRAMES=str(args.tracemalloc),
+        # Kapazität messen, nicht den Überlastschutz
+        WS_OVERLOAD_LOOP_LAG_MS="0",
+    )
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1",
+            "--port", str(args.port),
+            "--log-level", "warning",
+            "--backlog", str(max(args.concurrency * 4, 2048)),
+        ],
+        cwd=ROOT,
+        env=env,
+    )
+
+
+async def wait_ready(http: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await asyncio.to_thread(fetch, f"{http}/debug/memory?top=0")
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise SystemExit(f"{http}/debug/memory nicht erreichbar (WS_DEBUG_MEMORY=1?)")
+            await asyncio.sleep(0.2)
+
+
+def per_conn(value: float, conns: int) -> int:
+    return round(value / conns) if conns > 0 else 0
+
+
+async def run(args) -> Dict[str, Any]:
+    proc = None
+    if args.url is None:
+        http = f"http://127.0.0.1:{args.port}"
+        proc = start_server(args)
+    else:
+        http = args.url.rstrip("/")
+    parts = urlsplit(http)
+    soak = Soak(args, parts.hostname, parts.port or 80, http)
+    chatter = None
+    try:
+        await wait_ready(http)
+        base = await soak.sample(args.top, reset=True)
+        rss0 = base["rss_bytes"]
+        traced0 = base.get("traced_bytes", 0)
+        chatter = asyncio.create_task(soak.chatter())
+        steps: List[Dict[str, Any]] = []
+        prev_conns, prev_rss = 0, rss0
+        report: Dict[str, Any] = base
+        while len(soak.clients) + soak.failed < args.target:
+            count = min(args.step, args.target - len(soak.clients) - soak.failed)
+            started = time.perf_counter()
+            await soak.ramp(count)
+            ramp_s = time.perf_counter() - started
+
+            # Halten: Loop-Lag unter der Grundlast der aktiven Clients
+            means: List[float] = []
+            worst = 0.0
+            deadline = time.perf_counter() + args.hold
+            while time.perf_counter() < deadline:
+                lag = (await soak.sample(0))["loop_lag"]
+                means.append(lag["mean_ms"])
+                worst = max(worst, lag["max_ms"])
+                await asyncio.sleep(0.5)
+            means.sort()
+
+            report = await soak.sample(args.top)
+            conns = report["connections"]
+            rss = report["rss_bytes"]
+            traced = report.get("traced_bytes")
+            steps.append(
+                {
+                    "clients": len(soak.clients) + soak.failed,
+                    "open": soak.open_count(),
+                    "failed": soak.failed,
+                    "connections": conns,
+                    "active": int(len(soak.clients) * args.active),
+                    "rss_mb": round(rss / 2**20, 1),
+                    "bytes_per_conn": per_conn(rss - rss0, conns),
+                    "step_bytes_per_conn": per_conn(rss - prev_rss, conns - prev_conns),
+                    "traced_per_conn": (
+                        per_conn(traced - traced0, conns) if traced is not None else None
+                    ),
+                    "tasks": report["tasks"],
+                    "lag_p50_ms": means[len(means) // 2] if means else 0.0,
+                    "lag_max_ms": round(worst, 3),
+                    "connect_per_s": round(count / ramp_s) if ramp_s > 0 else 0,
+                }
+            )
+            prev_conns, prev_rss = conns, rss
+            if not args.json:
+                print_step(steps[-1], header=len(steps) == 1)
+        return {
+            "target": args.target,
+            "room_size": args.room_size,
+            "active": args.active,
+            "rate": args.rate,
+            "tracemalloc": args.tracemalloc,
+            "baseline_rss_mb": round(rss0 / 2**20, 1),
+            "steps": steps,
+            "errors": soak.errors,
+            "top_files": report.get("top_files", []),
+            "top_lines": report.get("top_lines", []),
+        }
+    finally:
+        if chatter is not None:
+            chatter.cancel()
+        for client in soak.clients:
+            client.close()
+        if proc is not None:
+            proc.terminate()
+            try:
+                await asyncio.to_thread(proc.wait, 30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def print_step(step: Dict[str, Any], header: bool) -> None:
+    if header:
+        print(f"{'clients':>8}{'open':>8}{'fail':>6}{'rss MB':>9}{'B/conn':>9}"
+              f"{'step B/c':>10}{'traced B/c':>12}{'tasks':>8}{'lag p50':>9}"
+              f"{'lag max':>9}{'conn/s':>8}")
+    traced = step["traced_per_conn"]
+    print(f"{step['clients']:>8}{step['open']:>8}{step['failed']:>6}"
+          f"{step['rss_mb']:>9.1f}{step['bytes_per_conn']:>9}"
+          f"{step['step_bytes_per_conn']:>10}{'-' if traced is None else traced:>12}"
+          f"{step['tasks']:>8}{step['lag_p50_ms']:>9.2f}{step['lag_max_ms']:>9.2f}"
+          f"{step['connect_per_s']:>8}", flush=True)
+
+
+def print_top(result: Dict[str, Any]) -> None:
+    steps = result["steps"]
+    conns = steps[-1]["connections"] if steps else 0
+    for key, title in (("top_files", "Datei"), ("top_lines", "Zeile")):
+        if not result[key]:
+            continue
+        print(f"\nGrößte Zuwächse seit dem Start (pro {title}, letzte Stufe):")
+        for entry in result[key]:
+            print(f"{entry['size_diff'] / 2**20:>10.1f} MB{per_conn(entry['size_diff'], conns):>8} B/conn"
+                  f"  {entry['where']}")
+    if result["errors"]:
+        print("\nFehlgeschlagene Verbindungen:", result["errors"])
+
+
+def compare(result, baseline, tolerance: float) -> List[str]:
+    """Regressionen gegenüber ``baseline`` (gleiche Stufen) finden."""
+    before = {s["clients"]: s for s in baseline["steps"]}
+    problems = []
+    for step in result["steps"]:
+        old = before.get(step["clients"])
+        if old is None:
+            continue
+        for key in ("bytes_per_conn", "traced_per_conn"):
+            if old.get(key) and step[key] and step[key] > old[key] * (1 + tolerance):
+                problems.append(f"{step['clients']} Verbindungen: {key} {old[key]} → {step[key]}")
+    return problems
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", type=int, default=10000, help="Verbindungen am Ende")
+    parser.add_argument("--step", type=int, default=2000, help="Neue Verbindungen pro Stufe")
+    parser.add_argument("--room-size", type=int, default=50, help="Verbindungen pro Room")
+    parser.add_argument(
+        "--active", type=float, default=0.01, help="Anteil sendender Clients (0–1)"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0.2, help="Nachrichten/s pro aktivem Client"
+    )
+    parser.add_argument(
+        "--topics", help="Abo der Clients, z.B. chat,presence (Standard: alles)"
+    )
+    parser.add_argument("--hold", type=float, default=5, help="Haltezeit pro Stufe in s")
+    parser.add_argument(
+        "--concurrency", type=int, default=200, help="Gleichzeitige Verbindungsaufbauten"
+    )
+    parser.add_argument("--connect-timeout", type=float, default=30)
+    parser.add_argument(
+        "--tracemalloc",
+        type=int,
+        default=1,
+        help="Frames pro Allokation im Server (0 = aus, RSS dann wie im Betrieb)",
+    )
+    parser.add_argument("--top", type=int, default=10, help="So viele Top-Allokationen")
+    parser.add_argument(
+        "--url", help="Laufenden Server nutzen (z.B. http://host:8000), sonst lokal"
+    )
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--json", action="store_true", help="Ergebnis als JSON")
+    parser.add_argument("--baseline", help="Früheres --json-Ergebnis zum Vergleich")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="Erlaubte Verschlechterung (0.2 = 20 %%)"
+    )
+    args = parser.parse_args(argv)
+    if args.target < 1 or args.step < 1 or args.room_size < 1:
+        parser.error("--target, --step und --room-size müssen positiv sein")
+    if not 0 <= args.active <= 1:
+        parser.error("--active muss zwischen 0 und 1 liegen")
+
+    # Client und Server (erbt das Limit) brauchen je einen Deskriptor pro Socket
+    limit = raise_fd_limit(args.target + 1024)
+    if limit < args.target + 256:
+        print(f"Warnung: nur {limit} Dateideskriptoren erlaubt (ulimit -n)", file=sys.stderr)
+
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_top(result)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(result, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"Regression: {problem}", file=sys.stderr)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
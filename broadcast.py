@@ -0,0 +1,130 @@
+"""Broadcast mit einmaliger Serialisierung.
+
+Jede Nachricht wird genau einmal zu einem Text-Frame kodiert; alle Empfänger
+bekommen denselben vorkodierten Frame in ihre Send-Queue. Clients mit
+Binär-Subprotokoll bekommen eine Übersetzung, die ebenfalls nur einmal pro
+Format kodiert wird; Clients mit Kompression eine einmal komprimierte Fassung.
+"""
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import codec
+import compression
+import metrics
+from connection import Connection, Frame, LaneKey
+
+# wire → Frame im Format dieses Subprotokolls
+Translator = Callable[[str], Frame]
+
+
+class BroadcastStats:
+    """Zähler für Kodierungen und zugestellte Frames."""
+
+    __slots__ = ("broadcasts", "encodes", "frames", "unsubscribed", "echo_suppressed")
+
+    def __init__(self) -> None:
+        self.broadcasts = 0
+        # tatsächlich ausgeführte json.dumps-Aufrufe
+        self.encodes = 0
+        # eingereihte Frames (= Kodierungen ohne Encode-Once)
+        self.frames = 0
+        # nicht gesendet: Thema nicht abonniert bzw. eigene Nachricht ohne Echo
+        self.unsubscribed = 0
+        self.echo_suppressed = 0
+
+    @property
+    def saved_encodes(self) -> int:
+        return max(self.frames - self.encodes, 0)
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "broadcasts": self.broadcasts,
+            "encodes": self.encodes,
+            "frames": self.frames,
+            "saved_encodes": self.saved_encodes,
+            "unsubscribed": self.unsubscribed,
+            "echo_suppressed": self.echo_suppressed,
+        }
+
+
+stats = BroadcastStats()
+
+
+def encode(msg: Dict[str, Any]) -> str:
+    """Nachricht zu einem kompakten JSON-Text-Frame kodieren."""
+    stats.encodes += 1
+    start = perf_counter()
+    frame = codec.dumps(msg)
+    metrics.encode_seconds.observe(perf_counter() - start)
+    return frame
+
+
+def send(conn: Connection, msg: Dict[str, Any]) -> bool:
+    """Einzelne Nachricht an genau einen Client einreihen."""
+    return send_frame(conn, encode(msg))
+
+
+def send_frame(
+    conn: Connection, frame: Frame, deflated: Optional[compression.Deflated] = None
+) -> bool:
+    """Bereits kodierten Frame an genau einen Client einreihen."""
+    stats.frames += 1
+    if deflated is not None and conn.deflate:
+        frame = _packed(frame, deflated)
+    return conn.enqueue(frame)
+
+
+def _packed(frame: Frame, deflated: compression.Deflated) -> Frame:
+    packed = deflated.get()
+    if packed is None:
+        return frame
+    compression.stats.sent += 1
+    compression.stats.egress_saved += deflated.saved
+    return packed
+
+
+def broadcast(conns: Iterable[Connection], msg: Dict[str, Any]) -> int:
+    """Nachricht einmal kodieren und an alle ``conns`` einreihen.
+
+    Gibt die Anzahl der Empfänger zurück, bei denen der Frame eingereiht wurde.
+    """
+    return broadcast_frame(conns, encode(msg))
+
+
+def broadcast_frame(
+    conns: Iterable[Connection],
+    frame: str,
+    translate: Optional[Translator] = None,
+    deflated: Optional[compression.Deflated] = None,
+    key: Optional[LaneKey] = None,
+    sender: Optional[str] = None,
+) -> int:
+    """Bereits kodierten Frame an alle ``conns`` einreihen.
+
+    Mit ``translate`` bekommen Clients mit Binär-Subprotokoll stattdessen
+    ``translate(conn.wire)`` – einmal pro Format kodiert. Mit ``deflated``
+    bekommen Clients mit Kompression die komprimierte Fassung. Mit ``key``
+    (Objekt-ID(s)) geht der Frame in die verlustbehaftete Spur. Verbindungen
+    von ``sender`` ohne Echo werden übersprungen.
+    """
+    stats.broadcasts += 1
+    translated: Dict[str, Frame] = {}
+    delivered = 0
+    for conn in conns:
+        if sender is not None and not conn.echo and conn.username == sender:
+            stats.echo_suppressed += 1
+            continue
+        stats.frames += 1
+        wire = conn.wire
+        if wire is None or translate is None:
+            out: Frame = frame
+            if deflated is not None and conn.deflate:
+                out = _packed(frame, deflated)
+        else:
+            out = translated.get(wire)  # type: ignore[assignment]
+            if out is None:
+                stats.encodes += 1
+                out = translated[wire] = translate(wire)
+        if conn.enqueue(out, key):
+            delivered += 1
+    return delivered
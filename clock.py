@@ -0,0 +1,15 @@
+"""Server-Uhr für Zeitstempel in Broadcasts und den Uhrabgleich.
+
+Millisekunden seit der Unix-Epoche, aber aus der monotonen Uhr abgeleitet:
+Sprünge der Systemzeit (NTP, manuell) verschieben die Zeitstempel eines
+laufenden Servers nicht, und ein Aufruf kostet nur ein ``monotonic()``.
+"""
+import time
+
+# Abstand Wanduhr ↔ monotone Uhr, einmal beim Import bestimmt
+_BASE = time.time() - time.monotonic()
+
+
+def now_ms() -> int:
+    """Aktuelle Server-Zeit in Millisekunden."""
+    return int((time.monotonic() + _BASE) * 1000)
@@ -0,0 +1,394 @@
+"""Typisierte Client-Nachrichten: Größenlimit, Parsen und Validierung.
+
+Eingehende Text-Frames werden zuerst auf ihre Größe geprüft (vor dem
+Parsen), dann mit dem schnellsten verfügbaren JSON-Backend geparst
+(``orjson``, sonst ``json`` aus der Standardbibliothek) und pro Typ gegen
+vorab festgelegte Regeln validiert. Weitergeleitet wird nur, was die Regeln
+erlauben – verschachtelte Dicts von Clients gehen nie ungeprüft an den Room.
+"""
+import math
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, ClassVar, Dict, FrozenSet, List, Optional, Tuple, Union
+
+import settings
+
+try:
+    import orjson
+
+    def loads(raw: Union[str, bytes]) -> Any:
+        return orjson.loads(raw)
+
+    def dumps(msg: Any) -> str:
+        return orjson.dumps(msg).decode()
+
+    JSON_BACKEND = "orjson"
+
+except ImportError:  # pragma: no cover - abhängig von der Umgebung
+    import json
+
+    def loads(raw: Union[str, bytes]) -> Any:
+        return json.loads(raw)
+
+    def dumps(msg: Any) -> str:
+        return json.dumps(msg, separators=(",", ":"), ensure_ascii=False)
+
+    JSON_BACKEND = "json"
+
+
+Message = Dict[str, Any]
+
+# Close-Code für zu große Frames (RFC 6455: "Message Too Big")
+TOO_BIG_CLOSE_CODE = 1009
+
+_AXES = ("x", "y", "z")
+_TYPE_RE = re.compile(r"[a-z][a-z0-9_]{0,31}")
+
+# Typen, die nur der Server sendet – Clients dürfen sie nicht fälschen
+RESERVED_TYPES = {
+    "error",
+    "flow",
+    "object_enter",
+    "object_denied",
+    "object_ids",
+    "object_leave",
+    "ping",
+    "presence",
+    "rejected",
+    "roster",
+    "scene_snapshot",
+    "session",
+    "subscribed",
+    "time",
+}
+
+# Typen, die zusammen als ein Thema abonniert werden
+TOPIC_ALIASES = {"object_move_batch": "object_move", "roster": "presence"}
+
+# Höchstens so viele Themen pro Abo
+MAX_TOPICS = 32
+
+
+class CodecError(ValueError):
+    """Ungültige Client-Nachricht (wird verworfen)."""
+
+
+class FrameTooLarge(CodecError):
+    """Frame über ``settings.MAX_FRAME_BYTES`` (Verbindung wird geschlossen)."""
+
+
+# ------------------------------------------------------------
+# Nachrichtentypen
+# ------------------------------------------------------------
+
+@dataclass(slots=True)
+class Chat:
+    type: ClassVar[str] = "chat"
+    text: str
+
+    def to_message(self, user: str) -> Message:
+        return {"type": "chat", "user": user, "text": self.text}
+
+
+@dataclass(slots=True)
+class ObjectMove:
+    type: ClassVar[str] = "object_move"
+    id: str
+    position: Dict[str, float]
+    rotation: Dict[str, float]
+
+    def to_message(self, user: str) -> Message:
+        return {
+            "type": "object_move",
+            "user": user,
+            "id": self.id,
+            "position": self.position,
+            "rotation": self.rotation,
+        }
+
+
+@dataclass(slots=True)
+class ObjectMoveBatch:
+    """Transformationen vieler Objekte in einer Nachricht (IDs eindeutig)."""
+
+    type: ClassVar[str] = "object_move_batch"
+    moves: List[ObjectMove]
+
+    def to_message(self, user: str) -> Message:
+        return batch_message(
+            user,
+            [
+                {"id": m.id, "position": m.position, "rotation": m.rotation}
+                for m in self.moves
+            ],
+        )
+
+
+def batch_message(user: str, objects: List[Message]) -> Message:
+    """``object_move_batch`` aus Einträgen ``{"id", "position", "rotation"}``."""
+    return {"type": "object_move_batch", "user": user, "objects": objects}
+
+
+def full_transform(obj: Message) -> bool:
+    """Trägt der Eintrag alle Achsen von Position und Rotation?
+
+    Nur solche Updates dürfen ältere ersetzen; ein Teil-Update ergänzt den
+    Stand nur.
+    """
+    return len(obj["position"]) == len(_AXES) and len(obj["rotation"]) == len(_AXES)
+
+
+@dataclass(slots=True)
+class SceneRequest:
+    type: ClassVar[str] = "scene_request"
+
+
+@dataclass(slots=True)
+class Pong:
+    """Antwort auf einen Heartbeat-Ping."""
+
+    type: ClassVar[str] = "pong"
+
+
+@dataclass(slots=True)
+class TimeSync:
+    """Uhrabgleich: ``t0`` ist die Client-Zeit beim Senden (ms)."""
+
+    type: ClassVar[str] = "time_sync"
+    t0: float
+
+    def reply(self, server_ms: int) -> Message:
+        return {"type": "time", "t0": self.t0, "t1": server_ms}
+
+
+@dataclass(slots=True)
+class Interest:
+    """Interessensbereich: Kugel (``center``/``radius``), Box oder nichts."""
+
+    type: ClassVar[str] = "interest"
+    center: Optional[Tuple[float, float, float]] = None
+    radius: float = 0.0
+    box: Optional[Tuple[Tuple[float, float, float], Tuple[float, float, float]]] = None
+
+
+@dataclass(slots=True)
+class Subscribe:
+    """Abo ändern; fehlende Felder bleiben, wie sie sind."""
+
+    type: ClassVar[str] = "subscribe"
+    # nur mit ``has_topics``; ``None`` = alle Themen
+    topics: Optional[FrozenSet[str]] = None
+    has_topics: bool = False
+    echo: Optional[bool] = None
+
+
+@dataclass(slots=True)
+class Unknown:
+    """Anderer Typ: wird mit Text an den Room weitergegeben."""
+
+    type: str
+    text: str
+
+    def to_message(self, user: str) -> Message:
+        return {"type": self.type, "user": user, "text": self.text}
+
+
+ClientMessage = Union[
+    Chat,
+    ObjectMove,
+    ObjectMoveBatch,
+    SceneRequest,
+    Pong,
+    TimeSync,
+    Interest,
+    Subscribe,
+    Unknown,
+]
+
+
+def topic(msg_type: str) -> str:
+    """Thema, unter dem ein Nachrichtentyp abonniert wird."""
+    return TOPIC_ALIASES.get(msg_type, msg_type)
+
+
+def topics(names: Any) -> Optional[FrozenSet[str]]:
+    """Liste abonnierter Typen validieren; ``None`` bzw. ``"*"`` = alles."""
+    if names is None or names == "*":
+        return None
+    if not isinstance(names, list):
+        raise CodecError("topics muss eine Liste sein")
+    if "*" in names:
+        return None
+    if len(names) > MAX_TOPICS:
+        raise CodecError(f"höchstens {MAX_TOPICS} topics")
+    for name in names:
+        if not isinstance(name, str) or not _TYPE_RE.fullmatch(name):
+            raise CodecError("topic ungültig")
+    return frozenset(topic(name) for name in names)
+
+
+# ------------------------------------------------------------
+# Validierung
+# ------------------------------------------------------------
+
+def _text(data: Message) -> str:
+    text = data.get("text", "")
+    if not isinstance(text, str):
+        raise CodecError("text muss ein String sein")
+    if len(text) > settings.MAX_TEXT_LENGTH:
+        raise CodecError("text zu lang")
+    return text
+
+
+def _vec(data: Message, key: str) -> Dict[str, float]:
+    vec = data.get(key)
+    if vec is None:
+        return {}
+    if not isinstance(vec, dict):
+        raise CodecError(f"{key} muss ein Objekt sein")
+    out = {}
+    for axis, value in vec.items():
+        if axis not in _AXES:
+            raise CodecError(f"{key}.{axis} unbekannt")
+        # bool ist ein int – hier aber keine Koordinate
+        if type(value) not in (int, float) or not math.isfinite(value):
+            raise CodecError(f"{key}.{axis} muss eine endliche Zahl sein")
+        if abs(value) > settings.MAX_COORDINATE:
+            raise CodecError(f"{key}.{axis} außerhalb des Bereichs")
+        out[axis] = value
+    return out
+
+
+def _point(data: Message, key: str) -> Tuple[float, float, float]:
+    vec = _vec(data, key)
+    if len(vec) != 3:
+        raise CodecError(f"{key} braucht x, y und z")
+    return (vec["x"], vec["y"], vec["z"])
+
+
+def _decode_chat(data: Message) -> Chat:
+    return Chat(_text(data))
+
+
+def _object_id(obj_id: Any) -> str:
+    if not isinstance(obj_id, str) or not obj_id:
+        raise CodecError("id ungültig")
+    if len(obj_id) > settings.MAX_ID_LENGTH:
+        raise CodecError("id zu lang")
+    return obj_id
+
+
+def _decode_object_move(data: Message) -> ObjectMove:
+    obj_id = _object_id(data.get("id", "cube-1"))
+    return ObjectMove(obj_id, _vec(data, "position"), _vec(data, "rotation"))
+
+
+def _decode_object_move_batch(data: Message) -> ObjectMoveBatch:
+    objects = data.get("objects")
+    if not isinstance(objects, list) or not objects:
+        raise CodecError("objects muss eine nicht-leere Liste sein")
+    if len(objects) > settings.MOVE_BATCH_MAX:
+        raise CodecError("zu viele objects")
+    # Mehrfach genannte IDs zusammenführen: pro Achse gilt der letzte Wert
+    moves: Dict[str, ObjectMove] = {}
+    for entry in objects:
+        if not isinstance(entry, dict):
+            raise CodecError("objects enthält kein Objekt")
+        obj_id = _object_id(entry.get("id"))
+        position, rotation = _vec(entry, "position"), _vec(entry, "rotation")
+        move = moves.get(obj_id)
+        if move is None:
+            moves[obj_id] = ObjectMove(obj_id, position, rotation)
+        else:
+            move.position.update(position)
+            move.rotation.update(rotation)
+    return ObjectMoveBatch(list(moves.values()))
+
+
+def _decode_scene_request(data: Message) -> SceneRequest:
+    return SceneRequest()
+
+
+def _decode_pong(data: Message) -> Pong:
+    return Pong()
+
+
+def _decode_time_sync(data: Message) -> TimeSync:
+    t0 = data.get("t0")
+    if type(t0) not in (int, float) or not math.isfinite(t0):
+        raise CodecError("t0 muss eine endliche Zahl sein")
+    return TimeSync(t0)
+
+
+def _decode_interest(data: Message) -> Interest:
+    if "center" in data:
+        radius = data.get("radius")
+        if type(radius) not in (int, float) or not 0 < radius <= settings.MAX_COORDINATE:
+            raise CodecError("radius ungültig")
+        return Interest(center=_point(data, "center"), radius=radius)
+    if "box" in data:
+        box = data["box"]
+        if not isinstance(box, dict):
+            raise CodecError("box muss ein Objekt sein")
+        return Interest(box=(_point(box, "min"), _point(box, "max")))
+    return Interest()
+
+
+def _decode_subscribe(data: Message) -> Subscribe:
+    sub = Subscribe()
+    if "topics" in data:
+        sub.topics = topics(data["topics"])
+        sub.has_topics = True
+    echo = data.get("echo")
+    if echo is not None:
+        if not isinstance(echo, bool):
+            raise CodecError("echo muss true oder false sein")
+        sub.echo = echo
+    return sub
+
+
+_DECODERS: Dict[str, Callable[[Message], ClientMessage]] = {
+    Chat.type: _decode_chat,
+    ObjectMove.type: _decode_object_move,
+    ObjectMoveBatch.type: _decode_object_move_batch,
+    SceneRequest.type: _decode_scene_request,
+    Pong.type: _decode_pong,
+    TimeSync.type: _decode_time_sync,
+    Interest.type: _decode_interest,
+    Subscribe.type: _decode_subscribe,
+}
+
+
+def from_dict(data: Any) -> ClientMessage:
+    """Bereits geparste Nachricht validieren und typisieren."""
+    if not isinstance(data, dict):
+        raise CodecError("Nachricht muss ein JSON-Objekt sein")
+    msg_type = data.get("type", "chat")
+    if not isinstance(msg_type, str):
+        raise CodecError("type ungültig")
+    decoder = _DECODERS.get(msg_type)
+    if decoder is not None:
+        return decoder(data)
+    if not _TYPE_RE.fullmatch(msg_type) or msg_type in RESERVED_TYPES:
+        raise CodecError("type ungültig")
+    return Unknown(msg_type, _text(data))
+
+
+def decode_text(raw: str) -> ClientMessage:
+    """Text-Frame eines Clients dekodieren.
+
+    Größe wird vor dem Parsen geprüft; Text, der kein JSON ist, wird wie
+    bisher als Chat-Nachricht behandelt.
+    """
+    limit = settings.MAX_FRAME_BYTES
+    # Zeichen ≤ Bytes ≤ 4 × Zeichen: nur im Grenzbereich wirklich kodieren
+    if len(raw) > limit or (len(raw) * 4 > limit and len(raw.encode()) > limit):
+        raise FrameTooLarge(f"Frame größer als {limit} Bytes")
+
+    try:
+        data = loads(raw)
+    except ValueError:
+        if len(raw) > settings.MAX_TEXT_LENGTH:
+            raise CodecError("text zu lang")
+        return Chat(raw)
+    return from_dict(data)
@@ -0,0 +1,163 @@
+"""Kompressions-Policy für ausgehende Text-Frames (deflate pro Nachricht).
+
+Über ASGI hat die App keinen Einfluss darauf, welche Frames das
+permessage-deflate des Servers komprimiert – es sind alle oder keine. Deshalb
+komprimiert die App selbst, und nur dort, wo es sich lohnt:
+
+- Clients bieten es beim Verbinden an (``?compress=deflate``)
+- komprimiert werden Frames ab ``WS_COMPRESS_MIN_BYTES``; pro Typ
+  (``WS_COMPRESS_TYPES``) und pro Room (``compress``,
+  ``compress_min_bytes``) überschreibbar
+- komprimierte Frames gehen als Binär-Frame raus: ``uint8 3`` + raw deflate
+  des UTF-8-Texts (Browser: ``DecompressionStream("deflate-raw")``)
+
+Wie beim Kodieren wird pro Broadcast höchstens einmal komprimiert, und erst,
+wenn der erste Empfänger mit Kompression an der Reihe ist. Bringt deflate
+nichts, geht der Text unverändert raus.
+
+Hat der Server für eine Verbindung permessage-deflate ausgehandelt, bekommt
+sie keine App-Kompression (``transport_deflate``), sonst würde doppelt
+komprimiert. Die App sieht nur das Angebot des Clients; dass uvicorn es
+annimmt (Standard), sagt ``WS_SERVER_DEFLATE``. Mit
+``uvicorn --ws-per-message-deflate false`` und ``WS_SERVER_DEFLATE=0``
+komprimiert nur noch die App.
+"""
+import zlib
+from time import perf_counter_ns
+from typing import Dict, Optional
+
+import settings
+from wire import KIND_DEFLATE
+
+# Wert für ?compress=...
+DEFLATE = "deflate"
+
+_PREFIX = bytes((KIND_DEFLATE,))
+
+
+class CompressionStats:
+    __slots__ = (
+        "compressed",
+        "ineffective",
+        "skipped_small",
+        "skipped_type",
+        "bytes_in",
+        "bytes_out",
+        "cpu_ns",
+        "sent",
+        "egress_saved",
+        "transport",
+    )
+
+    def __init__(self) -> None:
+        # komprimierte Frames (einmal pro Broadcast)
+        self.compressed = 0
+        # deflate war nicht kleiner → unkomprimiert gesendet
+        self.ineffective = 0
+        # unter der Schwelle bzw. Typ/Room ohne Kompression
+        self.skipped_small = 0
+        self.skipped_type = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_ns = 0
+        # komprimiert eingereihte Kopien und dadurch gesparte Bytes
+        self.sent = 0
+        self.egress_saved = 0
+        # Verbindungen mit permessage-deflate (ohne App-Kompression)
+        self.transport = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+stats = CompressionStats()
+
+
+def frame_type(frame: str) -> str:
+    """``"type"`` eines kodierten Frames, ohne zu parsen ("" = unbekannt)."""
+    # steht vorne, höchstens hinter "seq"/"ts"
+    start = frame.find('"type":"', 0, 64)
+    if start < 0:
+        return ""
+    start += 8
+    return frame[start : frame.find('"', start)]
+
+
+def transport_deflate(extensions: str) -> bool:
+    """Komprimiert der Server diese Verbindung schon per permessage-deflate?
+
+    ``extensions`` ist der ``Sec-WebSocket-Extensions``-Header des Clients.
+    """
+    if not settings.SERVER_DEFLATE:
+        return False
+    return any(
+        offer.split(";", 1)[0].strip() == "permessage-deflate"
+        for offer in extensions.split(",")
+    )
+
+
+def threshold(room: str, msg_type: str) -> Optional[int]:
+    """Mindestgröße für Kompression; ``None`` = nie komprimieren."""
+    if not settings.COMPRESS or not settings.room_option(room, "compress", True):
+        return None
+    if msg_type in settings.COMPRESS_TYPES:
+        return settings.COMPRESS_TYPES[msg_type]
+    return settings.room_option(room, "compress_min_bytes", settings.COMPRESS_MIN_BYTES)
+
+
+class Deflated:
+    """Komprimierte Fassung eines Text-Frames, lazy und nur einmal berechnet.
+
+    Die Policy wird erst beim ersten Empfänger mit Kompression geprüft.
+    """
+
+    __slots__ = ("room", "frame", "msg_type", "packed", "saved", "_done")
+
+    def __init__(self, room: str, frame: str, msg_type: Optional[str]) -> None:
+        self.room = room
+        self.frame = frame
+        self.msg_type = msg_type
+        self.packed: Optional[bytes] = None
+        # gesparte Bytes pro Empfänger
+        self.saved = 0
+        self._done = False
+
+    def get(self) -> Optional[bytes]:
+        """Binär-Frame oder ``None`` (Policy sagt nein, oder deflate bringt nichts)."""
+        if not self._done:
+            self._done = True
+            self._compress()
+        return self.packed
+
+    def _compress(self) -> None:
+        frame = self.frame
+        msg_type = self.msg_type if self.msg_type is not None else frame_type(frame)
+        limit = threshold(self.room, msg_type)
+        if limit is None:
+            stats.skipped_type += 1
+            return
+        if len(frame) < limit:
+            stats.skipped_small += 1
+            return
+
+        raw = frame.encode()
+        start = perf_counter_ns()
+        compressor = zlib.compressobj(settings.COMPRESS_LEVEL, zlib.DEFLATED, -15)
+        body = compressor.compress(raw) + compressor.flush()
+        stats.cpu_ns += perf_counter_ns() - start
+        stats.compressed += 1
+        stats.bytes_in += len(raw)
+        if len(body) + 1 < len(raw):
+            self.packed = _PREFIX + body
+            self.saved = len(raw) - len(self.packed)
+            stats.bytes_out += len(self.packed)
+        else:
+            stats.ineffective += 1
+            stats.bytes_out += len(raw)
+
+
+def deflater(room: str, frame: str, msg_type: Optional[str] = None) -> Optional[Deflated]:
+    """Lazy komprimierte Fassung; ``None``, wenn Kompression ganz aus ist."""
+    if not settings.COMPRESS:
+        return None
+    return Deflated(room, frame, msg_type)
@@ -0,0 +1,339 @@
+"""Eine WebSocket-Verbindung mit eigener Send-Queue und Writer-Task.
+
+Broadcasts legen vorkodierte Frames nur in die Queue; gesendet wird im
+Writer-Task des jeweiligen Clients. Ein langsamer Client bremst so weder den
+Room noch die Empfangsschleife des Absenders.
+
+Jede Verbindung hat zwei Spuren:
+
+- zuverlässig (Chat, Systemnachrichten): geordnet, wird immer zuerst gesendet
+- verlustbehaftet (vollständige Transform-Updates): Schlüssel sind die
+  Objekt-IDs eines Frames. Ein neueres Update verwirft jeden wartenden
+  Frame, dessen Objekte es alle abdeckt, und reiht sich hinten ein. Pro
+  Objekt geht so nie ein älterer Stand nach einem neueren raus. Teil-Updates
+  (fehlende Achsen) gehören nicht hierher: sie würden beim Ersetzen Achsen
+  verlieren und laufen deshalb über die zuverlässige Spur.
+
+Ein Chat wartet so nie hinter veralteten Positionen. Vor ``object_enter``/
+``object_leave`` wandern die wartenden Updates des Objekts in die
+zuverlässige Spur (``flush_latest``), damit sie nicht überholt werden.
+
+Optional sammelt der Writer Frames über ein kurzes Zeitfenster (oder bis zu
+einer Höchstzahl) und sendet sie als einen einzigen Frame: Text-Frames als
+JSON-Array, Binär-Frames als längenpräfixierter Umschlag (siehe
+``pack_batch``).
+"""
+import asyncio
+from collections import OrderedDict, deque
+from typing import Deque, Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
+
+from fastapi import WebSocket
+
+import codec
+import metrics
+import settings
+from wire import KIND_BATCH
+
+# Vorkodierter Frame: str → Text-Frame, bytes → Binär-Frame
+Frame = Union[str, bytes]
+
+# Close-Code für Clients, die ihre Queue nicht schnell genug leeren
+SLOW_CONSUMER_CLOSE_CODE = 1008
+
+# Schlüssel der verlustbehafteten Spur: Objekt-ID oder Tupel von Objekt-IDs
+LaneKey = Union[str, Tuple[str, ...]]
+
+# Erstes Byte eines binären Batch-Umschlags (1 = einzelnes Transform-Update)
+BATCH_KIND = KIND_BATCH
+
+# Längere Frames passen nicht in das uint16-Längenfeld und gehen einzeln raus
+MAX_BATCHED_FRAME = 0xFFFF
+
+
+def pack_batch(frames: List[Frame]) -> Frame:
+    """Mehrere Frames gleichen Typs zu einem Frame zusammenfassen.
+
+    Text: ``[frame1,frame2,...]`` (jeder Frame ist ein JSON-Objekt).
+    Binär: ``uint8 2``, dann pro Frame ``uint16 Länge`` (little-endian) + Bytes.
+    Binäre Umschläge unter den Frames werden flach eingefügt, nicht
+    verschachtelt.
+    """
+    if isinstance(frames[0], str):
+        return "[" + ",".join(frames) + "]"  # type: ignore[arg-type]
+    parts = [bytes((BATCH_KIND,))]
+    for frame in frames:
+        if frame[0] == BATCH_KIND:  # type: ignore[comparison-overlap]
+            parts.append(frame[1:])  # type: ignore[arg-type]
+            continue
+        parts.append(len(frame).to_bytes(2, "little"))
+        parts.append(frame)  # type: ignore[arg-type]
+    return b"".join(parts)
+
+
+class Connection:
+    __slots__ = (
+        "websocket",
+        "room",
+        "username",
+        "wire",
+        "deflate",
+        "topics",
+        "echo",
+        "queue_size",
+        "overflow_policy",
+        "batch_window",
+        "batch_max",
+        "dropped",
+        "closed",
+        "last_seen",
+        "_queue",
+        "_latest",
+        "_latest_ids",
+        "_wakeup",
+        "_batch_full",
+        "_close_code",
+        "_writer",
+    )
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        room: str,
+        username: str,
+        wire: Optional[str] = None,
+        deflate: bool = False,
+        topics: Optional[FrozenSet[str]] = None,
+        echo: bool = True,
+        queue_size: int = settings.SEND_QUEUE_SIZE,
+        overflow_policy: str = settings.OVERFLOW_POLICY,
+        batch_ms: float = settings.BATCH_MS,
+        batch_max: int = settings.BATCH_MAX,
+    ):
+        self.websocket = websocket
+        self.room = room
+        self.username = username
+        # Ausgehandeltes Binär-Subprotokoll (``None`` = nur JSON)
+        self.wire = wire
+        # Client versteht komprimierte Frames (siehe ``compression``)
+        self.deflate = deflate
+        # abonnierte Themen (``None`` = alle); ändern nur über die RoomRegistry
+        self.topics = topics
+        # eigene Nachrichten (gleicher Username) zurückbekommen
+        self.echo = echo
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        # Sammelfenster in Sekunden (0 = jeder Frame einzeln)
+        self.batch_window = batch_ms / 1000.0
+        self.batch_max = max(batch_max, 1)
+        # Anzahl verworfener Nachrichten (Queue voll)
+        self.dropped = 0
+        self.closed = False
+        # Loop-Zeit der letzten eingehenden Nachricht (Heartbeat)
+        self.last_seen = asyncio.get_running_loop().time()
+        self._queue: Deque[Frame] = deque()
+        # verlustbehaftete Spur: Objekt-IDs → Frame (in Sendereihenfolge)
+        self._latest: "OrderedDict[Tuple[str, ...], Frame]" = OrderedDict()
+        # Objekt-ID → Schlüssel wartender Frames, die das Objekt enthalten
+        self._latest_ids: Dict[str, Dict[Tuple[str, ...], None]] = {}
+        self._wakeup = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._close_code: Optional[int] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    def wants(self, msg_type: str) -> bool:
+        """Hat die Verbindung das Thema dieses Nachrichtentyps abonniert?"""
+        return self.topics is None or codec.topic(msg_type) in self.topics
+
+    def start(self) -> None:
+        """Writer-Task starten (einmal nach ``accept()``)."""
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, frame: Frame, key: Optional[LaneKey] = None) -> bool:
+        """Vorkodierten Frame einreihen, ohne zu warten.
+
+        Mit ``key`` (Objekt-ID(s) des Frames) landet er in der
+        verlustbehafteten Spur und ersetzt wartende Frames, deren Objekte er
+        alle enthält – nur für Frames mit vollständigem Zustand. Gibt
+        ``False`` zurück, wenn der Frame nicht eingereiht wurde.
+        """
+        if self.closed:
+            return False
+        if key is not None:
+            self._enqueue_latest(frame, key)
+            return True
+
+        if len(self._queue) >= self.queue_size:
+            self.dropped += 1
+            metrics.dropped_queue_full.inc()
+            if self.overflow_policy == settings.DROP_NEWEST:
+                return False
+            if self.overflow_policy == settings.DISCONNECT:
+                self._request_close(SLOW_CONSUMER_CLOSE_CODE)
+                return False
+            # DROP_OLDEST: älteste Nachricht verwerfen, neue behalten
+            self._queue.popleft()
+
+        self._queue.append(frame)
+        self._wakeup.set()
+        if self.batch_window and self.pending >= self.batch_max:
+            self._batch_full.set()
+        return True
+
+    def _enqueue_latest(self, frame: Frame, key: LaneKey) -> None:
+        ids = key if isinstance(key, tuple) else (key,)
+        latest = self._latest
+        covered = None
+        for obj_id in ids:
+            for old in tuple(self._latest_ids.get(obj_id, ())):
+                if covered is None:
+                    covered = set(ids)
+                # nur vollständig überholte Frames verwerfen; teilweise
+                # überlappende bleiben vor dem neuen Frame in der Spur
+                if covered.issuperset(old):
+                    self._forget_latest(old)
+                    del latest[old]
+                    metrics.dropped_superseded.inc()
+        if len(latest) >= self.queue_size:
+            # so viele verschiedene Objekte wartend: ältestes verwerfen
+            self._forget_latest(latest.popitem(last=False)[0])
+            self.dropped += 1
+            metrics.dropped_queue_full.inc()
+        latest[ids] = frame
+        for obj_id in ids:
+            self._latest_ids.setdefault(obj_id, {})[ids] = None
+        self._wakeup.set()
+        if self.batch_window and self.pending >= self.batch_max:
+            self._batch_full.set()
+
+    def _forget_latest(self, ids: Tuple[str, ...]) -> None:
+        for obj_id in ids:
+            keys = self._latest_ids[obj_id]
+            del keys[ids]
+            if not keys:
+                del self._latest_ids[obj_id]
+
+    def flush_latest(self, ids: Iterable[str]) -> None:
+        """Wartende Updates dieser Objekte in die zuverlässige Spur verschieben.
+
+        Vor ``object_enter``/``object_leave`` und vor Teil-Updates aufrufen:
+        die zuverlässige Spur geht immer zuerst raus und würde die Updates
+        sonst überholen. Die Frames gehen durch ``enqueue``, Queue-Grenze und
+        Überlauf-Strategie gelten also auch für sie.
+        """
+        keys = {key for obj_id in ids for key in self._latest_ids.get(obj_id, ())}
+        if not keys:
+            return
+        for key in [key for key in self._latest if key in keys]:
+            self._forget_latest(key)
+            if not self.enqueue(self._latest.pop(key)) and self.closed:
+                # DISCONNECT: beide Spuren sind schon geleert
+                return
+
+    @property
+    def pending(self) -> int:
+        """Anzahl wartender Frames in beiden Spuren."""
+        return len(self._queue) + len(self._latest)
+
+    def shutdown(self, code: int) -> None:
+        """Verbindung vom Server aus schließen (Writer sendet den Close-Frame)."""
+        if not self.closed:
+            self._request_close(code)
+
+    def _request_close(self, code: int) -> None:
+        self.closed = True
+        self._close_code = code
+        self._queue.clear()
+        self._latest.clear()
+        self._latest_ids.clear()
+        self._wakeup.set()
+
+    async def _write_loop(self) -> None:
+        websocket = self.websocket
+        try:
+            while not self.closed:
+                if not self.pending:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                if self.batch_window:
+                    # Fenster abwarten, außer der Batch ist schon voll
+                    if self.pending < self.batch_max:
+                        self._batch_full.clear()
+                        try:
+                            await asyncio.wait_for(
+                                self._batch_full.wait(), self.batch_window
+                            )
+                        except asyncio.TimeoutError:
+                            pass
+                        if self.closed or not self.pending:
+                            continue
+                    frame = self._take_batch()
+                else:
+                    frame = self._take()
+
+                if isinstance(frame, str):
+                    await websocket.send_text(frame)
+                else:
+                    await websocket.send_bytes(frame)
+
+            if self._close_code is not None:
+                # Langsamer Client: Verbindung aktiv schließen, die
+                # Empfangsschleife im Endpoint räumt danach auf.
+                await self.websocket.close(code=self._close_code)
+        except Exception:
+            # Client ist weg – die Empfangsschleife bemerkt das ebenfalls
+            self.closed = True
+            self._queue.clear()
+            self._latest.clear()
+            self._latest_ids.clear()
+
+    def _peek(self) -> Optional[Frame]:
+        if self._queue:
+            return self._queue[0]
+        if self._latest:
+            return next(iter(self._latest.values()))
+        return None
+
+    def _take(self) -> Frame:
+        """Nächsten Frame nehmen: zuverlässige Spur zuerst."""
+        if self._queue:
+            return self._queue.popleft()
+        ids, frame = self._latest.popitem(last=False)
+        self._forget_latest(ids)
+        return frame
+
+    def _take_batch(self) -> Frame:
+        """Bis zu ``batch_max`` Frames gleichen Typs nehmen (Spuren wie ``_take``).
+
+        Wechselt der Typ (Text/Binär), endet der Batch dort, damit die
+        Reihenfolge erhalten bleibt.
+        """
+        first = self._take()
+        if len(first) > MAX_BATCHED_FRAME:
+            return first
+        kind = type(first)
+        frames = [first]
+        while len(frames) < self.batch_max:
+            following = self._peek()
+            if (
+                following is None
+                or type(following) is not kind
+                or len(following) > MAX_BATCHED_FRAME
+            ):
+                break
+            frames.append(self._take())
+        return pack_batch(frames) if len(frames) > 1 else first
+
+    async def close(self) -> None:
+        """Writer-Task beenden (beim Disconnect)."""
+        self.closed = True
+        self._queue.clear()
+        self._latest.clear()
+        self._latest_ids.clear()
+        self._wakeup.set()
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+            try:
+                await self._writer
+            except (asyncio.CancelledError, Exception):
+                pass
@@ -0,0 +1,750 @@
+"""Dauerhaftes Event-Log pro Room (append-only Segmente, mmap-Lesezugriff).
+
+Jeder Room bekommt ein Verzeichnis mit Segmenten ``<basis-offset>.log``.
+Jeder Record im Segment hat diesen Aufbau::
+
+    uint32 länge | uint32 crc32 | uint64 offset | payload (kodierter Frame)
+
+Dazu gehört ein Index ``<basis-offset>.idx`` mit einem Eintrag
+``uint64 offset | uint64 position`` pro Record. Offsets zählen pro Room ab 0
+und steigen streng. Nach einer Kompaktierung dürfen Lücken entstehen, die
+Reihenfolge bleibt aber erhalten.
+
+Schreiben kostet im Hot Path nur ein ``list.append``. Ein Flush-Task schreibt
+alle ``flush_ms`` die gesammelten Records mit je einem ``write`` pro Datei.
+Danach ruft er ``fsync`` für alle betroffenen Dateien gebündelt in einem
+Thread auf. Lesen (``last`` / ``since``) geht über gemappte Segmente und den
+Index: Der Einstieg ist O(1), bei kompaktierten Segmenten eine binäre Suche.
+Ein Scan ist nie nötig.
+
+Aufräumen:
+
+- Retention: alte Segmente fallen weg, sobald ein Room mehr als
+  ``retention_bytes`` belegt oder ihr letzter Record älter als
+  ``retention_seconds`` ist. Das aktive Segment bleibt immer.
+- Kompaktierung (optional): Beim Segmentwechsel werden abgeschlossene
+  Segmente in einem Thread neu geschrieben. Pro Schlüssel (``type`` + ``id``)
+  bleibt nur der neueste Record. Records ohne ``id`` (z.B. Chat) bleiben
+  unverändert.
+
+Geöffnet wird ein Room beim ersten Zugriff, in einem Thread: Records, die
+währenddessen ankommen, warten im Speicher und bekommen ihre Offsets, sobald
+der Room offen ist. Nur das jüngste Segment wird dabei per CRC geprüft (nur
+dort kann ein Record abgerissen sein), ältere übernehmen ihre Eckdaten aus
+dem Index, wenn er zur Dateigröße passt. Unbenutzte Rooms geben Dateien und
+Mappings frei, ihre Eckdaten bleiben aber im Speicher (``DORMANT_ROOMS``);
+ein erneuter Zugriff liest nichts von der Platte. Lesen legt für unbekannte
+Rooms kein Verzeichnis an.
+
+I/O-Fehler (Platte voll, Rechte, …) werden gezählt und geloggt, erreichen
+aber nie den Aufrufer von ``append``: das Log darf die Zustellung nicht
+aufhalten. Die betroffenen Records gehen dann verloren.
+
+Verzeichnisnamen sind der URL-kodierte Room-Name; wird der zu lang
+(``MAX_DIRNAME``), steht dort stattdessen der SHA-1 des Namens.
+
+Es schreibt immer nur ein Prozess, nämlich der, der die Lock-Datei des
+Verzeichnisses hält (wie beim ``UnixSocketBackplane``). Er loggt auch
+Frames, die andere Worker über das Backplane schicken.
+"""
+import asyncio
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import quote
+
+import codec
+
+logger = logging.getLogger(__name__)
+
+RECORD = struct.Struct("<IIQ")
+INDEX = struct.Struct("<QQ")
+
+# (offset, payload)
+Event = Tuple[int, bytes]
+
+# So viele geschlossene Rooms behalten ihre Eckdaten für ein schnelles Reopen
+DORMANT_ROOMS = 4096
+
+# Längster lesbarer Verzeichnisname; NAME_MAX ist meist 255 Bytes, und
+# URL-Kodierung macht aus einem Zeichen bis zu zwölf
+MAX_DIRNAME = 128
+
+
+class EventLogStats:
+    __slots__ = (
+        "appended",
+        "flushes",
+        "fsyncs",
+        "bytes_written",
+        "segments_deleted",
+        "segments_compacted",
+        "records_compacted",
+        "errors",
+    )
+
+    def __init__(self) -> None:
+        self.appended = 0
+        self.flushes = 0
+        self.fsyncs = 0
+        self.bytes_written = 0
+        self.segments_deleted = 0
+        self.segments_compacted = 0
+        self.records_compacted = 0
+        # I/O-Fehler beim Öffnen oder Schreiben (Records verloren)
+        self.errors = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+stats = EventLogStats()
+
+
+def room_dirname(room: str) -> str:
+    """Verzeichnisname für einen Room (keine Pfadtrenner, nie ``..``).
+
+    Kurze Namen bleiben lesbar (``r-<url-kodiert>``), lange werden zu
+    ``h-<sha1>`` mit fester Länge.
+    """
+    name = "r-" + quote(room, safe="")
+    if len(name) <= MAX_DIRNAME:
+        return name
+    return "h-" + hashlib.sha1(room.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def compaction_key(payload: bytes) -> Optional[str]:
+    """``type:id`` eines Records; ``None`` = wird nie wegkompaktiert."""
+    if b'"id"' not in payload:
+        return None
+    try:
+        msg = codec.loads(payload)
+    except ValueError:
+        return None
+    if not isinstance(msg, dict) or not isinstance(msg.get("id"), str):
+        return None
+    return f'{msg.get("type")}:{msg["id"]}'
+
+
+def _scan(raw: bytes, base: int) -> Tuple[bytearray, int, int, int]:
+    """Records eines Segments prüfen: (Index, gültige Bytes, Anzahl, letzter Offset).
+
+    Endet beim ersten abgerissenen oder beschädigten Record.
+    """
+    entries = bytearray()
+    pos = count = 0
+    last = base - 1
+    while pos + RECORD.size <= len(raw):
+        length, crc, offset = RECORD.unpack_from(raw, pos)
+        body = pos + RECORD.size
+        payload = raw[body:body + length]
+        if len(payload) != length or zlib.crc32(payload) != crc or offset <= last:
+            break
+        entries += INDEX.pack(offset, pos)
+        last = offset
+        count += 1
+        pos = body + length
+    return entries, pos, count, last
+
+
+class Segment:
+    """Eine Segment-Datei plus Index; Lesen per mmap."""
+
+    __slots__ = (
+        "base",
+        "path",
+        "index_path",
+        "size",
+        "count",
+        "last_offset",
+        "last_write",
+        "compacting",
+        "_data",
+        "_index",
+        "_mapped_size",
+    )
+
+    def __init__(self, directory: Path, base: int) -> None:
+        self.base = base
+        self.path = directory / f"{base:020d}.log"
+        self.index_path = directory / f"{base:020d}.idx"
+        self.size = 0
+        self.count = 0
+        self.last_offset = base - 1
+        self.last_write = time.time()
+        self.compacting = False
+        self._data: Optional[mmap.mmap] = None
+        self._index: Optional[mmap.mmap] = None
+        self._mapped_size = 0
+
+    def recover(self, verify: bool = True) -> None:
+        """Segment nach einem Neustart einlesen, abgerissene Records kappen.
+
+        Ohne ``verify`` reicht ein Index, dessen letzter Eintrag genau am
+        Dateiende endet; sonst werden alle Records geprüft.
+        """
+        if not verify and self._load_index():
+            return
+        raw = self.path.read_bytes()
+        entries, size, count, last = _scan(raw, self.base)
+        if size != len(raw):
+            os.truncate(self.path, size)
+        index_path = self.index_path
+        if not index_path.exists() or index_path.read_bytes() != entries:
+            index_path.write_bytes(entries)
+        self.size, self.count, self.last_offset = size, count, last
+        self.last_write = self.path.stat().st_mtime
+
+    def _load_index(self) -> bool:
+        """Eckdaten aus dem Index übernehmen, wenn er zum Segment passt."""
+        try:
+            size = self.path.stat().st_size
+            index_size = self.index_path.stat().st_size
+            if size == 0 or index_size == 0 or index_size % INDEX.size:
+                return size == index_size == 0
+            with open(self.index_path, "rb") as f:
+                f.seek(index_size - INDEX.size)
+                last, pos = INDEX.unpack(f.read(INDEX.size))
+            with open(self.path, "rb") as f:
+                f.seek(pos)
+                header = f.read(RECORD.size)
+        except OSError:
+            return False
+        if len(header) != RECORD.size:
+            return False
+        length, _crc, offset = RECORD.unpack(header)
+        if offset != last or last < self.base or pos + RECORD.size + length != size:
+            return False
+        self.size, self.count, self.last_offset = size, index_size // INDEX.size, last
+        self.last_write = self.path.stat().st_mtime
+        return True
+
+    # -- Lesen -------------------------------------------------------------
+
+    @staticmethod
+    def _map(path: Path, size: int) -> Optional[mmap.mmap]:
+        if size == 0:
+            return None
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+    def _views(self) -> Tuple[Optional[mmap.mmap], Optional[mmap.mmap]]:
+        # Dateien ändern sich nur in der Größe → bei neuer Größe neu mappen
+        if self._mapped_size != self.size:
+            self.unmap()
+            self._data = self._map(self.path, self.size)
+            self._index = self._map(self.index_path, self.count * INDEX.size)
+            self._mapped_size = self.size
+        return self._data, self._index
+
+    def unmap(self) -> None:
+        for view in (self._data, self._index):
+            if view is not None:
+                view.close()
+        self._data = self._index = None
+        self._mapped_size = 0
+
+    def _find(self, index: mmap.mmap, offset: int) -> int:
+        """Indexposition des ersten Records mit Offset ≥ ``offset``."""
+        guess = offset - self.base
+        # Ohne Kompaktierung sind Offsets lückenlos: direkter Treffer
+        if 0 <= guess < self.count and INDEX.unpack_from(index, guess * INDEX.size)[0] == offset:
+            return guess
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if INDEX.unpack_from(index, mid * INDEX.size)[0] < offset:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def read(self, start: int, limit: int, out: List[Event]) -> None:
+        """Records ab Offset ``start`` an ``out`` hängen (bis ``limit`` insgesamt)."""
+        data, index = self._views()
+        if data is None or index is None:
+            return
+        i = self._find(index, start)
+        while i < self.count and len(out) < limit:
+            offset, pos = INDEX.unpack_from(index, i * INDEX.size)
+            length = RECORD.unpack_from(data, pos)[0]
+            body = pos + RECORD.size
+            out.append((offset, data[body:body + length]))
+            i += 1
+
+
+def _compact_segment(
+    path: Path, index_path: Path, base: int, keep: Callable[[int, bytes], bool]
+) -> Tuple[int, int, int]:
+    """Segment ohne überholte Records neu schreiben (läuft im Thread).
+
+    Gibt (neue Größe, neue Anzahl, entfernte Records) zurück.
+    """
+    raw = path.read_bytes()
+    entries, size, _count, _last = _scan(raw, base)
+    data = bytearray()
+    index = bytearray()
+    kept = removed = 0
+    for i in range(0, len(entries), INDEX.size):
+        offset, pos = INDEX.unpack_from(entries, i)
+        length = RECORD.unpack_from(raw, pos)[0]
+        end = pos + RECORD.size + length
+        if not keep(offset, raw[pos + RECORD.size:end]):
+            removed += 1
+            continue
+        index += INDEX.pack(offset, len(data))
+        data += raw[pos:end]
+        kept += 1
+    if removed:
+        # erst vollständig schreiben, dann atomar ersetzen
+        for target, content in ((path, data), (index_path, index)):
+            tmp = target.with_name(target.name + ".tmp")
+            with open(tmp, "wb") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, target)
+    return len(data), kept, removed
+
+
+def _fsync_all(fds: List[int], dirs: List[str]) -> None:
+    for fd in fds:
+        os.fsync(fd)
+    for directory in dirs:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class RoomLog:
+    """Segmente eines Rooms plus noch nicht geschriebene Records."""
+
+    def __init__(self, room: str, directory: Path, log: "EventLog") -> None:
+        self.room = room
+        self.directory = directory
+        self.log = log
+        self.segments: List[Segment] = []
+        self.next_offset = 0
+        self.last_append = time.monotonic()
+        # noch nicht geschrieben: (offset, payload, schlüssel)
+        self.pending: List[Tuple[int, bytes, Optional[str]]] = []
+        # Schlüssel → neuester Offset (nur mit Kompaktierung)
+        self.latest: Dict[str, int] = {}
+        # (log, index) des aktiven Segments
+        self._fds: Optional[Tuple[int, int]] = None
+
+    def open(self) -> None:
+        """Vorhandene Segmente einlesen (einmal beim ersten Zugriff).
+
+        Nur das jüngste Segment wird vollständig geprüft.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        bases = sorted(
+            int(p.stem) for p in self.directory.glob("*.log") if p.stem.isdigit()
+        )
+        for i, base in enumerate(bases):
+            segment = Segment(self.directory, base)
+            segment.recover(verify=i == len(bases) - 1)
+            self.segments.append(segment)
+        if self.segments:
+            self.next_offset = self.segments[-1].last_offset + 1
+        if self.log.compact:
+            for segment in self.segments:
+                out: List[Event] = []
+                segment.read(segment.base, segment.count, out)
+                for offset, payload in out:
+                    key = compaction_key(payload)
+                    if key is not None:
+                        self.latest[key] = offset
+
+    # -- Schreiben -----------------------------------------------------------
+
+    def append(self, payload: bytes, key: Optional[str]) -> int:
+        offset = self.next_offset
+        self.next_offset = offset + 1
+        self.pending.append((offset, payload, key))
+        self.last_append = time.monotonic()
+        return offset
+
+    def write(self) -> int:
+        """Gesammelte Records ins aktive Segment schreiben (ohne fsync)."""
+        pending = self.pending
+        if not pending:
+            return 0
+        self.pending = []
+        log = self.log
+        if not self.segments or self.segments[-1].size >= log.segment_bytes:
+            self._roll(pending[0][0])
+        segment = self.segments[-1]
+        if self._fds is None:
+            flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+            self._fds = (
+                os.open(segment.path, flags, 0o644),
+                os.open(segment.index_path, flags, 0o644),
+            )
+            log.dirty_dirs.add(str(self.directory))
+        fd_data, fd_index = self._fds
+
+        data = bytearray()
+        index = bytearray()
+        pos = segment.size
+        latest = self.latest if log.compact else None
+        for offset, payload, key in pending:
+            index += INDEX.pack(offset, pos + len(data))
+            data += RECORD.pack(len(payload), zlib.crc32(payload), offset)
+            data += payload
+            if latest is not None and key is not None:
+                latest[key] = offset
+        os.write(fd_data, data)
+        os.write(fd_index, index)
+        log.dirty_fds.update(self._fds)
+
+        segment.size += len(data)
+        segment.count += len(pending)
+        segment.last_offset = pending[-1][0]
+        segment.last_write = time.time()
+        stats.bytes_written += len(data)
+        return len(data)
+
+    def _roll(self, base: int) -> None:
+        """Neues aktives Segment ab ``base`` (das bisherige ist abgeschlossen)."""
+        self.release_fds()
+        self.segments.append(Segment(self.directory, base))
+        if self.log.compact and len(self.segments) > 1:
+            self.log.schedule_compaction(self)
+
+    def release_fds(self) -> None:
+        if self._fds is not None:
+            # erst nach dem laufenden fsync schließen
+            self.log.closing.extend(self._fds)
+            self._fds = None
+
+    def apply_retention(self, now: float) -> None:
+        log = self.log
+        segments = self.segments
+        while len(segments) > 1 and not segments[0].compacting:
+            oldest = segments[0]
+            too_big = log.retention_bytes and (
+                sum(s.size for s in segments) > log.retention_bytes
+            )
+            too_old = log.retention_seconds and (
+                now - oldest.last_write > log.retention_seconds
+            )
+            if not (too_big or too_old):
+                return
+            segments.pop(0)
+            oldest.unmap()
+            for path in (oldest.path, oldest.index_path):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            stats.segments_deleted += 1
+
+    # -- Lesen -----------------------------------------------------------------
+
+    def since(self, start: int, limit: int) -> List[Event]:
+        """Bis zu ``limit`` Records ab Offset ``start`` (älteste zuerst)."""
+        out: List[Event] = []
+        segments = self.segments
+        # ab dem letzten Segment mit base ≤ start lesen
+        first = 0
+        for i, segment in enumerate(segments):
+            if segment.base > start:
+                break
+            first = i
+        for segment in segments[first:]:
+            if len(out) >= limit:
+                return out
+            if segment.last_offset >= start:
+                segment.read(start, limit, out)
+        for offset, payload, _key in self.pending:
+            if len(out) >= limit:
+                break
+            if offset >= start:
+                out.append((offset, payload))
+        return out
+
+    def last(self, n: int) -> List[Event]:
+        return self.since(max(self.next_offset - n, 0), n)
+
+    def close(self) -> None:
+        self.release_fds()
+        for segment in self.segments:
+            segment.unmap()
+
+
+class EventLog:
+    """Event-Logs aller Rooms unter einem Verzeichnis."""
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int,
+        flush_ms: float,
+        fsync: bool = True,
+        retention_bytes: int = 0,
+        retention_seconds: float = 0,
+        compact: bool = False,
+        idle_close: float = 60.0,
+    ) -> None:
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_ms / 1000.0
+        self.fsync = fsync
+        self.retention_bytes = retention_bytes
+        self.retention_seconds = retention_seconds
+        self.compact = compact
+        # Rooms ohne neue Records so lange (s) → Dateien/Mappings schließen
+        self.idle_close = idle_close
+        # Nur der Halter der Lock-Datei schreibt und liest
+        self.writable = False
+        self.rooms: Dict[str, RoomLog] = {}
+        # geschlossene Rooms (LRU): Eckdaten ohne offene Dateien
+        self._dormant: "OrderedDict[str, RoomLog]" = OrderedDict()
+        # für den nächsten gebündelten fsync
+        self.dirty_fds: Set[int] = set()
+        self.dirty_dirs: Set[str] = set()
+        # Dateien, die nach dem laufenden fsync geschlossen werden
+        self.closing: List[int] = []
+        self._lock_fd: Optional[int] = None
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._compactions: Dict[str, asyncio.Task] = {}
+        # Rooms, die gerade im Thread geöffnet werden, und ihre Records
+        self._opening: Dict[str, asyncio.Task] = {}
+        self._waiting: Dict[str, List[Tuple[bytes, Optional[str]]]] = {}
+
+    # -- Start/Stop ------------------------------------------------------------
+
+    def _try_lock(self) -> bool:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.directory / ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        self.writable = True
+        return True
+
+    async def start(self) -> None:
+        self._stopping = asyncio.Event()
+        self._try_lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Flush-Task regulär beenden (kein Abbruch mitten im fsync)
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        if self._opening:
+            await asyncio.gather(*self._opening.values(), return_exceptions=True)
+        if self._compactions:
+            await asyncio.gather(*self._compactions.values(), return_exceptions=True)
+        await self.flush()
+        for room_log in self.rooms.values():
+            room_log.close()
+        self.rooms.clear()
+        self._dormant.clear()
+        self._close_released()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+            self.writable = False
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            if not self.writable:
+                # Schreibender Prozess weg → übernehmen
+                self._try_lock()
+            elif not self._stopping.is_set():
+                await self.flush()
+
+    # -- Schreiben ---------------------------------------------------------------
+
+    def _cached(self, room: str) -> Optional[RoomLog]:
+        """Offenen oder ruhenden Room ohne I/O holen."""
+        room_log = self.rooms.get(room)
+        if room_log is None:
+            room_log = self._dormant.pop(room, None)
+            if room_log is not None:
+                self.rooms[room] = room_log
+        return room_log
+
+    def _open_task(self, room: str) -> asyncio.Task:
+        task = self._opening.get(room)
+        if task is None:
+            task = self._opening[room] = asyncio.create_task(self._open(room))
+        return task
+
+    async def _open(self, room: str) -> Optional[RoomLog]:
+        """Segmente im Thread einlesen, danach wartende Records übernehmen."""
+        room_log = RoomLog(room, self.directory / room_dirname(room), self)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, room_log.open)
+        except OSError as exc:
+            stats.errors += 1
+            logger.warning("Event-Log für Room %r nicht lesbar: %s", room, exc)
+            self._waiting.pop(room, None)
+            return None
+        finally:
+            self._opening.pop(room, None)
+        self.rooms[room] = room_log
+        for payload, key in self._waiting.pop(room, ()):
+            room_log.append(payload, key)
+        return room_log
+
+    async def room(self, room: str) -> Optional[RoomLog]:
+        """Room holen, beim ersten Zugriff öffnen (``None`` bei I/O-Fehler)."""
+        room_log = self._cached(room)
+        if room_log is not None:
+            return room_log
+        # shield: ein abgebrochener Leser darf das Öffnen nicht abbrechen
+        return await asyncio.shield(self._open_task(room))
+
+    async def lookup(self, room: str) -> Optional[RoomLog]:
+        """Wie ``room``, legt für Rooms ohne Log aber nichts an (``None``)."""
+        if (
+            room not in self.rooms
+            and room not in self._dormant
+            and room not in self._opening
+            and not (self.directory / room_dirname(room)).is_dir()
+        ):
+            return None
+        return await self.room(room)
+
+    def append(self, room: str, frame: str, msg: Dict) -> Optional[int]:
+        """Frame für ``room`` vormerken, ohne I/O.
+
+        Gibt den Offset zurück; ``None``, solange der Room noch geöffnet
+        wird (der Record bekommt seinen Offset danach).
+        """
+        if not self.writable:
+            return None
+        key = None
+        if self.compact and isinstance(msg.get("id"), str):
+            key = f'{msg.get("type")}:{msg["id"]}'
+        stats.appended += 1
+        payload = frame.encode()
+        room_log = self._cached(room)
+        if room_log is None:
+            self._waiting.setdefault(room, []).append((payload, key))
+            self._open_task(room)
+            return None
+        return room_log.append(payload, key)
+
+    async def flush(self) -> None:
+        """Alles Gesammelte schreiben, dann gebündelt fsyncen."""
+        if not self.writable:
+            return
+        now = time.time()
+        written = 0
+        for room_log in self.rooms.values():
+            try:
+                written += room_log.write()
+                room_log.apply_retention(now)
+            except OSError as exc:
+                stats.errors += 1
+                logger.warning(
+                    "Event-Log für Room %r nicht geschrieben: %s", room_log.room, exc
+                )
+        if written:
+            stats.flushes += 1
+
+        fds, dirs = list(self.dirty_fds), list(self.dirty_dirs)
+        self.dirty_fds.clear()
+        self.dirty_dirs.clear()
+        if self.fsync and (fds or dirs):
+            await asyncio.get_running_loop().run_in_executor(None, _fsync_all, fds, dirs)
+            stats.fsyncs += 1
+        self._close_released()
+        self._close_idle()
+
+    def _close_released(self) -> None:
+        closing, self.closing = self.closing, []
+        for fd in closing:
+            self.dirty_fds.discard(fd)
+            os.close(fd)
+
+    def _close_idle(self) -> None:
+        """Lange unbenutzte Rooms freigeben (werden bei Bedarf neu geöffnet)."""
+        cutoff = time.monotonic() - self.idle_close
+        for room, room_log in list(self.rooms.items()):
+            if (
+                room_log.last_append < cutoff
+                and not room_log.pending
+                and room not in self._compactions
+            ):
+                room_log.close()
+                del self.rooms[room]
+                self._dormant[room] = room_log
+                while len(self._dormant) > DORMANT_ROOMS:
+                    self._dormant.popitem(last=False)
+
+    # -- Kompaktierung -------------------------------------------------------------
+
+    def schedule_compaction(self, room_log: RoomLog) -> None:
+        if room_log.room not in self._compactions:
+            self._compactions[room_log.room] = asyncio.create_task(
+                self._compact(room_log)
+            )
+
+    async def _compact(self, room_log: RoomLog) -> None:
+        loop = asyncio.get_running_loop()
+        latest = dict(room_log.latest)
+
+        def keep(offset: int, payload: bytes) -> bool:
+            key = compaction_key(payload)
+            return key is None or latest.get(key, offset) <= offset
+
+        try:
+            for segment in room_log.segments[:-1]:
+                # inzwischen per Retention gelöscht?
+                if not segment.count or segment not in room_log.segments:
+                    continue
+                segment.compacting = True
+                try:
+                    size, count, removed = await loop.run_in_executor(
+                        None,
+                        _compact_segment,
+                        segment.path,
+                        segment.index_path,
+                        segment.base,
+                        keep,
+                    )
+                finally:
+                    segment.compacting = False
+                if removed:
+                    segment.unmap()
+                    segment.size, segment.count = size, count
+                    stats.segments_compacted += 1
+                    stats.records_compacted += removed
+        finally:
+            self._compactions.pop(room_log.room, None)
+
+    # -- Lesen -----------------------------------------------------------------------
+
+    async def since(self, room: str, offset: int, limit: int) -> List[Event]:
+        room_log = await self.lookup(room) if self.writable and limit > 0 else None
+        return room_log.since(offset, limit) if room_log is not None else []
+
+    async def last(self, room: str, n: int) -> List[Event]:
+        room_log = await self.lookup(room) if self.writable and n > 0 else None
+        return room_log.last(n) if room_log is not None else []
@@ -0,0 +1,104 @@
+"""Heartbeat: halboffene Verbindungen erkennen und aus den Rooms entfernen.
+
+Jede eingehende Nachricht zählt als Lebenszeichen (``Connection.last_seen``).
+Ein einziger Task läuft alle ``interval`` Sekunden über alle Verbindungen:
+
+- still seit mehr als ``timeout`` → gilt als tot, wird in einem Rutsch aus
+  den Rooms entfernt und geschlossen
+- still seit mehr als ``interval`` → bekommt ``{"type": "ping"}``, der Client
+  antwortet mit ``{"type": "pong"}``
+
+Aktive Clients bekommen also nie Pings, und der Ping-Frame wird pro Runde nur
+einmal kodiert. Standardmäßig aus (``WS_HEARTBEAT_INTERVAL=0``): eingeschaltet
+schließt der Server Clients, die nicht auf Pings antworten.
+"""
+import asyncio
+from typing import Callable, Dict, List, Optional
+
+import broadcast
+import clock
+from connection import Connection
+from rooms import RoomRegistry
+
+# Close-Code für Verbindungen ohne Lebenszeichen ("Going Away"; 1011 hieße
+# "interner Fehler" und ließe Clients einen Serverfehler vermuten)
+HEARTBEAT_CLOSE_CODE = 1001
+
+
+class HeartbeatStats:
+    __slots__ = ("rounds", "pings", "reaped")
+
+    def __init__(self) -> None:
+        self.rounds = 0
+        self.pings = 0
+        self.reaped = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+stats = HeartbeatStats()
+
+
+class Heartbeat:
+    """Pingt stille Verbindungen an und räumt tote ab."""
+
+    def __init__(
+        self,
+        rooms: RoomRegistry,
+        interval: float,
+        timeout: float,
+        on_reaped: Callable[[List[Connection], Dict[str, int]], None],
+    ) -> None:
+        self.rooms = rooms
+        self.interval = interval
+        self.timeout = timeout
+        # bekommt die entfernten Verbindungen und die Anzahl pro Room
+        self._on_reaped = on_reaped
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            self.sweep(loop.time())
+
+    def sweep(self, now: float) -> List[Connection]:
+        """Eine Runde: tote Verbindungen entfernen, stille anpingen."""
+        stats.rounds += 1
+        stale: List[Connection] = []
+        idle: List[Connection] = []
+        for conn in self.rooms:
+            silent = now - conn.last_seen
+            if silent > self.timeout:
+                stale.append(conn)
+            elif silent >= self.interval:
+                idle.append(conn)
+
+        if idle:
+            stats.pings += broadcast.broadcast(
+                idle, {"type": "ping", "ts": clock.now_ms()}
+            )
+
+        if stale:
+            removed = self.rooms.evict(stale)
+            stats.reaped += len(stale)
+            for conn in stale:
+                # Writer schickt den Close-Frame; die Empfangsschleife im
+                # Endpoint endet danach mit einem Disconnect
+                conn.shutdown(HEARTBEAT_CLOSE_CODE)
+            self._on_reaped(stale, removed)
+        return stale
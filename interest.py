@@ -0,0 +1,224 @@
+"""Interest-Management: ``object_move`` nur an Clients, die hinschauen.
+
+Clients können einen Interessensbereich melden (Kugel: ``center`` +
+``radius`` oder Box: ``min``/``max``, z.B. das Kamera-Frustum als Box). Der
+Server hält pro Room ein räumliches Hash-Gitter:
+
+- Zelle → Verbindungen, deren Bereich die Zelle berührt
+- Objekt → letzte bekannte Position (und Zelle)
+- Objekt → Verbindungen, die es gerade sehen
+
+Ein Update geht an alle Clients ohne Bereich (die sehen alles) und an die
+Abonnenten der Zelle, deren Bereich die Position wirklich enthält. Wer ein
+Objekt neu sieht, bekommt ``object_enter``; wer es nicht mehr sieht,
+``object_leave``.
+"""
+import math
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+from connection import Connection
+
+Cell = Tuple[int, int, int]
+Point = Tuple[float, float, float]
+
+_AXES = ("x", "y", "z")
+
+
+class Region:
+    """Kugel oder achsenparallele Box."""
+
+    __slots__ = ("lo", "hi", "center", "radius_sq")
+
+    def __init__(
+        self,
+        lo: Point,
+        hi: Point,
+        center: Optional[Point] = None,
+        radius: float = 0.0,
+    ) -> None:
+        self.lo = lo
+        self.hi = hi
+        self.center = center
+        self.radius_sq = radius * radius
+
+    @classmethod
+    def sphere(cls, center: Point, radius: float) -> "Region":
+        lo = tuple(c - radius for c in center)
+        hi = tuple(c + radius for c in center)
+        return cls(lo, hi, center, radius)  # type: ignore[arg-type]
+
+    @classmethod
+    def box(cls, lo: Point, hi: Point) -> "Region":
+        return cls(
+            tuple(map(min, lo, hi)),  # type: ignore[arg-type]
+            tuple(map(max, lo, hi)),  # type: ignore[arg-type]
+        )
+
+    def contains(self, p: Point) -> bool:
+        lo, hi = self.lo, self.hi
+        if not (
+            lo[0] <= p[0] <= hi[0] and lo[1] <= p[1] <= hi[1] and lo[2] <= p[2] <= hi[2]
+        ):
+            return False
+        if self.center is None:
+            return True
+        c = self.center
+        return (p[0] - c[0]) ** 2 + (p[1] - c[1]) ** 2 + (p[2] - c[2]) ** 2 <= self.radius_sq
+
+    def cell_range(self, cell_size: float) -> Tuple[Cell, Cell]:
+        lo = tuple(math.floor(v / cell_size) for v in self.lo)
+        hi = tuple(math.floor(v / cell_size) for v in self.hi)
+        return lo, hi  # type: ignore[return-value]
+
+
+def _cells(lo: Cell, hi: Cell) -> Iterator[Cell]:
+    for x in range(lo[0], hi[0] + 1):
+        for y in range(lo[1], hi[1] + 1):
+            for z in range(lo[2], hi[2] + 1):
+                yield (x, y, z)
+
+
+def cell_count(lo: Cell, hi: Cell) -> int:
+    return (hi[0] - lo[0] + 1) * (hi[1] - lo[1] + 1) * (hi[2] - lo[2] + 1)
+
+
+class RegionTooLarge(ValueError):
+    pass
+
+
+class InterestIndex:
+    """Räumliches Hash-Gitter eines Rooms."""
+
+    def __init__(self, cell_size: float, max_cells: int) -> None:
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        # Verbindung → Bereich (Verbindungen ohne Eintrag sehen alles)
+        self.regions: Dict[Connection, Region] = {}
+        # Zelle → Verbindungen, deren Bereich die Zelle berührt
+        self._subscribers: Dict[Cell, Set[Connection]] = {}
+        # Objekt → Position / Zelle; Zelle → Objekte
+        self._positions: Dict[str, Point] = {}
+        self._object_cell: Dict[str, Cell] = {}
+        self._cell_objects: Dict[Cell, Set[str]] = {}
+        # Objekt → Verbindungen, die es sehen; Verbindung → sichtbare Objekte
+        self._watchers: Dict[str, Set[Connection]] = {}
+        self._visible: Dict[Connection, Set[str]] = {}
+
+    @property
+    def max_radius(self) -> float:
+        """Größter Kugelradius, der überall auf dem Gitter erlaubt ist."""
+        per_axis = round(self.max_cells ** (1 / 3))
+        while per_axis ** 3 > self.max_cells:
+            per_axis -= 1
+        return max(per_axis - 1, 0) * self.cell_size / 2
+
+    def _cell(self, p: Point) -> Cell:
+        size = self.cell_size
+        return (math.floor(p[0] / size), math.floor(p[1] / size), math.floor(p[2] / size))
+
+    # -- Bereiche der Clients ----------------------------------------------
+
+    def set_region(self, conn: Connection, region: Region) -> Tuple[Set[str], Set[str]]:
+        """Bereich setzen; gibt (neu sichtbare, nicht mehr sichtbare) Objekte zurück.
+
+        Ohne bisherigen Bereich sah die Verbindung alles: dann zählen alle
+        bekannten Objekte außerhalb des neuen Bereichs als nicht mehr sichtbar.
+        """
+        lo, hi = region.cell_range(self.cell_size)
+        if cell_count(lo, hi) > self.max_cells:
+            raise RegionTooLarge("Bereich zu groß")
+
+        self._unsubscribe(conn)
+        self.regions[conn] = region
+        visible: Set[str] = set()
+        for cell in _cells(lo, hi):
+            self._subscribers.setdefault(cell, set()).add(conn)
+            for obj_id in self._cell_objects.get(cell, ()):
+                if region.contains(self._positions[obj_id]):
+                    visible.add(obj_id)
+
+        watched = self._visible.get(conn)
+        if watched is None:
+            # erster Bereich: bisher sah die Verbindung jedes Objekt
+            watched = set()
+            before = set(self._positions)
+        else:
+            before = watched
+        for obj_id in watched - visible:
+            self._watchers[obj_id].discard(conn)
+        for obj_id in visible - watched:
+            self._watchers.setdefault(obj_id, set()).add(conn)
+        self._visible[conn] = visible
+        return visible - before, before - visible
+
+    def clear_region(self, conn: Connection) -> None:
+        """Bereich entfernen: die Verbindung sieht wieder alles."""
+        self.remove(conn)
+
+    def remove(self, conn: Connection) -> None:
+        self._unsubscribe(conn)
+        self.regions.pop(conn, None)
+        for obj_id in self._visible.pop(conn, ()):
+            self._watchers[obj_id].discard(conn)
+
+    def _unsubscribe(self, conn: Connection) -> None:
+        region = self.regions.get(conn)
+        if region is None:
+            return
+        for cell in _cells(*region.cell_range(self.cell_size)):
+            subs = self._subscribers.get(cell)
+            if subs is not None:
+                subs.discard(conn)
+                if not subs:
+                    del self._subscribers[cell]
+
+    # -- Objekte -----------------------------------------------------------
+
+    def position_of(self, obj_id: str) -> Optional[Point]:
+        return self._positions.get(obj_id)
+
+    def place(self, obj_id: str, position: Dict[str, float]) -> Tuple[Point, Cell]:
+        """Position übernehmen (fehlende Achsen: bisheriger Wert).
+
+        Auch ohne Bereiche aufrufen, damit spätere Bereiche jedes Objekt an
+        der richtigen Stelle finden.
+        """
+        old = self._positions.get(obj_id, (0.0, 0.0, 0.0))
+        p = tuple(position.get(a, old[i]) for i, a in enumerate(_AXES))
+        self._positions[obj_id] = p  # type: ignore[assignment]
+
+        cell = self._cell(p)  # type: ignore[arg-type]
+        old_cell = self._object_cell.get(obj_id)
+        if old_cell != cell:
+            if old_cell is not None:
+                objects = self._cell_objects[old_cell]
+                objects.discard(obj_id)
+                if not objects:
+                    del self._cell_objects[old_cell]
+            self._cell_objects.setdefault(cell, set()).add(obj_id)
+            self._object_cell[obj_id] = cell
+        return p, cell  # type: ignore[return-value]
+
+    def route_move(
+        self, obj_id: str, position: Dict[str, float]
+    ) -> Tuple[Set[Connection], Set[Connection], Set[Connection]]:
+        """Position übernehmen und Empfänger mit Bereich bestimmen.
+
+        Gibt (sehen es weiterhin, sehen es neu, sehen es nicht mehr) zurück.
+        Verbindungen ohne Bereich sind nicht enthalten – sie sehen alles.
+        """
+        p, cell = self.place(obj_id, position)
+        watchers = {
+            conn
+            for conn in self._subscribers.get(cell, ())
+            if self.regions[conn].contains(p)
+        }
+        before = self._watchers.get(obj_id, set())
+        entered = watchers - before
+        left = before - watchers
+        for conn in entered:
+            self._visible[conn].add(obj_id)
+        for conn in left:
+            self._visible[conn].discard(obj_id)
+        self._watchers[obj_id] = watchers
+        return watchers - entered, entered, left
@@ -1,21 +1,733 @@
-from typing import Dict, List, Tuple
-import json
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
 from pathlib import Path
 
-from fastapi import FastAPI, WebSocket
-from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response
 
-app = FastAPI()
+import admission
+import broadcast
+import clock
+import codec
+import compression
+import eventlog
+import heartbeat
+import memory
+import metrics
+import presence
+import ratelimit
+import replay
+import settings
+import ticker
+import wire
+from assets import AssetCache
+from backplane import create_backplane
+from connection import Connection, Frame, pack_batch
+from interest import InterestIndex, Region, RegionTooLarge
+from rooms import Members, RoomRegistry
+from scene import SceneStore
+
+# ------------------------------------------------------------
+# Rooms + Broadcast (lokal und über das Backplane)
+# ------------------------------------------------------------
+
+# Alle Verbindungen dieses Workers, indiziert nach Room und Username
+rooms = RoomRegistry()
+
+# Letzte bekannte Transformation jedes Objekts (Snapshot für neue Clients)
+scene = SceneStore(settings.SCENE_MAX_ROOMS, settings.SCENE_MAX_OBJECTS)
+
+# Verteilt Broadcasts an andere Worker-Prozesse (uvicorn --workers N)
+backplane = create_backplane(settings.BACKPLANE, settings.BACKPLANE_PATH)
+
+
+# Dauerhaftes Event-Log pro Room (optional, WS_EVENTLOG_DIR)
+event_log: Optional[eventlog.EventLog] = None
+if settings.EVENTLOG_DIR:
+    event_log = eventlog.EventLog(
+        settings.EVENTLOG_DIR,
+        settings.EVENTLOG_SEGMENT_BYTES,
+        settings.EVENTLOG_FLUSH_MS,
+        fsync=settings.EVENTLOG_FSYNC,
+        retention_bytes=settings.EVENTLOG_RETENTION_BYTES,
+        retention_seconds=settings.EVENTLOG_RETENTION_SECONDS,
+        compact=settings.EVENTLOG_COMPACT,
+    )
+
+
+def resume_gap(websocket: WebSocket, room: str) -> Optional[List[str]]:
+    """Verpasste Frames für ``?since=<seq>&epoch=<epoch>``.
+
+    ``None`` = kein Fortsetzen möglich (oder gewünscht) → voller Snapshot.
+    """
+    params = websocket.query_params
+    since = params.get("since")
+    if since is None:
+        return None
+    missed = None
+    if params.get("epoch") == replay.EPOCH and since.isdigit():
+        missed = replays.missed(room, int(since))
+    metrics.resumes.labels("snapshot" if missed is None else "replay").inc()
+    return missed
+
+
+def log_event(room: str, frame: str, msg: Dict[str, Any]) -> None:
+    if event_log is not None and msg.get("type") in settings.EVENTLOG_TYPES:
+        event_log.append(room, frame, msg)
+
+
+# Sequenznummern und letzte Broadcasts pro Room (Wiederverbindung)
+replays = replay.ReplayStore(settings.REPLAY_WINDOW, settings.SCENE_MAX_ROOMS)
+
+
+# Objekt-Indizes für Binär-Clients, pro Room und Worker vergeben
+object_indexes: Dict[str, wire.ObjectIndex] = {}
+
+
+def move_translator(
+    room: str, objects: List[Dict[str, Any]], seq: int, ts: int, frame: str
+) -> broadcast.Translator:
+    """Übersetzung von Bewegungen für Binär-Clients (lazy).
+
+    Beim ersten Binär-Empfänger werden ggf. neue Objekt-Indizes vergeben und
+    allen Binär-Clients im Room angekündigt, bevor der erste Binär-Frame
+    in ihrer Queue landet. Mehrere Objekte gehen als ein Umschlag raus.
+    ``seq`` und ``ts`` sind Room-Sequenznummer und Server-Zeit des Frames.
+    """
+    encoded: Dict[str, Any] = {}
+
+    def translate(wire_format: str) -> Frame:
+        if "indexes" not in encoded:
+            index = object_indexes.setdefault(room, wire.ObjectIndex())
+            announce: Dict[str, int] = {}
+            indexes = []
+            for obj in objects:
+                idx = index.lookup(obj["id"])
+                if idx is None:
+                    idx = index.register(obj["id"])
+                    if idx is not None:
+                        announce[obj["id"]] = idx
+                indexes.append(idx)
+            if announce:
+                broadcast.broadcast(
+                    [c for c in rooms.members(room) if c.wire],
+                    {"type": "object_ids", "ids": announce},
+                )
+            encoded["indexes"] = indexes
+
+        indexes = encoded["indexes"]
+        if None in indexes:
+            # Index-Raum voll → auch Binär-Clients bekommen JSON
+            return frame
+        moves = [
+            wire.encode_move(wire_format, idx, seq, ts, obj)
+            for idx, obj in zip(indexes, objects)
+        ]
+        return moves[0] if len(moves) == 1 else pack_batch(moves)
+
+    return translate
+
+
+# Bewegungen: Szenen-Zustand, Interest-Filter und Binär-Übersetzung
+MOVE_TYPES = ("object_move", "object_move_batch")
+
+
+def ownership(room: str) -> bool:
+    return bool(settings.room_option(room, "ownership", settings.OBJECT_OWNERSHIP))
+
+
+def reject_moves(conn: Connection, ids: List[str]) -> None:
+    """Abgelehnte Updates verwerfen, nur der Absender erfährt es.
+
+    Ohne Eintrag in der Szene war der Room voll, sonst gehört das Objekt
+    jemand anderem.
+    """
+    full = sum(1 for obj_id in ids if scene.get(conn.room, obj_id) is None)
+    metrics.dropped_scene_full.inc(full)
+    metrics.dropped_not_owner.inc(len(ids) - full)
+    broadcast.send(conn, {"type": "object_denied", "ids": ids})
+
+
+# Räumliche Indizes für Rooms mit Interest-Management
+interest_indexes: Dict[str, InterestIndex] = {}
+
+
+def object_enter(room: str, obj_id: str) -> Dict[str, Any]:
+    state = scene.get(room, obj_id) or {}
+    return {
+        "type": "object_enter",
+        "id": obj_id,
+        "position": state.get("position", {}),
+        "rotation": state.get("rotation", {}),
+    }
+
+
+MoveGroup = Tuple[List[Connection], List[Dict[str, Any]]]
+
+
+def route_interest(
+    index: InterestIndex, room: str, objects: List[Dict[str, Any]], members: Members
+) -> List[MoveGroup]:
+    """Empfänger von Bewegungen nach Interessensbereichen aufteilen.
+
+    Wer ein Objekt neu sieht, bekommt statt des Updates ``object_enter``
+    (mit vollständigem Zustand); wer es nicht mehr sieht, ``object_leave``.
+    Clients mit Bereich bekommen nur die Objekte darin; gleiche Sicht →
+    gleicher Frame. Empfänger sind nur ``members`` (Abonnenten von
+    ``object_move``), auch wenn der Index weitere Bereiche kennt.
+    """
+    subscribed = set(members)
+    seen: Dict[Connection, List[Dict[str, Any]]] = {}
+    for obj in objects:
+        staying, entered, left = index.route_move(obj["id"], obj["position"])
+        staying &= subscribed
+        entered &= subscribed
+        left &= subscribed
+        # wartende Updates des Objekts nicht von enter/leave überholen lassen
+        for conn in entered | left:
+            conn.flush_latest((obj["id"],))
+        if entered:
+            broadcast.broadcast(entered, object_enter(room, obj["id"]))
+        if left:
+            broadcast.broadcast(left, {"type": "object_leave", "id": obj["id"]})
+        for conn in staying:
+            seen.setdefault(conn, []).append(obj)
+
+    regions = index.regions
+    everything = [c for c in members if c not in regions]
+    views: Dict[Tuple[str, ...], MoveGroup] = {}
+    for conn, visible in seen.items():
+        if len(visible) == len(objects):
+            everything.append(conn)
+            continue
+        key = tuple(obj["id"] for obj in visible)
+        group = views.get(key)
+        if group is None:
+            views[key] = ([conn], visible)
+        else:
+            group[0].append(conn)
+    groups = [(everything, objects)] if everything else []
+    groups.extend(views.values())
+    return groups
+
+
+def deliver_moves(
+    room: str,
+    seq: int,
+    ts: int,
+    frame: str,
+    msg: Dict[str, Any],
+    members: Members,
+    sender: Optional[str] = None,
+) -> int:
+    """``object_move``/``object_move_batch`` an die Room-Mitglieder verteilen.
+
+    ``sender``: Username, dessen Verbindungen ohne Echo ausgelassen werden.
+    """
+    objects = msg["objects"] if msg["type"] == "object_move_batch" else [msg]
+    lossy = settings.room_option(room, "lossy_moves", settings.LOSSY_MOVES)
+    groups: List[MoveGroup] = [(list(members), objects)]
+    index = interest_indexes.get(room)
+    if index is not None:
+        if index.regions:
+            groups = route_interest(index, room, objects, members)
+        else:
+            # niemand filtert gerade: nur Positionen für spätere Bereiche
+            for obj in objects:
+                index.place(obj["id"], obj["position"])
+    delivered = 0
+    for conns, visible in groups:
+        out = frame
+        if visible is not objects:
+            # Teilmenge eines Batches: gleiche seq/ts wie der volle Frame
+            partial = codec.batch_message(msg["user"], visible)
+            out = replay.splice(seq, ts, broadcast.encode(partial))
+        translate = move_translator(room, visible, seq, ts, out)
+        deflated = compression.deflater(room, out, msg["type"])
+        # Schlüssel der verlustbehafteten Spur: die Objekt-ID(s) des Frames
+        key = None
+        if lossy:
+            ids = tuple(obj["id"] for obj in visible)
+            if all(codec.full_transform(obj) for obj in visible):
+                key = ids
+            else:
+                # Teil-Update darf nichts ersetzen → zuverlässig, wartende
+                # Updates derselben Objekte vorher nachziehen
+                for conn in conns:
+                    conn.flush_latest(ids)
+        delivered += broadcast.broadcast_frame(
+            conns, out, translate, deflated, key, sender
+        )
+    return delivered
+
+
+def deliver_local(
+    room: str, frame: str, msg: Dict[str, Any], sender: Optional[str] = None
+) -> None:
+    """Frame nummerieren und an die lokalen Room-Mitglieder geben.
+
+    Auch ohne Mitglieder wird nummeriert, damit wiederkehrende Clients
+    ihre Lücke aus dem Replay-Fenster bekommen. Verbindungen von ``sender``
+    ohne Echo bekommen den Frame nicht.
+    """
+    ts = clock.now_ms()
+    seq, frame = replays.stamp(room, frame, ts)
+    msg_type = msg.get("type") or compression.frame_type(frame)
+    members: Sequence[Connection] = rooms.subscribers(room, codec.topic(msg_type))
+    broadcast.stats.unsubscribed += rooms.count(room) - len(members)
+    if not members:
+        return
+    if sender is not None and not rooms.echo_off(room, sender):
+        sender = None
+    start = time.perf_counter()
+    if msg.get("type") in MOVE_TYPES:
+        delivered = deliver_moves(room, seq, ts, frame, msg, members, sender)
+    else:
+        deflated = compression.deflater(room, frame, msg.get("type"))
+        delivered = broadcast.broadcast_frame(
+            members, frame, None, deflated, None, sender
+        )
+    metrics.broadcast_seconds.observe(time.perf_counter() - start)
+    metrics.messages_out.labels(room).inc(delivered)
+
+
+# Komprimierter Snapshot pro Room (gültig, solange der Snapshot-Frame gleich ist)
+snapshot_deflated: Dict[str, compression.Deflated] = {}
+
+
+def send_snapshot(conn: Connection, room: str, always: bool = True) -> None:
+    """Szenen-Snapshot an einen Client; leere Szene nur mit ``always``."""
+    frame = scene.snapshot_frame(room)
+    if frame is None:
+        if always:
+            broadcast.send(conn, scene.snapshot(room))
+        return
+    deflated = None
+    if conn.deflate:
+        deflated = snapshot_deflated.get(room)
+        if deflated is None or deflated.frame is not frame:
+            deflated = compression.deflater(room, frame, "scene_snapshot")
+            if deflated is not None:
+                snapshot_deflated[room] = deflated
+    broadcast.send_frame(conn, frame, deflated)
+
+
+def set_interest(conn: Connection, interest: codec.Interest) -> None:
+    """Interessensbereich eines Clients setzen oder entfernen."""
+    room = conn.room
+    cell = float(settings.room_option(room, "interest_cell", settings.INTEREST_CELL))
+    if cell <= 0:
+        broadcast.send(
+            conn, {"type": "error", "text": "interest ist hier aus", "max_radius": 0}
+        )
+        return
+    index = interest_indexes.get(room)
+    if index is None:
+        index = interest_indexes[room] = InterestIndex(
+            cell, settings.INTEREST_MAX_CELLS
+        )
+        # Objekte, die sich schon vor dem ersten Bereich bewegt haben
+        for obj_id, state in scene.snapshot(room)["objects"].items():
+            index.place(obj_id, state["position"])
+
+    if interest.center is not None:
+        region = Region.sphere(interest.center, interest.radius)
+    elif interest.box is not None:
+        region = Region.box(*interest.box)
+    else:
+        # Kein Bereich mehr → sieht wieder alles, also vollen Zustand schicken
+        index.clear_region(conn)
+        send_snapshot(conn, room)
+        return
+
+    try:
+        entered, left = index.set_region(conn, region)
+    except RegionTooLarge as exc:
+        # mit Obergrenze, damit der Client kleiner neu anfragen kann
+        broadcast.send(
+            conn, {"type": "error", "text": str(exc), "max_radius": index.max_radius}
+        )
+        return
+    if not conn.wants("object_move"):
+        # Bereich gilt erst, wenn Bewegungen wieder abonniert sind
+        return
+    conn.flush_latest(entered | left)
+    for obj_id in entered:
+        broadcast.send(conn, object_enter(room, obj_id))
+    for obj_id in left:
+        broadcast.send(conn, {"type": "object_leave", "id": obj_id})
+
+
+def broadcast_room(room: str, msg: Dict[str, Any]) -> None:
+    """Nachricht einmal kodieren, lokal einreihen und an andere Worker geben."""
+    frame = broadcast.encode(msg)
+    log_event(room, frame, msg)
+    sender = msg.get("user")
+    deliver_local(room, frame, msg, sender)
+    backplane.publish(room, frame, sender)
+
+
+def deliver_remote(room: str, frame: str, sender: Optional[str]) -> None:
+    """Frame eines anderen Workers an die lokalen Room-Mitglieder geben.
+
+    Den Absender (für das Echo) trägt der Backplane-Umschlag mit.
+    """
+    msg: Dict[str, Any] = {}
+    # Der schreibende Worker loggt auch Frames der anderen Worker
+    logging = event_log is not None and event_log.writable
+    if logging or '"type":"object_move' in frame:
+        msg = codec.loads(frame)
+        # Besitz prüft der Worker, bei dem das Update ankam
+        if msg.get("type") == "object_move":
+            scene.apply(room, msg)
+        elif msg.get("type") == "object_move_batch":
+            scene.apply_batch(room, msg)
+        log_event(room, frame, msg)
+    deliver_local(room, frame, msg, sender)
+
+
+# Zuletzt an den Room gemeldetes Sendeintervall (Flow-Hinweis)
+flow_hints: Dict[str, int] = {}
+
+
+def update_flow_hint(room: str, newcomer: Optional[Connection] = None) -> None:
+    """Flow-Hinweis neu berechnen und bei Änderung an den Room senden.
+
+    Ändert sich nichts, bekommt nur ``newcomer`` den aktuellen Hinweis.
+    """
+    interval = ratelimit.flow_interval_ms(
+        rooms.count(room),
+        settings.FLOW_BUDGET,
+        settings.FLOW_MIN_INTERVAL_MS,
+        settings.FLOW_MAX_INTERVAL_MS,
+    )
+    if interval is None:
+        return
+    previous = flow_hints.get(room)
+    if interval == previous:
+        if newcomer is not None:
+            broadcast.send(newcomer, {"type": "flow", "interval_ms": interval})
+        return
+
+    flow_hints[room] = interval
+    hint: Dict[str, Any] = {"type": "flow", "interval_ms": interval}
+    if previous is not None:
+        hint["action"] = "slow_down" if interval > previous else "speed_up"
+    broadcast.broadcast(rooms.members(room), hint)
+
+
+def new_rate_limiter() -> Optional[ratelimit.RateLimiter]:
+    if settings.RATE_MSGS <= 0:
+        return None
+    return ratelimit.RateLimiter(
+        settings.RATE_MSGS,
+        settings.RATE_BURST,
+        {t: (float(r), float(b)) for t, (r, b) in settings.RATE_TYPES.items()},
+        asyncio.get_running_loop().time(),
+    )
+
+
+async def apply_rate_limit(
+    conn: Connection, limiter: ratelimit.RateLimiter, msg_type: str
+) -> Optional[str]:
+    """Rate-Limit prüfen; ``None`` = durchlassen, sonst DROP oder CLOSE."""
+    loop = asyncio.get_running_loop()
+    now = loop.time()
+    wait = limiter.check(msg_type, now)
+    if wait and settings.RATE_ACTION == ratelimit.DELAY:
+        # Verzögern bremst nur die Empfangsschleife dieses Clients
+        deadline = now + settings.RATE_MAX_DELAY_MS / 1000.0
+        while wait and now + wait <= deadline:
+            await asyncio.sleep(wait)
+            now = loop.time()
+            wait = limiter.check(msg_type, now)
+    if not wait:
+        return None
+    if settings.RATE_ACTION == ratelimit.CLOSE:
+        return ratelimit.CLOSE
+
+    if limiter.should_hint(now):
+        interval = max(
+            limiter.min_interval_ms(msg_type),
+            flow_hints.get(conn.room, settings.FLOW_MIN_INTERVAL_MS),
+        )
+        broadcast.send(
+            conn, {"type": "flow", "action": "slow_down", "interval_ms": interval}
+        )
+    return ratelimit.DROP
+
+
+# Optionaler Simulation-Tick: object_move pro Objekt und Tick zusammenfassen
+ticks = ticker.TickScheduler(
+    broadcast_room,
+    lambda room: float(settings.room_option(room, "tick_hz", settings.TICK_HZ)),
+)
+
+
+def forget_connection(conn: Connection) -> None:
+    """Zustand einer Verbindung außerhalb der RoomRegistry entfernen."""
+    rosters.leave(conn.room, conn.username)
+    index = interest_indexes.get(conn.room)
+    if index is not None:
+        index.remove(conn)
+    # letzte Verbindung des Users im Room → seine Objekte werden frei
+    if ownership(conn.room) and not any(
+        c.room == conn.room for c in rooms.by_user(conn.username)
+    ):
+        scene.release(conn.room, conn.username)
+
+
+def room_shrunk(room: str) -> None:
+    """Nach einem Leave: leeren Room abräumen, sonst Flow-Hinweis anpassen."""
+    if room not in rooms:
+        ticks.discard(room)
+        object_indexes.pop(room, None)
+        interest_indexes.pop(room, None)
+        snapshot_deflated.pop(room, None)
+        flow_hints.pop(room, None)
+        rosters.discard(room)
+        metrics.registry.retire_room(room)
+    else:
+        update_flow_hint(room)
+
+
+def deliver_presence(room: str, msg: Dict[str, Any]) -> None:
+    """Gesammelten Presence-Diff an die lokalen Room-Mitglieder."""
+    frame = broadcast.encode(msg)
+    broadcast.broadcast_frame(
+        rooms.subscribers(room, "presence"),
+        frame,
+        deflated=compression.deflater(room, frame, "presence"),
+    )
+
+
+# Roster pro Room; Joins/Leaves gehen gesammelt als Diff raus
+rosters = presence.Presence(
+    lambda room: float(settings.room_option(room, "presence_ms", settings.PRESENCE_MS)),
+    deliver_presence,
+)
+
+
+def send_roster(conn: Connection, room: str) -> None:
+    frame = broadcast.encode(rosters.roster(room))
+    presence.stats.rosters += 1
+    broadcast.send_frame(conn, frame, compression.deflater(room, frame, "roster"))
+
+
+def query_topics(websocket: WebSocket) -> Optional[FrozenSet[str]]:
+    """Abo aus ``?topics=chat,presence`` (fehlt = alle Themen)."""
+    raw = websocket.query_params.get("topics")
+    return None if raw is None else codec.topics(raw.split(","))
+
+
+def subscribe(conn: Connection, sub: codec.Subscribe) -> None:
+    """Abo ändern; für neu abonnierte Themen gleich den Stand mitgeben."""
+    had_presence = conn.wants("presence")
+    had_moves = conn.wants("object_move")
+    topics = sub.topics if sub.has_topics else conn.topics
+    echo = conn.echo if sub.echo is None else sub.echo
+    rooms.subscribe(conn, topics, echo)
+    broadcast.send(
+        conn,
+        {
+            "type": "subscribed",
+            "topics": None if topics is None else sorted(topics),
+            "echo": echo,
+        },
+    )
+    if not had_presence and conn.wants("presence"):
+        send_roster(conn, conn.room)
+    if not had_moves and conn.wants("object_move"):
+        send_snapshot(conn, conn.room, always=False)
+
+
+def reaped(stale: List[Connection], removed: Dict[str, int]) -> None:
+    """Vom Heartbeat entfernte Verbindungen fertig abräumen."""
+    for conn in stale:
+        forget_connection(conn)
+    for room, count in removed.items():
+        metrics.reaped.labels(room).inc(count)
+        room_shrunk(room)
+
+
+# Pingt stille Clients an und entfernt tote Verbindungen aus den Rooms
+heartbeats = heartbeat.Heartbeat(
+    rooms, settings.HEARTBEAT_INTERVAL, settings.HEARTBEAT_TIMEOUT, reaped
+)
+
+
+def overload_changed(degraded: bool) -> None:
+    """Degraded-Modus an-/ausgeschaltet: Clients per Flow-Hinweis bremsen."""
+    if degraded:
+        broadcast.broadcast(
+            list(rooms),
+            {
+                "type": "flow",
+                "action": "slow_down",
+                "interval_ms": int(settings.DEGRADED_MOVE_INTERVAL_MS),
+            },
+        )
+        return
+    for room in rooms.room_names():
+        interval = flow_hints.get(room, settings.FLOW_MIN_INTERVAL_MS)
+        broadcast.broadcast(
+            rooms.members(room),
+            {"type": "flow", "action": "speed_up", "interval_ms": interval},
+        )
+
+
+# Obergrenzen für neue Verbindungen, Degraded-Modus unter Last
+admissions = admission.Admission(
+    rooms,
+    settings.MAX_CONNECTIONS,
+    lambda room: int(settings.room_option(room, "max_members", settings.MAX_ROOM_MEMBERS)),
+    settings.MAX_USER_CONNECTIONS,
+    settings.RETRY_AFTER,
+    settings.OVERLOAD_CHECK_MS,
+    settings.OVERLOAD_LOOP_LAG_MS,
+    settings.OVERLOAD_QUEUE_DEPTH,
+    settings.DEGRADED_MODE,
+    settings.DEGRADED_MOVE_INTERVAL_MS,
+    overload_changed,
+)
+
+
+# HTTP-Status für Ablehnungen im Handshake, je nach Close-Code
+REJECT_STATUS = {admission.TRY_AGAIN_LATER: 503, admission.POLICY_VIOLATION: 429}
+
+
+async def reject(websocket: WebSocket, reason: str, code: int) -> None:
+    """Verbindung schon im Handshake ablehnen (vor ``accept()``).
+
+    Kennt der Server die ASGI-Extension ``websocket.http.response``, geht eine
+    HTTP-Antwort mit ``Retry-After`` und ``{"type": "rejected", ...}`` als Body
+    raus; sonst bricht der Server den Handshake ab (HTTP 403).
+    """
+    retry = settings.RETRY_AFTER
+    metrics.rejected.labels(reason).inc()
+    if "websocket.http.response" in websocket.scope.get("extensions", {}):
+        body = codec.dumps({"type": "rejected", "reason": reason, "retry_after": retry})
+        await websocket.send_denial_response(
+            Response(
+                body,
+                status_code=REJECT_STATUS[code],
+                media_type="application/json",
+                headers={"Retry-After": str(retry)},
+            )
+        )
+        return
+    await websocket.close(code=code, reason=f"{reason}; retry-after={retry}")
+
+
+def collect_metrics():
+    """Metriken aus vorhandenem Zustand, erst beim Abruf von ``/metrics``."""
+    limit = settings.METRICS_MAX_SERIES
+    members = metrics.bounded(((r, rooms.count(r)) for r in rooms.room_names()), limit)
+    depth = metrics.bounded(
+        ((r, sum(c.pending for c in rooms.members(r))) for r in rooms.room_names()),
+        limit,
+    )
+    deepest = max((c.pending for c in rooms), default=0)
+
+    yield ("ws_connections", "gauge", "Offene Verbindungen", [({}, len(rooms))])
+    yield ("ws_rooms", "gauge", "Rooms mit Mitgliedern", [({}, len(members))])
+    yield (
+        "ws_room_members",
+        "gauge",
+        "Mitglieder pro Room",
+        [({"room": r}, n) for r, n in members.items()],
+    )
+    yield (
+        "ws_send_queue_depth",
+        "gauge",
+        "Wartende Frames in den Send-Queues pro Room",
+        [({"room": r}, n) for r, n in depth.items()],
+    )
+    yield (
+        "ws_send_queue_depth_max",
+        "gauge",
+        "Tiefste Send-Queue einer einzelnen Verbindung",
+        [({}, deepest)],
+    )
+    for name, value in broadcast.stats.as_dict().items():
+        yield (f"ws_broadcast_{name}_total", "counter", f"Broadcast: {name}", [({}, value)])
+    for name, value in ticker.stats.as_dict().items():
+        yield (f"ws_tick_{name}_total", "counter", f"Tick: {name}", [({}, value)])
+    packed = compression.stats
+    yield ("ws_compress_frames_total", "counter", "Komprimierte Frames", [({}, packed.compressed)])
+    yield (
+        "ws_compress_skipped_total",
+        "counter",
+        "Nicht komprimierte Frames nach Grund",
+        [
+            ({"reason": "small"}, packed.skipped_small),
+            ({"reason": "policy"}, packed.skipped_type),
+            ({"reason": "ineffective"}, packed.ineffective),
+        ],
+    )
+    yield ("ws_compress_bytes_in_total", "counter", "Bytes vor Kompression", [({}, packed.bytes_in)])
+    yield ("ws_compress_bytes_out_total", "counter", "Bytes nach Kompression", [({}, packed.bytes_out)])
+    yield (
+        "ws_compress_egress_saved_bytes_total",
+        "counter",
+        "Durch Kompression gesparte Bytes über alle Empfänger",
+        [({}, packed.egress_saved)],
+    )
+    yield (
+        "ws_compress_cpu_seconds_total",
+        "counter",
+        "CPU-Zeit für Kompression",
+        [({}, packed.cpu_ns / 1e9)],
+    )
+    yield ("ws_degraded", "gauge", "1 = Degraded-Modus aktiv", [({}, int(admissions.degraded))])
+    yield (
+        "ws_loop_lag_seconds",
+        "gauge",
+        "Zuletzt gemessene Verzögerung der Event-Loop",
+        [({}, admission.stats.loop_lag_ms / 1000)],
+    )
+    yield (
+        "ws_backplane_dropped_total",
+        "counter",
+        "Vom Backplane verworfene Frames",
+        [({}, backplane.dropped)],
+    )
+
+
+metrics.registry.add_collector(collect_metrics)
 
 # Projektbasis
 BASE_DIR = Path(__file__).resolve().parent
 
-# /static → Ordner "static"
-app.mount("/static", StaticFiles(directory=BASE_DIR / "static"), name="static")
+# Seiten und statische Dateien (im Speicher, vorkomprimiert)
+assets = AssetCache(BASE_DIR)
 
-# rooms["roomname"] = [(websocket, username), ...]
-rooms: Dict[str, List[Tuple[WebSocket, str]]] = {}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.DEBUG_MEMORY:
+        memory.start(settings.TRACEMALLOC_FRAMES)
+    assets.load()
+    backplane.set_handler(deliver_remote)
+    await backplane.start()
+    heartbeats.start()
+    admissions.start()
+    if event_log is not None:
+        await event_log.start()
+    try:
+        yield
+    finally:
+        await heartbeats.stop()
+        await admissions.stop()
+        if event_log is not None:
+            await event_log.stop()
+        await backplane.stop()
+        memory.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 # ------------------------------------------------------------
@@ -23,18 +735,101 @@ rooms: Dict[str, List[Tuple[WebSocket, str]]] = {}
 # ------------------------------------------------------------
 
 @app.get("/")
-async def index():
-    return FileResponse(BASE_DIR / "templates" / "index.html")
+async def index(request: Request):
+    return assets.page(request, "index.html")
 
 
 @app.get("/client")
-async def chat_client():
-    return FileResponse(BASE_DIR / "templates" / "chat.html")
+async def chat_client(request: Request):
+    return assets.page(request, "chat.html")
 
 
 @app.get("/three")
-async def three_client():
-    return FileResponse(BASE_DIR / "templates" / "three.html")
+async def three_client(request: Request):
+    return assets.page(request, "three.html")
+
+
+# /static/<datei> und /static/<name>.<hash>.<endung> (immutable)
+@app.get("/static/{name}")
+async def static_file(request: Request, name: str):
+    return assets.static_file(request, name)
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "json_backend": codec.JSON_BACKEND,
+        "broadcast": broadcast.stats.as_dict(),
+        "tick": ticker.stats.as_dict(),
+        "heartbeat": heartbeat.stats.as_dict(),
+        "admission": admission.stats.as_dict(),
+        "compression": compression.stats.as_dict(),
+        "presence": presence.stats.as_dict(),
+        "eventlog": eventlog.stats.as_dict(),
+    }
+
+
+@app.get("/rooms")
+async def room_list():
+    """User pro Room, ohne WebSocket.
+
+    Zählt nur die Verbindungen dieses Workers (Presence läuft nicht über das
+    Backplane).
+    """
+    counts = rosters.counts()
+    return {"rooms": counts, "users": sum(counts.values())}
+
+
+@app.get("/rooms/{room}/presence")
+async def room_presence(room: str):
+    """Roster eines Rooms (nur dieser Worker); unbekannter Room = leer."""
+    roster = rosters.roster(room)
+    return {"room": room, "count": roster["count"], "users": roster["users"]}
+
+
+@app.get("/rooms/{room}/events")
+async def room_events(room: str, since: Optional[int] = None, last: int = 50, limit: int = 100):
+    """Events aus dem Event-Log: die letzten ``last`` oder ab Offset ``since``."""
+    if event_log is None:
+        return Response(status_code=404)
+    if not event_log.writable:
+        # anderer Worker hält das Log
+        return Response(status_code=503)
+    limit = max(1, min(limit, 1000))
+    if since is None:
+        events = await event_log.last(room, min(last, limit))
+    else:
+        events = await event_log.since(room, max(since, 0), limit)
+    # Frames sind schon JSON → ohne erneutes Parsen zusammensetzen
+    body = ",".join(
+        '{"offset":%d,"event":%s}' % (offset, payload.decode()) for offset, payload in events
+    )
+    following = events[-1][0] + 1 if events else (since or 0)
+    return Response(
+        '{"events":[%s],"next":%d}' % (body, following), media_type="application/json"
+    )
+
+
+@app.get("/debug/memory")
+async def debug_memory(top: int = 10, reset: bool = False):
+    """Speicher, Tasks und Loop-Lag dieses Workers (nur mit WS_DEBUG_MEMORY)."""
+    if not settings.DEBUG_MEMORY:
+        return Response(status_code=404)
+    # Lag zuerst: der tracemalloc-Snapshot blockiert die Loop selbst
+    report = {"loop_lag": await memory.loop_lag()}
+    report.update(
+        connections=len(rooms),
+        rooms=len(rooms.room_names()),
+        tasks=len(asyncio.all_tasks()),
+        rss_bytes=memory.rss_bytes(),
+    )
+    report.update(memory.allocations(max(0, min(top, 100)), reset))
+    return report
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
 
 
 # ------------------------------------------------------------
@@ -43,66 +838,192 @@ async def three_client():
 
 @app.websocket("/ws/{room}/{username}")
 async def websocket_endpoint(websocket: WebSocket, room: str, username: str):
-    # Verbindung annehmen
-    await websocket.accept()
-
     room = (room or "lobby").strip()
     username = (username or "Anon").strip()
 
-    # Room-Liste vorbereiten
-    if room not in rooms:
-        rooms[room] = []
+    # Obergrenzen / Überlast: schon im Handshake ablehnen, bevor Zustand
+    # angelegt wird und bevor der Upgrade etwas kostet
+    refusal = admissions.check(room, username)
+    if refusal is not None:
+        await reject(websocket, *refusal)
+        return
 
-    # Diesen Client merken
-    rooms[room].append((websocket, username))
+    # Binär-Subprotokoll aushandeln (optional), dann Verbindung annehmen
+    wire_format = wire.choose_subprotocol(websocket.scope.get("subprotocols", []))
+    await websocket.accept(subprotocol=wire_format)
 
+    # Abo: nur diese Nachrichtentypen, optional ohne eigene Nachrichten
+    try:
+        topics = query_topics(websocket)
+    except codec.CodecError as exc:
+        await websocket.send_text(codec.dumps({"type": "error", "text": str(exc)}))
+        await websocket.close(code=admission.POLICY_VIOLATION)
+        return
+
+    # App-Kompression nur ohne permessage-deflate des Servers (sonst doppelt)
+    deflate = websocket.query_params.get("compress") == compression.DEFLATE
+    if deflate and compression.transport_deflate(
+        websocket.headers.get("sec-websocket-extensions", "")
+    ):
+        compression.stats.transport += 1
+        deflate = False
+
+    # Diesen Client merken und seinen Writer-Task starten
+    conn = Connection(
+        websocket,
+        room,
+        username,
+        wire=wire_format,
+        deflate=deflate,
+        topics=topics,
+        echo=websocket.query_params.get("echo") != "0",
+        batch_ms=float(settings.room_option(room, "batch_ms", settings.BATCH_MS)),
+        batch_max=int(settings.room_option(room, "batch_max", settings.BATCH_MAX)),
+    )
+    rooms.join(conn)
+    rosters.join(room, username)
+    metrics.registry.revive_room(room)
+    conn.start()
+    metrics.connections_opened.inc()
+    limiter = new_rate_limiter()
+    throttle = admissions.throttle()
+    owned = ownership(room)
+    update_flow_hint(room, newcomer=conn)
+
+    # Wer ist da: einmal der ganze Roster, danach nur noch Diffs
+    if conn.wants("presence"):
+        send_roster(conn, room)
+
+    # Binär-Clients brauchen die Zuordnung Objekt-ID → Index
+    if wire_format is not None and room in object_indexes:
+        broadcast.send(conn, object_indexes[room].table())
+
+    missed = resume_gap(websocket, room)
+    if missed is not None:
+        # Wiederverbindung: nur die verpassten Broadcasts nachliefern
+        for frame in missed:
+            if conn.wants(compression.frame_type(frame)):
+                broadcast.send_frame(conn, frame, compression.deflater(room, frame))
+    else:
+        # Aktuellen Szenen-Zustand direkt mitgeben
+        if conn.wants("object_move"):
+            send_snapshot(conn, room, always=False)
+
+        # Letzte Events aus dem Log (z.B. Chat-Verlauf)
+        if event_log is not None and settings.EVENTLOG_REPLAY:
+            for _offset, payload in await event_log.last(room, settings.EVENTLOG_REPLAY):
+                frame = payload.decode()
+                if conn.wants(compression.frame_type(frame)):
+                    broadcast.send_frame(conn, frame, compression.deflater(room, frame))
+
+    # Stand der Nummerierung, ab dem der Client beim nächsten Mal fortsetzt
+    broadcast.send(
+        conn, {"type": "session", "epoch": replay.EPOCH, "seq": replays.current(room)}
+    )
+
+    loop = asyncio.get_running_loop()
     try:
         while True:
-            # Nachricht vom Client empfangen (Text)
-            raw = await websocket.receive_text()
+            # Nachricht vom Client empfangen (Text oder Binär)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            conn.last_seen = loop.time()
 
-            # JSON versuchen, sonst als Chat-Text behandeln
+            raw = message.get("text")
             try:
-                data = json.loads(raw)
-            except json.JSONDecodeError:
-                data = {"type": "chat", "text": raw}
-
-            msg_type = data.get("type", "chat")
-
-            # 3D-Bewegung (Three.js)
-            if msg_type == "object_move":
-                msg = {
-                    "type": "object_move",
-                    "user": username,
-                    "id": data.get("id", "cube-1"),
-                    "position": data.get("position", {}),
-                    "rotation": data.get("rotation", {}),
-                }
-
-            # Chat-Nachricht
-            elif msg_type == "chat":
-                msg = {
-                    "type": "chat",
-                    "user": username,
-                    "text": data.get("text", ""),
-                }
-
-            # Andere Typen (falls du mal erweiterst)
-            else:
-                msg = {
-                    "type": msg_type,
-                    "user": username,
-                    "text": data.get("text", ""),
-                }
+                if raw is not None:
+                    incoming = codec.decode_text(raw)
+                else:
+                    # Binär-Frame: nur Transform-Updates (einzeln oder Umschlag)
+                    index = object_indexes.get(room)
+                    if index is None:
+                        continue
+                    data = wire.decode_frame(
+                        message.get("bytes") or b"", index, settings.MOVE_BATCH_MAX
+                    )
+                    if data is None:
+                        continue
+                    incoming = codec.from_dict(data)
+            except codec.FrameTooLarge:
+                await websocket.close(code=codec.TOO_BIG_CLOSE_CODE)
+                break
+            except codec.CodecError as exc:
+                # Ungültig → verwerfen, nur der Absender erfährt warum
+                metrics.dropped_invalid.inc()
+                broadcast.send(conn, {"type": "error", "text": str(exc)})
+                continue
+
+            # Antwort auf Heartbeat-Ping: last_seen ist schon aktualisiert
+            if isinstance(incoming, codec.Pong):
+                continue
+
+            # Degraded-Modus: Bewegungen drosseln bzw. nur noch Chat
+            if not throttle.admit(incoming.type, conn.last_seen):
+                metrics.dropped_degraded.inc()
+                continue
+
+            # Token-Bucket pro Verbindung und Typ
+            if limiter is not None:
+                verdict = await apply_rate_limit(conn, limiter, incoming.type)
+                if verdict == ratelimit.CLOSE:
+                    await websocket.close(code=ratelimit.RATE_LIMIT_CLOSE_CODE)
+                    break
+                if verdict == ratelimit.DROP:
+                    metrics.dropped_rate_limit.inc()
+                    continue
+
+            metrics.messages_in.labels(room, incoming.type).inc()
+
+            # Snapshot explizit angefordert → nur an diesen Client
+            if isinstance(incoming, codec.SceneRequest):
+                send_snapshot(conn, room)
+                continue
+
+            # Uhrabgleich: Client-Zeit zurück, dazu die Server-Zeit
+            if isinstance(incoming, codec.TimeSync):
+                broadcast.send(conn, incoming.reply(clock.now_ms()))
+                continue
+
+            # Interessensbereich für object_move
+            if isinstance(incoming, codec.Interest):
+                set_interest(conn, incoming)
+                continue
+
+            # Themen-Abo / Echo ändern
+            if isinstance(incoming, codec.Subscribe):
+                subscribe(conn, incoming)
+                continue
+
+            msg = incoming.to_message(username)
+
+            # 3D-Bewegung (Three.js): Szenen-Zustand nachführen, ggf. Besitz prüfen
+            if isinstance(incoming, codec.ObjectMove):
+                if not scene.apply(room, msg, owned):
+                    reject_moves(conn, [incoming.id])
+                    continue
+            elif isinstance(incoming, codec.ObjectMoveBatch):
+                accepted = scene.apply_batch(room, msg, owned)
+                if len(accepted) < len(msg["objects"]):
+                    ids = {obj["id"] for obj in accepted}
+                    reject_moves(conn, [m.id for m in incoming.moves if m.id not in ids])
+                    if not accepted:
+                        continue
+                    msg["objects"] = accepted
+
+            # Mit aktivem Tick sammeln, sonst sofort weiterleiten
+            if msg["type"] in MOVE_TYPES and ticks.submit(room, msg):
+                continue
 
             # 👉 Broadcast an alle im gleichen Room
-            for websocket_client, client_name in rooms[room]:
-                await websocket_client.send_json(msg)
+            broadcast_room(room, msg)
 
+    except WebSocketDisconnect:
+        pass
     finally:
-        # Aufräumen bei Disconnect
-        if room in rooms and (websocket, username) in rooms[room]:
-            rooms[room].remove((websocket, username))
-            if not rooms[room]:
-                del rooms[room]
+        # Aufräumen bei Disconnect (nicht doppelt, falls schon vom Heartbeat)
+        if rooms.leave(conn):
+            forget_connection(conn)
+            room_shrunk(room)
+        await conn.close()
 # ------------------------------------------------------------
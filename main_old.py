@@ -16,6 +16,13 @@ def now_ts() -> str:
     return datetime.utcnow().isoformat(timespec="seconds") + "Z"
 
 
+async def broadcast(room: str, msg: Dict) -> None:
+    """Nachricht einmal kodieren und an alle im Room senden."""
+    frame = json.dumps(msg, separators=(",", ":"), ensure_ascii=False)
+    for conn, _ in list(rooms.get(room, [])):
+        await conn.send_text(frame)
+
+
 # ======================================================================
 # 1) Startseite
 # ======================================================================
@@ -672,8 +679,7 @@ async def websocket_endpoint(websocket: WebSocket, room: str, username: str):
         "text": f"{username} ist dem Room '{room}' beigetreten",
         "ts": now_ts(),
     }
-    for conn, _ in rooms[room]:
-        await conn.send_json(join_msg)
+    await broadcast(room, join_msg)
 
     try:
         while True:
@@ -715,8 +721,7 @@ async def websocket_endpoint(websocket: WebSocket, room: str, username: str):
                 }
 
             # Broadcast nur in diesem Room
-            for conn, _ in rooms[room]:
-                await conn.send_json(msg)
+            await broadcast(room, msg)
 
     except Exception:
         # Disconnect
@@ -729,8 +734,7 @@ async def websocket_endpoint(websocket: WebSocket, room: str, username: str):
                 "text": f"{username} hat den Room '{room}' verlassen",
                 "ts": now_ts(),
             }
-            for conn, _ in rooms.get(room, []):
-                await conn.send_json(leave_msg)
+            await broadcast(room, leave_msg)
 
             if room in rooms and not rooms[room]:
                 del rooms[room]
@@ -0,0 +1,116 @@
+"""Speicher- und Loop-Diagnose für Kapazitätstests (``/debug/memory``).
+
+Nur mit ``WS_DEBUG_MEMORY=1`` erreichbar. Mit ``WS_TRACEMALLOC_FRAMES=N``
+läuft zusätzlich ``tracemalloc``. Die größten Allokationen werden als
+Differenz zu einem Basis-Snapshot gemeldet, also genau das, was seitdem
+dazukam (z.B. durch neue Verbindungen). ``tracemalloc`` kostet selbst Speicher
+und CPU; der RSS liegt dann über dem im Betrieb.
+"""
+import asyncio
+import os
+import resource
+import sysconfig
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+# Vergleichsbasis für die Top-Allokationen
+_baseline: Optional[tracemalloc.Snapshot] = None
+
+# Allokationen der Diagnose selbst nicht mitzählen
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+# Pfade von Standardbibliothek und Paketen werden relativ dazu angezeigt
+_PREFIXES = sorted(
+    {sysconfig.get_path(name) for name in ("purelib", "platlib", "stdlib", "platstdlib")},
+    key=len,
+    reverse=True,
+)
+
+
+def start(frames: int) -> None:
+    """``tracemalloc`` mit ``frames`` Frames pro Allokation starten (0 = aus)."""
+    if frames > 0 and not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def stop() -> None:
+    global _baseline
+    _baseline = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def rss_bytes() -> int:
+    """Aktueller Resident Set Size des Prozesses."""
+    try:
+        with open("/proc/self/statm", "rb") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ohne /proc nur der Höchststand (Linux: kB)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def loop_lag(samples: int = 5, interval: float = 0.02) -> Dict[str, float]:
+    """Verspätung der Event-Loop über ``samples`` kurze Sleeps."""
+    loop = asyncio.get_running_loop()
+    lags: List[float] = []
+    for _ in range(samples):
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(max(loop.time() - start - interval, 0.0))
+    return {
+        "mean_ms": round(sum(lags) / len(lags) * 1000, 3),
+        "max_ms": round(max(lags) * 1000, 3),
+    }
+
+
+def _where(frame: tracemalloc.Frame, lineno: bool) -> str:
+    path = frame.filename
+    for prefix in _PREFIXES:
+        if path.startswith(prefix + os.sep):
+            path = path[len(prefix) + 1 :]
+            break
+    else:
+        if path.startswith(os.getcwd() + os.sep):
+            path = os.path.relpath(path)
+    return f"{path}:{frame.lineno}" if lineno else path
+
+
+def _top(snapshot: tracemalloc.Snapshot, key: str, limit: int) -> List[Dict[str, Any]]:
+    stats = snapshot.compare_to(_baseline, key)
+    return [
+        {
+            "where": _where(stat.traceback[0], key == "lineno"),
+            "size_diff": stat.size_diff,
+            "count_diff": stat.count_diff,
+            "size": stat.size,
+        }
+        for stat in stats[:limit]
+    ]
+
+
+def allocations(top: int, reset: bool = False) -> Dict[str, Any]:
+    """Vom ``tracemalloc`` verfolgter Speicher und die ``top`` größten Zuwächse.
+
+    Mit ``reset`` (oder beim ersten Aufruf) wird der aktuelle Stand die neue
+    Vergleichsbasis. Ein Snapshot blockiert die Loop kurz; ``top=0`` ohne
+    ``reset`` kommt ohne aus.
+    """
+    global _baseline
+    if not tracemalloc.is_tracing():
+        return {}
+    current, peak = tracemalloc.get_traced_memory()
+    report: Dict[str, Any] = {"traced_bytes": current, "traced_peak_bytes": peak}
+    if top <= 0 and not reset:
+        return report
+    snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+    if reset or _baseline is None:
+        _baseline = snapshot
+    report["top_files"] = _top(snapshot, "filename", top)
+    report["top_lines"] = _top(snapshot, "lineno", top)
+    return report
@@ -0,0 +1,364 @@
+"""Metriken im Prozess, ausgegeben im Prometheus-Textformat (``/metrics``).
+
+Zähler, Gauges und Histogramme werden im Hot Path nur hochgezählt (ein
+Dict-Lookup pro Label-Kombination, ein ``bisect`` pro Histogramm-Wert).
+Alles, was sich aus vorhandenem Zustand ablesen lässt (Mitglieder pro Room,
+Queue-Tiefen, bestehende Statistiken), rechnen *Collectors* erst beim
+Abruf aus.
+
+Labels sind begrenzt: Jede Metrik hält höchstens ``max_series``
+Label-Kombinationen, alle weiteren landen gemeinsam unter ``other``. Viele
+Room-Namen können so keinen Speicher fressen. Jeder Worker-Prozess hat seine
+eigene Registry.
+"""
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+import settings
+
+LabelValues = Tuple[str, ...]
+# (Labels, Wert) einer Zeitreihe
+Sample = Tuple[Dict[str, str], float]
+# Name, Typ, Hilfetext, Samples
+Family = Tuple[str, str, str, List[Sample]]
+Collector = Callable[[], Iterable[Family]]
+
+# Label-Wert für alles jenseits von ``max_series``
+OVERFLOW_LABEL = "other"
+
+# Standard-Buckets für Dauer in Sekunden (10 µs bis 100 ms)
+LATENCY_BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        # ein Zähler pro Bucket plus +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    """Basis: Name, Hilfetext und begrenzte Menge an Label-Kombinationen."""
+
+    kind = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        max_series: int = 100,
+    ) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.max_series = max(max_series, 1)
+        self._children: Dict[LabelValues, object] = {}
+        self._overflow = (OVERFLOW_LABEL,) * len(self.labelnames)
+
+    def _new_child(self) -> object:
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Zeitreihe für diese Label-Werte (oder ``other``, wenn voll)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: erwartet Labels {self.labelnames}")
+            if len(self._children) >= self.max_series:
+                values = self._overflow
+                child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._new_child()
+        return child
+
+    def remove(self, *values: str) -> None:
+        """Zeitreihe verwerfen (z.B. wenn ein Room leer ist)."""
+        self._children.pop(values, None)
+
+    def remove_matching(self, label: str, value: str) -> None:
+        """Alle Zeitreihen mit ``label == value`` verwerfen."""
+        pos = self.labelnames.index(label)
+        for key in [k for k in self._children if k[pos] == value]:
+            del self._children[key]
+
+    def _label_dict(self, values: LabelValues) -> Dict[str, str]:
+        return dict(zip(self.labelnames, values))
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        return [
+            (self.name, self._label_dict(values), child.value)  # type: ignore[attr-defined]
+            for values, child in self._children.items()
+        ]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        if not self.labelnames:
+            # ohne Labels direkt zählbar: ``counter.inc()``
+            self.inc = self.labels().inc
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        if not self.labelnames:
+            child = self.labels()
+            self.inc, self.dec, self.set = child.inc, child.dec, child.set
+
+    def _new_child(self) -> GaugeChild:
+        return GaugeChild()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        max_series: int = 100,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames, max_series)
+        if not self.labelnames:
+            self.observe = self.labels().observe
+
+    def _new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        out = []
+        for values, child in self._children.items():
+            labels = self._label_dict(values)
+            cumulative = 0
+            bounds = [*map(_format_value, self.buckets), "+Inf"]
+            for bound, count in zip(bounds, child.counts):  # type: ignore[attr-defined]
+                cumulative += count
+                out.append((self.name + "_bucket", {**labels, "le": bound}, cumulative))
+            out.append((self.name + "_sum", labels, child.sum))  # type: ignore[attr-defined]
+            out.append((self.name + "_count", labels, child.count))  # type: ignore[attr-defined]
+        return out
+
+
+class Registry:
+    def __init__(self, max_retired: int = settings.METRICS_MAX_SERIES) -> None:
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Collector] = []
+        # leere Rooms, deren Zeitreihen nach dem nächsten Abruf verschwinden
+        # (geordnet: bei mehr als ``max_retired`` fallen die ältesten sofort)
+        self._retired: Dict[str, None] = {}
+        self.max_retired = max(max_retired, 0)
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metrik {metric.name} existiert bereits")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = (), **kw) -> Counter:
+        return self.register(Counter(name, help_text, labelnames, **kw))  # type: ignore[return-value]
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = (), **kw) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames, **kw))  # type: ignore[return-value]
+
+    def histogram(
+        self, name: str, help_text: str, labelnames: Sequence[str] = (), **kw
+    ) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, **kw))  # type: ignore[return-value]
+
+    def add_collector(self, collector: Collector) -> None:
+        """Funktion, die beim Abruf zusätzliche Metriken liefert."""
+        self._collectors.append(collector)
+
+    def retire_room(self, room: str) -> None:
+        """Room ist leer: seine Zeitreihen nach dem nächsten Abruf verwerfen.
+
+        So sieht der Scraper die letzten Werte noch einmal, und der Platz in
+        ``max_series`` wird danach für neue Rooms frei. Ohne Abruf warten
+        höchstens ``max_retired`` Rooms; ältere werden sofort verworfen.
+        """
+        retired = self._retired
+        retired.pop(room, None)
+        retired[room] = None
+        while len(retired) > self.max_retired:
+            oldest = next(iter(retired))
+            del retired[oldest]
+            self._drop_room(oldest)
+
+    def revive_room(self, room: str) -> None:
+        self._retired.pop(room, None)
+
+    def _drop_room(self, room: str) -> None:
+        for metric in self._metrics.values():
+            if "room" in metric.labelnames:
+                metric.remove_matching("room", room)
+
+    def _drop_retired(self) -> None:
+        for room in self._retired:
+            self._drop_room(room)
+        self._retired.clear()
+
+    def render(self) -> str:
+        """Alle Metriken im Prometheus-Textformat (Version 0.0.4)."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        lines.append("")
+        self._drop_retired()
+        return "\n".join(lines)
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def bounded(values: Iterable[Tuple[str, float]], limit: int) -> Dict[str, float]:
+    """Werte pro Label auf ``limit`` Einträge begrenzen, Rest unter ``other``."""
+    out: Dict[str, float] = {}
+    for key, value in values:
+        if key not in out and len(out) >= limit:
+            key = OVERFLOW_LABEL
+        out[key] = out.get(key, 0.0) + value
+    return out
+
+
+registry = Registry()
+
+# ------------------------------------------------------------
+# Metriken des Servers (Hot Path)
+# ------------------------------------------------------------
+
+_MAX = settings.METRICS_MAX_SERIES
+
+messages_in = registry.counter(
+    "ws_messages_in_total",
+    "Gültige Client-Nachrichten pro Room und Typ",
+    ("room", "type"),
+    max_series=_MAX,
+)
+messages_out = registry.counter(
+    "ws_messages_out_total",
+    "In Send-Queues eingereihte Frames pro Room (Broadcasts)",
+    ("room",),
+    max_series=_MAX,
+)
+dropped = registry.counter(
+    "ws_dropped_total",
+    "Verworfene Nachrichten nach Grund",
+    ("reason",),
+)
+reaped = registry.counter(
+    "ws_reaped_total",
+    "Vom Heartbeat entfernte Verbindungen pro Room",
+    ("room",),
+    max_series=_MAX,
+)
+resumes = registry.counter(
+    "ws_resumes_total",
+    "Wiederverbindungen: Lücke nachgeliefert (replay) oder Snapshot",
+    ("result",),
+)
+rejected = registry.counter(
+    "ws_rejected_total",
+    "Abgelehnte Verbindungen nach Grund (Admission Control)",
+    ("reason",),
+)
+connections_opened = registry.counter(
+    "ws_connections_opened_total", "Angenommene WebSocket-Verbindungen"
+)
+broadcast_seconds = registry.histogram(
+    "ws_broadcast_seconds", "Dauer eines Fan-outs an die lokalen Room-Mitglieder"
+)
+encode_seconds = registry.histogram(
+    "ws_encode_seconds", "Dauer einer JSON-Kodierung"
+)
+
+# Vorab gebundene Zeitreihen für die häufigsten Gründe
+dropped_queue_full = dropped.labels("queue_full")
+dropped_rate_limit = dropped.labels("rate_limit")
+dropped_invalid = dropped.labels("invalid")
+dropped_not_owner = dropped.labels("not_owner")
+dropped_scene_full = dropped.labels("scene_full")
+dropped_degraded = dropped.labels("degraded")
+dropped_superseded = dropped.labels("superseded")
@@ -0,0 +1,155 @@
+"""Presence: wer ist im Room, ohne Broadcast pro Join/Leave.
+
+Pro Room zählt der Dienst die Sitzungen jedes Usernamens. Ein User erscheint
+mit seiner ersten Sitzung und verschwindet mit der letzten; weitere Tabs
+desselben Users ändern nichts.
+
+- neue Verbindungen bekommen einmal den ganzen Roster:
+  ``{"type": "roster", "users": [...], "count": N}``
+- die übrigen Mitglieder bekommen Änderungen gesammelt über ein kurzes
+  Fenster: ``{"type": "presence", "joined": [...], "left": [...], "count": N}``
+
+Pro User steht im Diff nur sein Endstand im Fenster (rein und wieder raus →
+nur ``left``); Clients wenden Diffs als Mengen-Operationen an, doppelte
+Einträge schaden also nicht. Ein Reconnect-Sturm von N Clients kostet so N
+Roster plus wenige Diffs pro Mitglied statt N² Join-Nachrichten.
+
+Nur ein Worker: Joins und Leaves gehen nicht über das Backplane. Mit
+mehreren Workern enthalten Roster, Diffs und Zählungen nur die Verbindungen
+des eigenen Workers.
+"""
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
+
+Message = Dict[str, Any]
+
+
+class PresenceStats:
+    __slots__ = ("joins", "leaves", "merged", "diffs", "rosters")
+
+    def __init__(self) -> None:
+        # erste bzw. letzte Sitzung eines Users im Room
+        self.joins = 0
+        self.leaves = 0
+        # User hatte im selben Fenster schon eine Änderung
+        self.merged = 0
+        # gesendete Diffs (einmal pro Room und Fenster) und Roster
+        self.diffs = 0
+        self.rosters = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+stats = PresenceStats()
+
+
+class RoomPresence:
+    """Sitzungen pro User eines Rooms und die noch nicht gesendeten Änderungen."""
+
+    __slots__ = ("sessions", "joined", "left", "handle")
+
+    def __init__(self) -> None:
+        # username → Anzahl Sitzungen (einfügegeordnet = Join-Reihenfolge)
+        self.sessions: Dict[str, int] = {}
+        # seit dem letzten Diff (als geordnete Sets)
+        self.joined: Dict[str, None] = {}
+        self.left: Dict[str, None] = {}
+        self.handle: Optional[asyncio.TimerHandle] = None
+
+
+class Presence:
+    """Roster pro Room; Änderungen gehen gesammelt an ``deliver(room, msg)``."""
+
+    def __init__(
+        self,
+        window_ms: Callable[[str], float],
+        deliver: Callable[[str, Message], None],
+    ) -> None:
+        # Sammelfenster pro Room (0 = jede Änderung sofort)
+        self._window_ms = window_ms
+        self._deliver = deliver
+        self._rooms: Dict[str, RoomPresence] = {}
+
+    def join(self, room: str, username: str) -> None:
+        state = self._rooms.get(room)
+        if state is None:
+            state = self._rooms[room] = RoomPresence()
+        count = state.sessions.get(username, 0)
+        state.sessions[username] = count + 1
+        if count:
+            return
+        stats.joins += 1
+        if state.left.pop(username, False) is None:
+            stats.merged += 1
+        state.joined[username] = None
+        self._schedule(room, state)
+
+    def leave(self, room: str, username: str) -> None:
+        state = self._rooms.get(room)
+        if state is None or username not in state.sessions:
+            return
+        count = state.sessions[username] - 1
+        if count:
+            state.sessions[username] = count
+            return
+        del state.sessions[username]
+        stats.leaves += 1
+        if state.joined.pop(username, False) is None:
+            # Neue Verbindungen im Fenster haben ihn im Roster gesehen
+            stats.merged += 1
+        state.left[username] = None
+        self._schedule(room, state)
+
+    def _schedule(self, room: str, state: RoomPresence) -> None:
+        if state.handle is not None:
+            return
+        window = self._window_ms(room)
+        if window <= 0:
+            self.flush(room)
+            return
+        loop = asyncio.get_running_loop()
+        state.handle = loop.call_later(window / 1000.0, self.flush, room)
+
+    def flush(self, room: str) -> None:
+        """Gesammelte Änderungen eines Rooms als ein Diff ausliefern."""
+        state = self._rooms.get(room)
+        if state is None:
+            return
+        state.handle = None
+        if not state.joined and not state.left:
+            return
+        msg = {
+            "type": "presence",
+            "joined": list(state.joined),
+            "left": list(state.left),
+            "count": len(state.sessions),
+        }
+        state.joined = {}
+        state.left = {}
+        stats.diffs += 1
+        self._deliver(room, msg)
+
+    def roster(self, room: str) -> Message:
+        """Aktueller Roster (für neue Verbindungen und HTTP)."""
+        state = self._rooms.get(room)
+        users: List[str] = list(state.sessions) if state is not None else []
+        return {"type": "roster", "users": users, "count": len(users)}
+
+    def count(self, room: str) -> int:
+        state = self._rooms.get(room)
+        return len(state.sessions) if state is not None else 0
+
+    def counts(self) -> Dict[str, int]:
+        """Anzahl User pro Room (Rooms ohne User fehlen)."""
+        return {
+            room: len(state.sessions)
+            for room, state in self._rooms.items()
+            if state.sessions
+        }
+
+    def discard(self, room: str) -> None:
+        """Leeren Room vergessen (ausstehender Diff hat keine Empfänger mehr)."""
+        state = self._rooms.pop(room, None)
+        if state is not None and state.handle is not None:
+            state.handle.cancel()
@@ -0,0 +1,115 @@
+"""Token-Buckets pro Verbindung und Nachrichtentyp, plus Flow-Hinweise.
+
+Jede Verbindung hat einen Bucket für alle Nachrichten und optional je einen
+pro Typ (z.B. ``object_move``). Eine Nachricht geht nur durch, wenn alle
+betroffenen Buckets ein Token haben; sonst entscheidet die konfigurierte
+Aktion (verwerfen, verzögern oder Verbindung schließen).
+
+Flow-Hinweise sagen gut erzogenen Clients, wie oft sie Bewegungen senden
+sollen: Bei ``n`` Mitgliedern, die je ``r`` Updates/s senden, erzeugt ein Room
+``n² · r`` Zustellungen pro Sekunde. Aus einem Budget ``B`` folgt das
+Sendeintervall ``n² / B`` – gerundet auf Verdopplungsstufen, damit sich der
+Hinweis nur selten ändert.
+"""
+import math
+from typing import Dict, Optional, Tuple
+
+import settings
+
+# Aktionen bei überschrittenem Limit (geprüft in settings.py)
+DROP = settings.RATE_DROP
+DELAY = settings.RATE_DELAY
+CLOSE = settings.RATE_CLOSE
+ACTIONS = settings.RATE_ACTIONS
+
+# Close-Code bei Aktion "close" (Policy Violation)
+RATE_LIMIT_CLOSE_CODE = 1008
+
+# Mindestabstand zwischen zwei "slow_down"-Hinweisen an denselben Client (s)
+HINT_COOLDOWN = 1.0
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def wait_time(self, now: float) -> float:
+        """Sekunden bis zum nächsten Token (0.0 = sofort verfügbar)."""
+        tokens = self.tokens + (now - self.stamp) * self.rate
+        self.tokens = tokens if tokens < self.burst else self.burst
+        self.stamp = now
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Buckets einer Verbindung: gesamt + pro Nachrichtentyp."""
+
+    __slots__ = ("total", "by_type", "limited", "_last_hint")
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        type_limits: Dict[str, Tuple[float, float]],
+        now: float,
+    ) -> None:
+        self.total = TokenBucket(rate, burst, now)
+        self.by_type = {
+            msg_type: TokenBucket(r, b, now) for msg_type, (r, b) in type_limits.items()
+        }
+        # Anzahl limitierter Nachrichten
+        self.limited = 0
+        self._last_hint = -HINT_COOLDOWN
+
+    def check(self, msg_type: str, now: float) -> float:
+        """Token für ``msg_type`` nehmen; sonst Wartezeit in Sekunden."""
+        total = self.total
+        bucket = self.by_type.get(msg_type)
+        wait = total.wait_time(now)
+        if bucket is not None:
+            wait = max(wait, bucket.wait_time(now))
+        if wait:
+            self.limited += 1
+            return wait
+        total.tokens -= 1.0
+        if bucket is not None:
+            bucket.tokens -= 1.0
+        return 0.0
+
+    def min_interval_ms(self, msg_type: str) -> int:
+        """Sendeabstand, bei dem ``msg_type`` dauerhaft durchkommt."""
+        rate = self.total.rate
+        bucket = self.by_type.get(msg_type)
+        if bucket is not None:
+            rate = min(rate, bucket.rate)
+        return math.ceil(1000.0 / rate)
+
+    def should_hint(self, now: float) -> bool:
+        """Höchstens einen "slow_down"-Hinweis pro ``HINT_COOLDOWN``."""
+        if now - self._last_hint < HINT_COOLDOWN:
+            return False
+        self._last_hint = now
+        return True
+
+
+def flow_interval_ms(
+    members: int, budget: float, floor_ms: int, ceil_ms: int
+) -> Optional[int]:
+    """Empfohlenes Sendeintervall für Bewegungen in einem Room.
+
+    ``None``, wenn Flow-Hinweise aus sind (``budget`` 0).
+    """
+    if budget <= 0:
+        return None
+    wanted = 1000.0 * members * members / budget
+    interval = floor_ms
+    while interval < wanted and interval < ceil_ms:
+        interval *= 2
+    return min(interval, ceil_ms)
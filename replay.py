@@ -0,0 +1,90 @@
+"""Sequenznummern pro Room und Replay-Fenster für Wiederverbindungen.
+
+Jeder Room-Broadcast bekommt beim Zustellen eine fortlaufende Nummer
+``"seq"`` und die Server-Zeit ``"ts"`` (ms, siehe ``clock``), eingesetzt in
+den fertig kodierten Frame (ohne erneutes Kodieren, einmal pro Broadcast).
+Die letzten ``window`` Frames pro Room bleiben im Speicher.
+
+Ein Client, der sich neu verbindet, schickt seine letzte ``seq`` und die
+``epoch`` mit. Liegt die Lücke noch im Fenster, bekommt er genau die
+fehlenden Frames. Sonst (oder nach einem Server-Neustart mit neuer Epoche)
+bekommt er wie bei einem frischen Join den vollen Snapshot.
+
+Die Nummern vergibt jeder Worker selbst; deshalb gehört zur ``seq`` immer
+die ``epoch`` des Workers.
+"""
+import secrets
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Deque, List, Optional, Tuple
+
+# Kennung dieses Prozesses (neu nach jedem Start)
+EPOCH = secrets.token_hex(4)
+
+
+def splice(seq: int, ts: int, frame: str) -> str:
+    """``seq`` und ``ts`` in ein kodiertes JSON-Objekt einsetzen."""
+    # "{...}" → '{"seq":N,"ts":T,...}'
+    if frame != "{}":
+        return '{"seq":%d,"ts":%d,%s' % (seq, ts, frame[1:])
+    return '{"seq":%d,"ts":%d}' % (seq, ts)
+
+
+class RoomHistory:
+    __slots__ = ("seq", "frames")
+
+    def __init__(self, window: int) -> None:
+        self.seq = 0
+        # (seq, Frame mit "seq")
+        self.frames: Deque[Tuple[int, str]] = deque(maxlen=window)
+
+
+class ReplayStore:
+    """Sequenzzähler und Replay-Fenster pro Room, höchstens ``max_rooms`` (LRU).
+
+    Bleibt nach dem Leave des letzten Mitglieds erhalten, damit auch ein
+    allein wiederkehrender Client seine Lücke bekommt.
+    """
+
+    def __init__(self, window: int, max_rooms: int) -> None:
+        self.window = window
+        self.max_rooms = max_rooms
+        self._rooms: "OrderedDict[str, RoomHistory]" = OrderedDict()
+
+    def stamp(self, room: str, frame: str, ts: int) -> Tuple[int, str]:
+        """Nächste ``seq`` vergeben und mit Server-Zeit ``ts`` in den Frame einsetzen."""
+        history = self._rooms.get(room)
+        if history is None:
+            history = self._rooms[room] = RoomHistory(self.window)
+            while len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+        else:
+            self._rooms.move_to_end(room)
+        seq = history.seq = history.seq + 1
+        stamped = splice(seq, ts, frame)
+        if self.window:
+            history.frames.append((seq, stamped))
+        return seq, stamped
+
+    def current(self, room: str) -> int:
+        history = self._rooms.get(room)
+        return history.seq if history is not None else 0
+
+    def missed(self, room: str, since: int) -> Optional[List[str]]:
+        """Frames nach ``since``; ``None``, wenn die Lücke nicht mehr im Fenster ist."""
+        history = self._rooms.get(room)
+        if history is None:
+            return None if since else []
+        if since > history.seq:
+            # Nummer aus einer anderen Zählung → nicht vertrauenswürdig
+            return None
+        if since == history.seq:
+            return []
+        frames = history.frames
+        if not frames or frames[0][0] > since + 1:
+            return None
+        # Nummern im Fenster sind lückenlos → direkt an die Stelle springen
+        return [frame for _seq, frame in islice(frames, since + 1 - frames[0][0], None)]
+
+    def discard(self, room: str) -> None:
+        self._rooms.pop(room, None)
@@ -0,0 +1,144 @@
+"""Verwaltung der Rooms und ihrer Verbindungen.
+
+Mitglieder liegen in einfügegeordneten Dicts (als Sets genutzt), damit Join
+und Leave O(1) sind. Broadcasts iterieren über einen unveränderlichen
+Snapshot (Tuple), der erst beim nächsten Zugriff nach einer Änderung neu
+gebaut wird – gleichzeitige Joins/Leaves stören eine laufende Iteration nicht.
+
+Genauso gibt es pro Room und Thema einen Snapshot der Abonnenten: Filtern nach
+Abo kostet pro Nachricht nichts, nur nach Join, Leave oder Abo-Änderung wird
+einmal neu gebaut.
+"""
+from typing import Dict, FrozenSet, Iterable, Iterator, Optional, Tuple
+
+from connection import Connection
+
+Members = Tuple[Connection, ...]
+
+# Höchstens so viele Themen-Snapshots pro Room (Clients erfinden Typen)
+MAX_TOPIC_SNAPSHOTS = 64
+
+
+class RoomRegistry:
+    def __init__(self) -> None:
+        # room → {Connection: None}
+        self._rooms: Dict[str, Dict[Connection, None]] = {}
+        # username → {Connection: None} (über alle Rooms)
+        self._users: Dict[str, Dict[Connection, None]] = {}
+        # room → zuletzt gebauter Snapshot
+        self._snapshots: Dict[str, Members] = {}
+        # room → Thema → Snapshot der Abonnenten
+        self._topics: Dict[str, Dict[str, Members]] = {}
+        # room → username → Verbindungen ohne Echo
+        self._quiet: Dict[str, Dict[str, int]] = {}
+
+    def join(self, conn: Connection) -> None:
+        self._rooms.setdefault(conn.room, {})[conn] = None
+        self._users.setdefault(conn.username, {})[conn] = None
+        self._snapshots.pop(conn.room, None)
+        self._topics.pop(conn.room, None)
+        if not conn.echo:
+            self._count_quiet(conn, 1)
+
+    def leave(self, conn: Connection) -> bool:
+        """Verbindung entfernen; ``False``, wenn sie nicht (mehr) drin war."""
+        members = self._rooms.get(conn.room)
+        if members is None or members.pop(conn, False) is False:
+            return False
+        if not members:
+            del self._rooms[conn.room]
+        self._snapshots.pop(conn.room, None)
+        self._topics.pop(conn.room, None)
+        if not conn.echo:
+            self._count_quiet(conn, -1)
+
+        sessions = self._users.get(conn.username)
+        if sessions is not None:
+            sessions.pop(conn, None)
+            if not sessions:
+                del self._users[conn.username]
+        return True
+
+    def evict(self, conns: Iterable[Connection]) -> Dict[str, int]:
+        """Mehrere Verbindungen auf einmal entfernen.
+
+        Gibt pro Room die Anzahl tatsächlich entfernter Verbindungen zurück.
+        """
+        removed: Dict[str, int] = {}
+        for conn in conns:
+            if self.leave(conn):
+                removed[conn.room] = removed.get(conn.room, 0) + 1
+        return removed
+
+    def subscribe(
+        self, conn: Connection, topics: Optional[FrozenSet[str]], echo: bool
+    ) -> None:
+        """Abo einer Verbindung ändern (``topics=None`` = alle Themen)."""
+        joined = conn in self._rooms.get(conn.room, ())
+        if joined and echo != conn.echo:
+            self._count_quiet(conn, -1 if echo else 1)
+        conn.topics = topics
+        conn.echo = echo
+        self._topics.pop(conn.room, None)
+
+    def _count_quiet(self, conn: Connection, delta: int) -> None:
+        users = self._quiet.setdefault(conn.room, {})
+        count = users.get(conn.username, 0) + delta
+        if count > 0:
+            users[conn.username] = count
+        else:
+            users.pop(conn.username, None)
+            if not users:
+                del self._quiet[conn.room]
+
+    def members(self, room: str) -> Members:
+        """Snapshot aller Verbindungen im Room (sicher zum Iterieren)."""
+        snapshot = self._snapshots.get(room)
+        if snapshot is None:
+            snapshot = tuple(self._rooms.get(room, ()))
+            if snapshot:
+                self._snapshots[room] = snapshot
+        return snapshot
+
+    def subscribers(self, room: str, topic: str) -> Members:
+        """Snapshot der Verbindungen im Room, die ``topic`` abonniert haben."""
+        by_topic = self._topics.get(room)
+        if by_topic is None:
+            if room not in self._rooms:
+                return ()
+            by_topic = self._topics[room] = {}
+        snapshot = by_topic.get(topic)
+        if snapshot is None:
+            if len(by_topic) >= MAX_TOPIC_SNAPSHOTS:
+                by_topic.clear()
+            snapshot = by_topic[topic] = tuple(
+                conn
+                for conn in self.members(room)
+                if conn.topics is None or topic in conn.topics
+            )
+        return snapshot
+
+    def echo_off(self, room: str, username: str) -> bool:
+        """Hat ``username`` im Room auf einer Verbindung das Echo abgeschaltet?"""
+        users = self._quiet.get(room)
+        return users is not None and username in users
+
+    def by_user(self, username: str) -> Members:
+        """Alle Verbindungen eines Usernamens (über alle Rooms)."""
+        return tuple(self._users.get(username, ()))
+
+    def count(self, room: str) -> int:
+        return len(self._rooms.get(room, ()))
+
+    def room_names(self) -> Tuple[str, ...]:
+        return tuple(self._rooms)
+
+    def __contains__(self, room: object) -> bool:
+        return room in self._rooms
+
+    def __iter__(self) -> Iterator[Connection]:
+        for room in self.room_names():
+            yield from self.members(room)
+
+    def __len__(self) -> int:
+        return sum(len(members) for members in self._rooms.values())
@@ -0,0 +1,117 @@
+"""Autoritativer Szenen-Zustand pro Room.
+
+Der Server merkt sich pro Room die letzte Position/Rotation jeder Objekt-ID.
+Neue Verbindungen bekommen daraus einen einzigen Snapshot, statt dass alle
+anderen Clients ihren Zustand erneut senden müssen.
+
+Fehlende Achsen in einem Update bedeuten "unverändert" und werden mit dem
+gespeicherten Stand zusammengeführt. Optional gehört ein Objekt dem User,
+der es zuerst bewegt hat; Updates anderer werden dann abgelehnt und gar
+nicht erst verteilt. Ist ein Room voll (``max_objects``), werden Updates für
+neue Objekte ebenso abgelehnt: ohne Eintrag ließe sich weder der Besitz
+prüfen noch der Stand in den Snapshot übernehmen.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import broadcast
+
+Message = Dict[str, Any]
+
+
+class SceneStore:
+    """Objekt-Transformationen pro Room, begrenzt auf ``max_rooms`` (LRU)."""
+
+    def __init__(self, max_rooms: int, max_objects: int) -> None:
+        self.max_rooms = max_rooms
+        self.max_objects = max_objects
+        # room → {id: {"position": ..., "rotation": ..., "user": ..., ["owner": ...]}}
+        self._rooms: "OrderedDict[str, Dict[str, Message]]" = OrderedDict()
+        # room → kodierter Snapshot (ungültig nach jeder Änderung)
+        self._frames: Dict[str, str] = {}
+
+    def _objects(self, room: str) -> Dict[str, Message]:
+        objects = self._rooms.get(room)
+        if objects is None:
+            objects = self._rooms[room] = {}
+            while len(self._rooms) > self.max_rooms:
+                evicted, _ = self._rooms.popitem(last=False)
+                self._frames.pop(evicted, None)
+        else:
+            self._rooms.move_to_end(room)
+        return objects
+
+    def _update(
+        self, objects: Dict[str, Message], user: str, move: Message, owned: bool
+    ) -> bool:
+        obj_id = move["id"]
+        state = objects.get(obj_id)
+        if state is None:
+            if len(objects) >= self.max_objects:
+                return False
+            state = objects[obj_id] = {"position": {}, "rotation": {}}
+        elif owned and state.get("owner", user) != user:
+            return False
+        # neue Dicts: der alte Stand steckt evtl. noch in Nachrichten
+        state["position"] = {**state["position"], **move["position"]}
+        state["rotation"] = {**state["rotation"], **move["rotation"]}
+        state["user"] = user
+        if owned:
+            state["owner"] = user
+        return True
+
+    def apply(self, room: str, msg: Message, owned: bool = False) -> bool:
+        """Transformation aus einem ``object_move`` übernehmen.
+
+        Mit ``owned`` wird der Besitz geprüft; ``False`` = abgelehnt (fremdes
+        Objekt oder neues Objekt in einem vollen Room).
+        """
+        accepted = self._update(self._objects(room), msg["user"], msg, owned)
+        if accepted:
+            self._frames.pop(room, None)
+        return accepted
+
+    def apply_batch(
+        self, room: str, msg: Message, owned: bool = False
+    ) -> List[Message]:
+        """Einträge eines ``object_move_batch`` übernehmen.
+
+        Gibt die angenommenen Einträge zurück (ohne fremde Objekte und neue
+        Objekte in einem vollen Room).
+        """
+        objects = self._objects(room)
+        user = msg["user"]
+        accepted = [m for m in msg["objects"] if self._update(objects, user, m, owned)]
+        if accepted:
+            self._frames.pop(room, None)
+        return accepted
+
+    def release(self, room: str, user: str) -> None:
+        """Besitz aller Objekte von ``user`` im Room aufgeben (nach dem Leave)."""
+        changed = False
+        for state in self._rooms.get(room, {}).values():
+            if state.get("owner") == user:
+                del state["owner"]
+                changed = True
+        if changed:
+            self._frames.pop(room, None)
+
+    def get(self, room: str, obj_id: str) -> Optional[Message]:
+        """Letzte Transformation eines Objekts (oder ``None``)."""
+        return self._rooms.get(room, {}).get(obj_id)
+
+    def snapshot(self, room: str) -> Message:
+        return {"type": "scene_snapshot", "objects": self._rooms.get(room, {})}
+
+    def snapshot_frame(self, room: str) -> Optional[str]:
+        """Kodierten Snapshot liefern, ``None`` bei leerer Szene.
+
+        Der Frame wird pro Änderung nur einmal kodiert, auch wenn viele
+        Clients gleichzeitig joinen.
+        """
+        if not self._rooms.get(room):
+            return None
+        frame = self._frames.get(room)
+        if frame is None:
+            frame = self._frames[room] = broadcast.encode(self.snapshot(room))
+        return frame
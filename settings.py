@@ -0,0 +1,297 @@
+"""Laufzeit-Einstellungen, per Umgebungsvariable überschreibbar.
+
+Einige Einstellungen lassen sich pro Room überschreiben, über
+``WS_ROOM_CONFIG`` als JSON, z.B. ``{"3d": {"tick_hz": 30}}``.
+"""
+import json
+import os
+from typing import Any, Dict
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_str(name: str, default: str) -> str:
+    return os.environ.get(name, "").strip() or default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+# room → {option: wert}
+ROOM_CONFIG: Dict[str, Dict[str, Any]] = json.loads(
+    os.environ.get("WS_ROOM_CONFIG") or "{}"
+)
+
+
+def room_option(room: str, key: str, default: Any) -> Any:
+    """Einstellung für einen Room (Override aus ``WS_ROOM_CONFIG``)."""
+    return ROOM_CONFIG.get(room, {}).get(key, default)
+
+
+# ------------------------------------------------------------
+# Ausgehende Nachrichten pro Client
+# ------------------------------------------------------------
+
+# Überlauf-Strategien für die Send-Queue eines Clients
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+# Maximale Anzahl wartender Nachrichten pro Client
+SEND_QUEUE_SIZE = _env_int("WS_SEND_QUEUE_SIZE", 256)
+
+# Was passiert, wenn ein langsamer Client seine Queue vollaufen lässt
+OVERFLOW_POLICY = _env_str("WS_OVERFLOW_POLICY", DROP_OLDEST)
+
+if OVERFLOW_POLICY not in OVERFLOW_POLICIES:
+    raise ValueError(
+        f"WS_OVERFLOW_POLICY muss eines von {OVERFLOW_POLICIES} sein, "
+        f"nicht {OVERFLOW_POLICY!r}"
+    )
+
+# Sammelfenster in ms: Nachrichten innerhalb des Fensters gehen als ein
+# Frame raus (0 = aus). Pro Room überschreibbar: {"<room>": {"batch_ms": 8}}
+BATCH_MS = _env_float("WS_BATCH_MS", 0)
+
+# Höchstens so viele Nachrichten pro Batch-Frame ("batch_max" pro Room)
+BATCH_MAX = _env_int("WS_BATCH_MAX", 64)
+
+# Transform-Updates in der verlustbehafteten Spur: pro Objekt wartet nur das
+# neueste (0 = wie Chat zuverlässig). Pro Room: {"<room>": {"lossy_moves": false}}
+LOSSY_MOVES = _env_int("WS_LOSSY_MOVES", 1) != 0
+
+# Kompression für Clients mit ?compress=deflate (0 = nie komprimieren)
+COMPRESS = _env_int("WS_COMPRESS", 1) != 0
+
+# Der Server (uvicorn) nimmt permessage-deflate an, wenn der Client es anbietet
+# (uvicorn-Standard). Solche Verbindungen bekommen keine App-Kompression, sonst
+# würde doppelt komprimiert. 0 bei ``--ws-per-message-deflate false``.
+SERVER_DEFLATE = _env_int("WS_SERVER_DEFLATE", 1) != 0
+
+# Frames ab dieser Größe (Zeichen) komprimieren; pro Room überschreibbar:
+# {"<room>": {"compress_min_bytes": 256}} bzw. {"<room>": {"compress": false}}
+COMPRESS_MIN_BYTES = _env_int("WS_COMPRESS_MIN_BYTES", 512)
+
+# Schwelle pro Nachrichtentyp: {"<type>": bytes} oder null (= nie)
+COMPRESS_TYPES: Dict[str, Any] = json.loads(
+    os.environ.get("WS_COMPRESS_TYPES") or '{"object_move": null}'
+)
+
+# zlib-Level (1 = schnell … 9 = klein)
+COMPRESS_LEVEL = _env_int("WS_COMPRESS_LEVEL", 6)
+
+
+# ------------------------------------------------------------
+# Eingehende Nachrichten (Validierung)
+# ------------------------------------------------------------
+
+# Größere Text-Frames werden vor dem Parsen abgelehnt (Close-Code 1009)
+MAX_FRAME_BYTES = _env_int("WS_MAX_FRAME_BYTES", 16 * 1024)
+
+# Maximale Länge von Chat-/Event-Texten (Zeichen)
+MAX_TEXT_LENGTH = _env_int("WS_MAX_TEXT_LENGTH", 2000)
+
+# Maximale Länge einer Objekt-ID
+MAX_ID_LENGTH = _env_int("WS_MAX_ID_LENGTH", 64)
+
+# Betragsgrenze für Positions-/Rotationswerte
+MAX_COORDINATE = _env_float("WS_MAX_COORDINATE", 1e6)
+
+# Höchstzahl an Objekten in einem object_move_batch
+MOVE_BATCH_MAX = _env_int("WS_MOVE_BATCH_MAX", 128)
+
+
+# ------------------------------------------------------------
+# Rate-Limits pro Verbindung (Token-Buckets)
+# ------------------------------------------------------------
+
+# Nachrichten pro Sekunde und Burst über alle Typen (0 = kein Limit)
+RATE_MSGS = _env_float("WS_RATE_MSGS", 60)
+RATE_BURST = _env_float("WS_RATE_BURST", 120)
+
+# Zusätzliche Limits pro Typ: {"<type>": [rate, burst]}
+RATE_TYPES: Dict[str, Any] = json.loads(
+    os.environ.get("WS_RATE_TYPES")
+    or '{"chat": [5, 10], "object_move": [30, 60], "object_move_batch": [30, 60]}'
+)
+
+# Aktionen bei überschrittenem Limit
+RATE_DROP = "drop"
+RATE_DELAY = "delay"
+RATE_CLOSE = "close"
+RATE_ACTIONS = (RATE_DROP, RATE_DELAY, RATE_CLOSE)
+
+# Bei Überschreitung: "drop", "delay" (höchstens WS_RATE_MAX_DELAY_MS) oder "close"
+RATE_ACTION = _env_str("WS_RATE_ACTION", RATE_DROP)
+
+if RATE_ACTION not in RATE_ACTIONS:
+    raise ValueError(
+        f"WS_RATE_ACTION muss eines von {RATE_ACTIONS} sein, "
+        f"nicht {RATE_ACTION!r}"
+    )
+RATE_MAX_DELAY_MS = _env_float("WS_RATE_MAX_DELAY_MS", 1000)
+
+# Zustellungen/s, die ein Room durch Bewegungen erzeugen soll; daraus
+# berechnet der Server Flow-Hinweise für Clients (0 = keine Hinweise)
+FLOW_BUDGET = _env_float("WS_FLOW_BUDGET", 0)
+
+# Grenzen für das empfohlene Sendeintervall (ms)
+FLOW_MIN_INTERVAL_MS = _env_int("WS_FLOW_MIN_INTERVAL_MS", 50)
+FLOW_MAX_INTERVAL_MS = _env_int("WS_FLOW_MAX_INTERVAL_MS", 1000)
+
+
+# ------------------------------------------------------------
+# Interest-Management (räumliches Hash-Gitter)
+# ------------------------------------------------------------
+
+# Zellgröße des Gitters (0 = aus, alle sehen alles).
+# Pro Room überschreibbar: {"<room>": {"interest_cell": 4}}
+INTEREST_CELL = _env_float("WS_INTEREST_CELL", 0)
+
+# So viele Zellen darf ein einzelner Interessensbereich höchstens abdecken
+INTEREST_MAX_CELLS = _env_int("WS_INTEREST_MAX_CELLS", 4096)
+
+
+# ------------------------------------------------------------
+# Wiederverbindung (Sequenznummern + Replay-Fenster)
+# ------------------------------------------------------------
+
+# So viele letzte Broadcasts pro Room bekommt ein wiederkehrender Client
+# nachgeliefert; ältere Lücken → voller Snapshot (0 = immer Snapshot)
+REPLAY_WINDOW = _env_int("WS_REPLAY_WINDOW", 256)
+
+
+# ------------------------------------------------------------
+# Event-Log (dauerhaft, pro Room)
+# ------------------------------------------------------------
+
+# Verzeichnis für das Event-Log ("" = aus, alles nur im Speicher)
+EVENTLOG_DIR = _env_str("WS_EVENTLOG_DIR", "")
+
+# Diese Nachrichtentypen werden geloggt (kommagetrennt)
+EVENTLOG_TYPES = frozenset(
+    t.strip() for t in _env_str("WS_EVENTLOG_TYPES", "chat").split(",") if t.strip()
+)
+
+# Segmentgröße in Bytes; danach beginnt ein neues Segment
+EVENTLOG_SEGMENT_BYTES = _env_int("WS_EVENTLOG_SEGMENT_BYTES", 8 * 1024 * 1024)
+
+# Gesammelt schreiben und fsyncen alle N ms; WS_EVENTLOG_FSYNC=0 → nur schreiben
+EVENTLOG_FLUSH_MS = _env_float("WS_EVENTLOG_FLUSH_MS", 50)
+EVENTLOG_FSYNC = _env_int("WS_EVENTLOG_FSYNC", 1) != 0
+
+# Retention pro Room: Bytes bzw. Alter in Sekunden (0 = unbegrenzt)
+EVENTLOG_RETENTION_BYTES = _env_int("WS_EVENTLOG_RETENTION_BYTES", 64 * 1024 * 1024)
+EVENTLOG_RETENTION_SECONDS = _env_float("WS_EVENTLOG_RETENTION_SECONDS", 0)
+
+# Abgeschlossene Segmente kompaktieren (pro type+id nur der neueste Record)
+EVENTLOG_COMPACT = _env_int("WS_EVENTLOG_COMPACT", 0) != 0
+
+# So viele letzte Events bekommt ein Client beim Join (0 = keine)
+EVENTLOG_REPLAY = _env_int("WS_EVENTLOG_REPLAY", 0)
+
+
+# ------------------------------------------------------------
+# Admission Control und Überlastschutz
+# ------------------------------------------------------------
+
+# Obergrenzen für Verbindungen (0 = unbegrenzt): pro Prozess, pro Room
+# ({"<room>": {"max_members": 50}}) und pro Username über alle Rooms
+MAX_CONNECTIONS = _env_int("WS_MAX_CONNECTIONS", 0)
+MAX_ROOM_MEMBERS = _env_int("WS_MAX_ROOM_MEMBERS", 0)
+MAX_USER_CONNECTIONS = _env_int("WS_MAX_USER_CONNECTIONS", 0)
+
+# Abgelehnte Clients sollen frühestens nach so vielen Sekunden wiederkommen
+RETRY_AFTER = _env_int("WS_RETRY_AFTER", 5)
+
+# Messintervall der Überlast-Erkennung (ms) und Schwellen für den
+# Degraded-Modus: Loop-Verzögerung in ms, tiefste Send-Queue (0 = ignorieren)
+OVERLOAD_CHECK_MS = _env_float("WS_OVERLOAD_CHECK_MS", 250)
+OVERLOAD_LOOP_LAG_MS = _env_float("WS_OVERLOAD_LOOP_LAG_MS", 250)
+OVERLOAD_QUEUE_DEPTH = _env_int("WS_OVERLOAD_QUEUE_DEPTH", 0)
+
+# Degraded-Modus: "throttle" (Bewegungen drosseln) oder "chat_only"
+DEGRADED_MODE = _env_str("WS_DEGRADED_MODE", "throttle")
+
+# Mindestabstand zwischen zwei Bewegungen einer Verbindung (ms) bei "throttle"
+DEGRADED_MOVE_INTERVAL_MS = _env_float("WS_DEGRADED_MOVE_INTERVAL_MS", 200)
+
+
+# ------------------------------------------------------------
+# Heartbeat (tote Verbindungen erkennen)
+# ------------------------------------------------------------
+
+# Stille Clients bekommen nach so vielen Sekunden einen Ping (0 = aus, Standard;
+# z.B. 25). Eingeschaltet werden Clients ohne Pong geschlossen.
+HEARTBEAT_INTERVAL = _env_float("WS_HEARTBEAT_INTERVAL", 0)
+
+# Ohne Lebenszeichen so lange (s) → Verbindung wird entfernt (Close-Code 1001)
+HEARTBEAT_TIMEOUT = _env_float("WS_HEARTBEAT_TIMEOUT", 60)
+
+
+# ------------------------------------------------------------
+# Presence (Roster + gesammelte Join/Leave-Diffs)
+# ------------------------------------------------------------
+
+# Sammelfenster für Presence-Diffs in ms ("presence_ms" pro Room, 0 = sofort)
+PRESENCE_MS = _env_float("WS_PRESENCE_MS", 250)
+
+
+# ------------------------------------------------------------
+# Metriken (/metrics)
+# ------------------------------------------------------------
+
+# Höchstzahl an Label-Kombinationen pro Metrik (z.B. Rooms), Rest → "other"
+METRICS_MAX_SERIES = _env_int("WS_METRICS_MAX_SERIES", 100)
+
+
+# ------------------------------------------------------------
+# Diagnose (Soak-/Kapazitätstests, nicht für den Betrieb)
+# ------------------------------------------------------------
+
+# /debug/memory freischalten: RSS, Tasks, Loop-Lag, tracemalloc
+DEBUG_MEMORY = _env_int("WS_DEBUG_MEMORY", 0) != 0
+
+# tracemalloc mit so vielen Frames pro Allokation (0 = aus)
+TRACEMALLOC_FRAMES = _env_int("WS_TRACEMALLOC_FRAMES", 0)
+
+
+# ------------------------------------------------------------
+# Backplane (mehrere Worker-Prozesse)
+# ------------------------------------------------------------
+
+# "local" (ein Worker), "memory" (Tests) oder "unix" (lokaler Broker)
+BACKPLANE = _env_str("WS_BACKPLANE", "local")
+
+# Socket-Pfad des lokalen Brokers (dazu eine Lock-Datei "<pfad>.lock")
+BACKPLANE_PATH = _env_str("WS_BACKPLANE_PATH", "/tmp/fastapi-ws-backplane.sock")
+
+
+# ------------------------------------------------------------
+# Simulation-Tick für object_move
+# ------------------------------------------------------------
+
+# Ticks pro Sekunde (0 = jede Bewegung sofort weiterleiten).
+# Pro Room überschreibbar: {"<room>": {"tick_hz": 30}}
+TICK_HZ = _env_float("WS_TICK_HZ", 0)
+
+
+# ------------------------------------------------------------
+# Szenen-Zustand (Snapshot beim Join)
+# ------------------------------------------------------------
+
+# So viele Rooms merkt sich der Server (älteste zuerst verworfen)
+SCENE_MAX_ROOMS = _env_int("WS_SCENE_MAX_ROOMS", 1024)
+
+# Maximale Anzahl Objekte pro Room
+SCENE_MAX_OBJECTS = _env_int("WS_SCENE_MAX_OBJECTS", 1024)
+
+# Objekt-Besitz: wer ein Objekt zuerst bewegt, besitzt es bis zum Leave;
+# Updates anderer werden verworfen. Pro Room: {"<room>": {"ownership": true}}
+OBJECT_OWNERSHIP = _env_int("WS_OBJECT_OWNERSHIP", 0) != 0
@@ -0,0 +1,23 @@
+"""Gemeinsame Test-Hilfen: WebSocket ohne Netzwerk."""
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed_with = None
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+def drain(conn):
+    frames = []
+    while conn.pending:
+        frames.append(conn._take())
+    return frames
@@ -0,0 +1,61 @@
+import admission
+from admission import OVERLOAD_CHECKS, RECOVER_CHECKS, Admission
+from rooms import RoomRegistry
+
+
+def make(**options):
+    changes = []
+    params = dict(
+        max_connections=0,
+        max_room_members=lambda room: 0,
+        max_user_connections=0,
+        retry_after=5,
+        check_ms=250,
+        max_loop_lag_ms=250,
+        max_queue_depth=100,
+        mode=admission.THROTTLE,
+        move_interval_ms=200,
+        on_change=changes.append,
+    )
+    params.update(options)
+    return Admission(RoomRegistry(), **params), changes
+
+
+def test_single_lag_spike_does_not_degrade():
+    adm, changes = make()
+    adm.observe(1.0, 0)
+    adm.observe(0.0, 0)
+    adm.observe(1.0, 0)
+    assert not adm.degraded
+    assert changes == []
+
+
+def test_sustained_lag_degrades_and_recovers():
+    adm, changes = make()
+    for _ in range(OVERLOAD_CHECKS):
+        adm.observe(1.0, 0)
+    assert adm.degraded
+    assert adm.check("r", "u") == ("overloaded", admission.TRY_AGAIN_LATER)
+    for _ in range(RECOVER_CHECKS):
+        adm.observe(0.0, 0)
+    assert not adm.degraded
+    assert changes == [True, False]
+
+
+def test_queue_depth_degrades_at_once():
+    adm, _ = make()
+    adm.observe(0.0, 101)
+    assert adm.degraded
+
+
+def test_throttle_lets_control_messages_through():
+    adm, _ = make()
+    adm.degraded = True
+    throttle = adm.throttle()
+    assert throttle.admit("chat", 0.0)
+    assert throttle.admit("object_move", 0.0)
+    assert not throttle.admit("object_move", 0.1)
+    assert throttle.admit("object_move", 0.3)
+
+    adm.mode = admission.CHAT_ONLY
+    assert not adm.throttle().admit("object_move", 0.0)
@@ -0,0 +1,114 @@
+import asyncio
+
+from backplane import InProcessBackplane, UnixSocketBackplane
+
+
+def test_memory_bus_relays_between_workers():
+    async def run():
+        bus = []
+        workers = [InProcessBackplane(bus) for _ in range(3)]
+        received = {i: [] for i in range(3)}
+        for i, worker in enumerate(workers):
+            worker.set_handler(lambda *args, i=i: received[i].append(args))
+            await worker.start()
+        workers[0].publish("lobby", '{"type":"chat"}', "alice")
+        workers[1].publish("3d", "{}")
+        await workers[2].stop()
+        workers[0].publish("lobby", "{}", "bob")
+        return received
+
+    received = asyncio.run(run())
+    assert received[0] == [("3d", "{}", None)]
+    assert received[1] == [("lobby", '{"type":"chat"}', "alice"), ("lobby", "{}", "bob")]
+    assert received[2] == [("lobby", '{"type":"chat"}', "alice"), ("3d", "{}", None)]
+
+
+def test_unix_broker_relays_with_sender(tmp_path):
+    async def run():
+        path = str(tmp_path / "bp.sock")
+        broker, worker = UnixSocketBackplane(path), UnixSocketBackplane(path)
+        at_broker, at_worker = [], []
+        broker.set_handler(lambda *args: at_broker.append(args))
+        worker.set_handler(lambda *args: at_worker.append(args))
+        await broker.start()
+        await worker.start()
+        try:
+            worker.publish("räum", '{"text":"grüß"}', "jörg")
+            broker.publish("lobby", "{}")
+            for _ in range(100):
+                if at_broker and at_worker:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await worker.stop()
+            await broker.stop()
+        return broker.is_broker, at_broker, at_worker
+
+    is_broker, at_broker, at_worker = asyncio.run(run())
+    assert is_broker
+    assert at_broker == [("räum", '{"text":"grüß"}', "jörg")]
+    assert at_worker == [("lobby", "{}", None)]
+
+
+def test_handler_errors_do_not_stop_the_relay(tmp_path):
+    async def run():
+        path = str(tmp_path / "bp.sock")
+        broker, worker = UnixSocketBackplane(path), UnixSocketBackplane(path)
+        received = []
+
+        def handler(room, frame, sender):
+            if frame == "kaputt":
+                raise OSError("Handler kaputt")
+            received.append(frame)
+
+        worker.set_handler(handler)
+        await broker.start()
+        await worker.start()
+        try:
+            broker.publish("lobby", "kaputt")
+            broker.publish("lobby", "heil")
+            for _ in range(100):
+                if received:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await worker.stop()
+            await broker.stop()
+        return received, worker.dropped
+
+    assert asyncio.run(run()) == (["heil"], 1)
+
+
+def test_worker_reconnects_after_unexpected_error(tmp_path, monkeypatch):
+    async def run():
+        path = str(tmp_path / "bp.sock")
+        broker = UnixSocketBackplane(path, reconnect_delay=0.01)
+        worker = UnixSocketBackplane(path, reconnect_delay=0.01)
+        received = []
+        worker.set_handler(lambda room, frame, sender: received.append(frame))
+        await broker.start()
+
+        read_packets = worker._read_packets
+        calls = []
+
+        async def flaky(reader, origin):
+            calls.append(origin)
+            if len(calls) == 1:
+                raise RuntimeError("unerwartet")
+            await read_packets(reader, origin)
+
+        monkeypatch.setattr(worker, "_read_packets", flaky)
+        await worker.start()
+        try:
+            for _ in range(200):
+                if received:
+                    break
+                broker.publish("lobby", "da")
+                await asyncio.sleep(0.01)
+        finally:
+            await worker.stop()
+            await broker.stop()
+        return received, len(calls)
+
+    received, calls = asyncio.run(run())
+    assert received and calls >= 2
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+import codec
+import settings
+
+
+def decode(msg):
+    return codec.decode_text(json.dumps(msg))
+
+
+def test_plain_text_is_chat():
+    assert codec.decode_text("hallo") == codec.Chat("hallo")
+
+
+def test_object_move():
+    move = decode({"type": "object_move", "id": "a", "position": {"x": 1}, "rotation": {}})
+    assert move == codec.ObjectMove("a", {"x": 1}, {})
+
+
+def test_batch_merges_duplicate_ids():
+    batch = decode(
+        {
+            "type": "object_move_batch",
+            "objects": [
+                {"id": "a", "position": {"x": 1, "y": 1}},
+                {"id": "a", "position": {"x": 2}},
+            ],
+        }
+    )
+    assert batch.moves == [codec.ObjectMove("a", {"x": 2, "y": 1}, {})]
+
+
+@pytest.mark.parametrize(
+    "msg, error",
+    [
+        ([1, 2], "JSON-Objekt"),
+        ({"type": 5}, "type ungültig"),
+        ({"type": "Bad-Type"}, "type ungültig"),
+        ({"type": "session"}, "type ungültig"),
+        ({"type": "chat", "text": 5}, "text muss ein String sein"),
+        ({"type": "chat", "text": "x" * (settings.MAX_TEXT_LENGTH + 1)}, "zu lang"),
+        ({"type": "object_move", "id": ""}, "id ungültig"),
+        ({"type": "object_move", "position": [1, 2]}, "muss ein Objekt sein"),
+        ({"type": "object_move", "position": {"w": 1}}, "position.w unbekannt"),
+        ({"type": "object_move", "position": {"x": True}}, "endliche Zahl"),
+        ({"type": "object_move", "position": {"x": 2 * settings.MAX_COORDINATE}}, "Bereich"),
+        ({"type": "object_move_batch", "objects": []}, "nicht-leere Liste"),
+        ({"type": "object_move_batch", "objects": [1]}, "kein Objekt"),
+        ({"type": "time_sync", "t0": "jetzt"}, "t0"),
+        ({"type": "interest", "center": {"x": 0, "y": 0, "z": 0}, "radius": 0}, "radius"),
+        ({"type": "interest", "center": {"x": 0}, "radius": 1}, "braucht x, y und z"),
+        ({"type": "subscribe", "topics": "chat"}, "topics muss eine Liste sein"),
+        ({"type": "subscribe", "topics": ["Chat!"]}, "topic ungültig"),
+        ({"type": "subscribe", "echo": "nein"}, "echo"),
+    ],
+)
+def test_invalid_messages(msg, error):
+    with pytest.raises(codec.CodecError, match=error):
+        decode(msg)
+
+
+def test_too_many_batch_entries():
+    objects = [{"id": f"o{i}"} for i in range(settings.MOVE_BATCH_MAX + 1)]
+    with pytest.raises(codec.CodecError, match="zu viele"):
+        decode({"type": "object_move_batch", "objects": objects})
+
+
+def test_frame_too_large_before_parsing():
+    with pytest.raises(codec.FrameTooLarge):
+        codec.decode_text("x" * (settings.MAX_FRAME_BYTES + 1))
+
+
+def test_topics_aliases_and_wildcard():
+    assert codec.topics(["object_move_batch", "roster"]) == {"object_move", "presence"}
+    assert codec.topics(["chat", "*"]) is None
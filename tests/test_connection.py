@@ -0,0 +1,166 @@
+import asyncio
+
+import settings
+from connection import SLOW_CONSUMER_CLOSE_CODE, Connection
+from fakes import FakeWebSocket, drain
+
+
+def with_connection(test, **options):
+    async def run():
+        options.setdefault("batch_ms", 0)
+        conn = Connection(FakeWebSocket(), "r", "u", **options)
+        return test(conn)
+
+    return asyncio.run(run())
+
+
+def test_reliable_lane_goes_first():
+    def test(conn):
+        conn.enqueue("move", ("a",))
+        conn.enqueue("chat")
+        return drain(conn)
+
+    assert with_connection(test) == ["chat", "move"]
+
+
+def test_newer_move_replaces_and_goes_to_the_end():
+    def test(conn):
+        conn.enqueue("a1", "a")
+        conn.enqueue("b1", "b")
+        conn.enqueue("a2", "a")
+        return drain(conn)
+
+    assert with_connection(test) == ["b1", "a2"]
+
+
+def test_batch_and_single_keys_keep_per_object_order():
+    # (a,b)@t1, a@t2, (a,b)@t3 → nur der neueste Batch bleibt
+    def test(conn):
+        conn.enqueue("ab1", ("a", "b"))
+        conn.enqueue("a2", ("a",))
+        conn.enqueue("ab3", ("a", "b"))
+        return drain(conn), conn._latest_ids
+
+    frames, index = with_connection(test)
+    assert frames == ["ab3"]
+    assert index == {}
+
+
+def test_partial_overlap_stays_in_front():
+    def test(conn):
+        conn.enqueue("ab1", ("a", "b"))
+        conn.enqueue("a2", ("a",))
+        return drain(conn)
+
+    # b braucht den Batch noch; a2 kommt danach und gewinnt für a
+    assert with_connection(test) == ["ab1", "a2"]
+
+
+def test_flush_latest_moves_pending_updates_before_reliable_frame():
+    def test(conn):
+        conn.enqueue("b1", ("b",))
+        conn.enqueue("ac1", ("a", "c"))
+        conn.enqueue("c2", ("c",))
+        conn.flush_latest(["a"])
+        conn.enqueue("leave a")
+        return drain(conn)
+
+    assert with_connection(test) == ["ac1", "leave a", "b1", "c2"]
+
+
+def test_lossy_lane_is_bounded():
+    def test(conn):
+        for i in range(5):
+            conn.enqueue(f"m{i}", (f"o{i}",))
+        return drain(conn), conn.dropped
+
+    assert with_connection(test, queue_size=3) == (["m2", "m3", "m4"], 2)
+
+def test_flush_latest_respects_queue_bound():
+    def test(conn):
+        conn.enqueue("c0")
+        conn.enqueue("a1", ("a",))
+        conn.enqueue("b1", ("b",))
+        conn.flush_latest(["a", "b"])
+        return drain(conn), conn.dropped
+
+    frames, dropped = with_connection(
+        test, queue_size=2, overflow_policy=settings.DROP_OLDEST
+    )
+    assert frames == ["a1", "b1"]
+    assert dropped == 1
+
+
+def test_flush_latest_disconnects_on_overflow():
+    def test(conn):
+        conn.enqueue("c0")
+        conn.enqueue("a1", ("a",))
+        conn.enqueue("b1", ("b",))
+        conn.flush_latest(["a", "b"])
+        return conn.closed, conn.pending
+
+    closed, pending = with_connection(
+        test, queue_size=1, overflow_policy=settings.DISCONNECT
+    )
+    assert closed
+    assert pending == 0
+
+
+def test_drop_oldest():
+    def test(conn):
+        results = [conn.enqueue(f"c{i}") for i in range(4)]
+        return results, drain(conn), conn.dropped
+
+    results, frames, dropped = with_connection(
+        test, queue_size=2, overflow_policy=settings.DROP_OLDEST
+    )
+    assert results == [True, True, True, True]
+    assert frames == ["c2", "c3"]
+    assert dropped == 2
+
+
+def test_drop_newest():
+    def test(conn):
+        results = [conn.enqueue(f"c{i}") for i in range(4)]
+        return results, drain(conn)
+
+    results, frames = with_connection(
+        test, queue_size=2, overflow_policy=settings.DROP_NEWEST
+    )
+    assert results == [True, True, False, False]
+    assert frames == ["c0", "c1"]
+
+
+def test_disconnect_closes_slow_consumer():
+    async def run():
+        ws = FakeWebSocket()
+        conn = Connection(
+            ws, "r", "u", queue_size=1, overflow_policy=settings.DISCONNECT, batch_ms=0
+        )
+        conn.enqueue("c0")
+        assert not conn.enqueue("c1")
+        assert conn.closed
+        assert not conn.enqueue("c2")
+        conn.start()
+        await asyncio.wait_for(conn._writer, 1)
+        return ws
+
+    ws = asyncio.run(run())
+    assert ws.closed_with == SLOW_CONSUMER_CLOSE_CODE
+    assert ws.sent == []
+
+
+def test_writer_batches_same_kind_frames():
+    async def run():
+        ws = FakeWebSocket()
+        conn = Connection(ws, "r", "u", batch_ms=5, batch_max=8)
+        conn.start()
+        conn.enqueue('{"n":1}')
+        conn.enqueue('{"n":2}')
+        conn.enqueue(b"\x01abc", ("a",))
+        await asyncio.sleep(0.05)
+        await conn.close()
+        return ws.sent
+
+    assert asyncio.run(run()) == ['[{"n":1},{"n":2}]', b"\x01abc"]
+
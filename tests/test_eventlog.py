@@ -0,0 +1,203 @@
+import asyncio
+import json
+
+import eventlog
+from eventlog import EventLog, room_dirname
+
+
+def chat(n):
+    return json.dumps({"type": "chat", "n": n})
+
+
+def payloads(events):
+    return [json.loads(payload)["n"] for _offset, payload in events]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def segments(directory, room):
+    return sorted((directory / room_dirname(room)).glob("*.log"))
+
+
+def test_append_flush_and_read(tmp_path):
+    async def scenario():
+        log = EventLog(str(tmp_path), segment_bytes=1 << 20, flush_ms=10, fsync=False)
+        await log.start()
+        for n in range(5):
+            log.append("lobby", chat(n), {"type": "chat"})
+        # Room wird noch geöffnet, die Records warten im Speicher
+        assert "lobby" in log._opening
+        # noch nicht geschrieben, aber schon lesbar
+        assert payloads(await log.last("lobby", 2)) == [3, 4]
+        await log.flush()
+        events = await log.since("lobby", 1, 10)
+        await log.stop()
+        return events
+
+    events = run(scenario())
+    assert [offset for offset, _ in events] == [1, 2, 3, 4]
+    assert payloads(events) == [1, 2, 3, 4]
+
+
+def test_reads_do_not_create_rooms(tmp_path):
+    async def scenario():
+        log = EventLog(str(tmp_path), segment_bytes=1 << 20, flush_ms=10, fsync=False)
+        await log.start()
+        result = (await log.since("niemand", 0, 10), await log.last("niemand", 5))
+        await log.stop()
+        return result
+
+    assert run(scenario()) == ([], [])
+    assert not (tmp_path / room_dirname("niemand")).exists()
+
+
+def test_recovery_truncates_torn_record(tmp_path):
+    async def write():
+        log = EventLog(str(tmp_path), segment_bytes=1 << 20, flush_ms=10, fsync=False)
+        await log.start()
+        for n in range(3):
+            log.append("lobby", chat(n), {"type": "chat"})
+        await log.stop()
+
+    run(write())
+    (segment,) = segments(tmp_path, "lobby")
+    intact = segment.stat().st_size
+    with open(segment, "ab") as f:
+        # Header eines Records, dessen Payload nie ankam
+        f.write(eventlog.RECORD.pack(100, 0, 3) + b"abgeriss")
+
+    async def reopen():
+        log = EventLog(str(tmp_path), segment_bytes=1 << 20, flush_ms=10, fsync=False)
+        await log.start()
+        events = await log.since("lobby", 0, 10)
+        log.append("lobby", chat(3), {"type": "chat"})
+        await log.flush()
+        after = await log.since("lobby", 0, 10)
+        await log.stop()
+        return events, after
+
+    events, after = run(reopen())
+    assert payloads(events) == [0, 1, 2]
+    assert [offset for offset, _ in after] == [0, 1, 2, 3]
+    assert segment.stat().st_size > intact
+
+
+def test_idle_rooms_reopen_from_memory(tmp_path):
+    async def scenario():
+        log = EventLog(
+            str(tmp_path), segment_bytes=1 << 20, flush_ms=10, fsync=False, idle_close=0
+        )
+        await log.start()
+        log.append("lobby", chat(0), {"type": "chat"})
+        await log.room("lobby")
+        await log.flush()
+        assert "lobby" not in log.rooms
+        assert "lobby" in log._dormant
+        # Dateien weg → Reopen darf nichts einlesen
+        for path in segments(tmp_path, "lobby"):
+            path.with_suffix(".idx").unlink()
+        assert (await log.room("lobby")).next_offset == 1
+        await log.stop()
+
+    run(scenario())
+
+
+def test_retention_drops_oldest_segments(tmp_path):
+    async def scenario():
+        log = EventLog(
+            str(tmp_path),
+            segment_bytes=200,
+            flush_ms=10,
+            fsync=False,
+            retention_bytes=600,
+        )
+        await log.start()
+        await log.room("lobby")
+        for n in range(40):
+            log.append("lobby", chat(n), {"type": "chat"})
+            await log.flush()
+        events = await log.since("lobby", 0, 100)
+        await log.stop()
+        return events
+
+    before = eventlog.stats.segments_deleted
+    events = run(scenario())
+    assert eventlog.stats.segments_deleted > before
+    assert payloads(events)[-1] == 39
+    assert events[0][0] > 0
+    assert len(segments(tmp_path, "lobby")) <= 4
+
+
+def test_compaction_keeps_newest_per_key(tmp_path):
+    def move(obj_id, x):
+        msg = {"type": "object_move", "id": obj_id, "x": x}
+        return json.dumps(msg), msg
+
+    async def scenario():
+        log = EventLog(
+            str(tmp_path), segment_bytes=150, flush_ms=10, fsync=False, compact=True
+        )
+        await log.start()
+        await log.room("3d")
+        for x in range(6):
+            log.append("3d", *move("a", x))
+            log.append("3d", chat(x), {"type": "chat"})
+            await log.flush()
+        log.append("3d", *move("b", 0))
+        await log.flush()
+        while log._compactions:
+            await asyncio.gather(*log._compactions.values())
+        events = await log.since("3d", 0, 100)
+        await log.stop()
+        return events
+
+    events = run(scenario())
+    records = [json.loads(payload) for _offset, payload in events]
+    offsets = [offset for offset, _ in events]
+    assert offsets == sorted(offsets)
+    assert [r["x"] for r in records if r.get("id") == "a"] == [5]
+    assert [r["n"] for r in records if r["type"] == "chat"] == list(range(6))
+    assert any(r.get("id") == "b" for r in records)
+
+
+def test_long_room_names_get_a_hashed_directory(tmp_path):
+    room = "ü" * 50
+
+    async def scenario():
+        log = EventLog(str(tmp_path), segment_bytes=1 << 20, flush_ms=10, fsync=False)
+        await log.start()
+        log.append(room, chat(0), {"type": "chat"})
+        await log.room(room)
+        await log.flush()
+        events = await log.since(room, 0, 10)
+        await log.stop()
+        return events
+
+    name = room_dirname(room)
+    assert name.startswith("h-") and len(name) == 42
+    assert room_dirname("lobby") == "r-lobby"
+    assert payloads(run(scenario())) == [0]
+    assert (tmp_path / name).is_dir()
+
+
+def test_io_errors_never_reach_append(tmp_path):
+    async def scenario():
+        log = EventLog(str(tmp_path), segment_bytes=1 << 20, flush_ms=10, fsync=False)
+        await log.start()
+        # Datei statt Verzeichnis → Öffnen schlägt fehl
+        (tmp_path / room_dirname("kaputt")).write_text("")
+        log.append("kaputt", chat(0), {"type": "chat"})
+        events = await log.last("kaputt", 5)
+        log.append("lobby", chat(1), {"type": "chat"})
+        await log.flush()
+        lobby = await log.last("lobby", 5)
+        await log.stop()
+        return events, lobby
+
+    before = eventlog.stats.errors
+    events, lobby = run(scenario())
+    assert events == []
+    assert payloads(lobby) == [1]
+    assert eventlog.stats.errors > before
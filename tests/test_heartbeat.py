@@ -0,0 +1,33 @@
+import asyncio
+
+from connection import Connection
+from fakes import FakeWebSocket, drain
+from heartbeat import HEARTBEAT_CLOSE_CODE, Heartbeat
+from rooms import RoomRegistry
+
+
+def test_sweep_pings_idle_and_reaps_stale():
+    async def run():
+        rooms = RoomRegistry()
+        fresh, idle, stale = (
+            Connection(FakeWebSocket(), "lobby", name, batch_ms=0)
+            for name in ("frisch", "still", "weg")
+        )
+        for conn in (fresh, idle, stale):
+            rooms.join(conn)
+        now = fresh.last_seen
+        idle.last_seen = now - 30
+        stale.last_seen = now - 90
+
+        reaped = []
+        heartbeat = Heartbeat(rooms, 25, 60, lambda conns, counts: reaped.append(counts))
+        assert heartbeat.sweep(now) == [stale]
+        return rooms.count("lobby"), reaped, drain(fresh), drain(idle), stale
+
+    count, reaped, fresh, idle, stale = asyncio.run(run())
+    assert HEARTBEAT_CLOSE_CODE == 1001
+    assert count == 2
+    assert reaped == [{"lobby": 1}]
+    assert fresh == []
+    assert len(idle) == 1 and '"ping"' in idle[0]
+    assert stale.closed and stale._close_code == 1001
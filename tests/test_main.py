@@ -0,0 +1,178 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.testclient import WebSocketDenialResponse
+
+import broadcast
+import compression
+import main
+import settings
+from connection import Connection
+from fakes import FakeWebSocket, drain
+
+FULL = {"x": 1, "y": 2, "z": 3}
+
+
+def move(position, rotation=None, obj_id="cube"):
+    return {
+        "type": "object_move",
+        "user": "a",
+        "id": obj_id,
+        "position": position,
+        "rotation": FULL if rotation is None else rotation,
+    }
+
+
+def deliver(room, *moves):
+    """Bewegungen an einen Client verteilen, dessen Writer nicht läuft."""
+
+    async def run():
+        conn = Connection(FakeWebSocket(), room, "b", batch_ms=0)
+        for seq, msg in enumerate(moves):
+            main.deliver_moves(room, seq, 0, broadcast.encode(msg), msg, [conn])
+        return [json.loads(frame) for frame in drain(conn)]
+
+    return asyncio.run(run())
+
+
+def test_full_moves_replace_each_other():
+    received = deliver("moves-full", move({"x": 1, "y": 1, "z": 1}), move(FULL))
+    assert [m["position"] for m in received] == [FULL]
+
+
+def test_partial_moves_are_all_delivered_in_order():
+    received = deliver(
+        "moves-partial",
+        move(FULL),
+        move({"x": 5}, {}),
+        move({"y": 3}, {}),
+    )
+    assert [m["position"] for m in received] == [FULL, {"x": 5}, {"y": 3}]
+
+
+# -- WebSocket-Endpunkt ------------------------------------------------------
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+def until(ws, msg_type):
+    """Nachrichten lesen bis einschließlich ``msg_type``."""
+    seen = []
+    while True:
+        msg = ws.receive_json()
+        seen.append(msg)
+        if msg["type"] == msg_type:
+            return seen
+
+
+def sync(ws):
+    """Alles lesen, was vor der Antwort auf einen Uhrabgleich eingereiht war."""
+    ws.send_json({"type": "time_sync", "t0": 1})
+    return until(ws, "time")
+
+
+def types(messages):
+    return [m["type"] for m in messages]
+
+
+# Ohne rotation: Teil-Update, geht also geordnet durch die zuverlässige Spur
+def client_move(x, obj_id="cube-1"):
+    return {"type": "object_move", "id": obj_id, "position": {"x": x, "y": 0, "z": 0}}
+
+
+def test_interest_respects_topic_subscription(client, monkeypatch):
+    monkeypatch.setattr(settings, "INTEREST_CELL", 4.0)
+    with client.websocket_connect("/ws/topics/bob?topics=chat") as bob:
+        bob.send_json({"type": "interest", "center": {"x": 0, "y": 0, "z": 0}, "radius": 5})
+        sync(bob)
+        with client.websocket_connect("/ws/topics/alice") as alice:
+            alice.send_json(client_move(1))
+            alice.send_json(client_move(2))
+            alice.send_json({"type": "chat", "text": "hallo"})
+            sync(alice)
+            received = until(bob, "chat")
+    assert "object_enter" not in types(received)
+    assert "object_move" not in types(received)
+
+
+def test_region_changes_send_leave_for_objects_outside(client, monkeypatch):
+    monkeypatch.setattr(settings, "INTEREST_CELL", 4.0)
+
+    def region(x):
+        return {"type": "interest", "center": {"x": x, "y": 0, "z": 0}, "radius": 5}
+
+    def changes(messages):
+        return [(m["type"], m["id"]) for m in messages if m["type"] != "time"]
+
+    with client.websocket_connect("/ws/region/alice") as alice:
+        alice.send_json(client_move(1, "nah"))
+        alice.send_json(client_move(50, "fern"))
+        sync(alice)
+        with client.websocket_connect("/ws/region/bob") as bob:
+            sync(bob)
+            # erster Bereich: bisher sah Bob alles
+            bob.send_json(region(0))
+            first = changes(sync(bob))
+            bob.send_json(region(50))
+            second = changes(sync(bob))
+    assert first == [("object_leave", "fern")]
+    assert sorted(second) == [("object_enter", "fern"), ("object_leave", "nah")]
+
+
+def big_chat(ws):
+    ws.send_json({"type": "chat", "text": "komprimierbar " * 100})
+    while True:
+        message = ws.receive()
+        if message.get("bytes") is not None:
+            return message["bytes"]
+        if json.loads(message["text"]).get("type") == "chat":
+            return message["text"]
+
+
+def test_app_compresses_without_permessage_deflate(client):
+    with client.websocket_connect("/ws/deflate/alice?compress=deflate") as ws:
+        frame = big_chat(ws)
+    assert isinstance(frame, bytes) and frame[0] == 3
+
+
+def test_no_app_compression_on_top_of_permessage_deflate(client):
+    before = compression.stats.transport
+    with client.websocket_connect(
+        "/ws/deflate/bob?compress=deflate",
+        headers={"sec-websocket-extensions": "permessage-deflate; client_max_window_bits"},
+    ) as ws:
+        frame = big_chat(ws)
+    assert isinstance(frame, str)
+    assert compression.stats.transport == before + 1
+
+
+def test_rejects_in_the_handshake_before_accept(client, monkeypatch):
+    monkeypatch.setattr(main.admissions, "degraded", True)
+    with pytest.raises(WebSocketDenialResponse) as denied:
+        with client.websocket_connect("/ws/voll/alice"):
+            pass
+    response = denied.value
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == str(settings.RETRY_AFTER)
+    assert response.json() == {
+        "type": "rejected",
+        "reason": "overloaded",
+        "retry_after": settings.RETRY_AFTER,
+    }
+    assert not main.rooms.members("voll")
+
+
+def test_too_many_sessions_is_429(client, monkeypatch):
+    monkeypatch.setattr(main.admissions, "max_user_connections", 1)
+    with client.websocket_connect("/ws/sessions/alice") as first:
+        sync(first)
+        with pytest.raises(WebSocketDenialResponse) as denied:
+            with client.websocket_connect("/ws/sessions/alice"):
+                pass
+    assert denied.value.status_code == 429
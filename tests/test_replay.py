@@ -0,0 +1,51 @@
+import json
+
+from replay import ReplayStore, splice
+
+
+def stamp(store, room, n):
+    frames = ['{"type":"chat","n":%d}' % i for i in range(n)]
+    return [store.stamp(room, frame, 1000 + i)[1] for i, frame in enumerate(frames)]
+
+
+def test_splice_inserts_seq_and_ts():
+    spliced = json.loads(splice(3, 42, '{"type":"chat"}'))
+    assert spliced == {"seq": 3, "ts": 42, "type": "chat"}
+    assert json.loads(splice(1, 2, "{}")) == {"seq": 1, "ts": 2}
+
+
+def test_missed_returns_exact_gap():
+    store = ReplayStore(window=10, max_rooms=4)
+    frames = stamp(store, "lobby", 6)
+    assert store.current("lobby") == 6
+    assert store.missed("lobby", 3) == frames[3:]
+    assert store.missed("lobby", 6) == []
+
+
+def test_gap_outside_window_needs_snapshot():
+    store = ReplayStore(window=3, max_rooms=4)
+    frames = stamp(store, "lobby", 6)
+    assert store.missed("lobby", 3) == frames[3:]
+    assert store.missed("lobby", 2) is None
+
+
+def test_seq_from_other_count_is_not_trusted():
+    store = ReplayStore(window=10, max_rooms=4)
+    stamp(store, "lobby", 2)
+    assert store.missed("lobby", 5) is None
+
+
+def test_unknown_room():
+    store = ReplayStore(window=10, max_rooms=4)
+    assert store.missed("leer", 0) == []
+    assert store.missed("leer", 4) is None
+
+
+def test_rooms_are_evicted_lru():
+    store = ReplayStore(window=10, max_rooms=2)
+    stamp(store, "a", 1)
+    stamp(store, "b", 1)
+    stamp(store, "a", 1)
+    stamp(store, "c", 1)
+    assert store.current("a") == 2
+    assert store.current("b") == 0
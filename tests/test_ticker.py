@@ -0,0 +1,51 @@
+import asyncio
+
+from ticker import MoveCoalescer
+
+
+def move(obj_id, position=None, rotation=None, user="u"):
+    return {
+        "type": "object_move",
+        "user": user,
+        "id": obj_id,
+        "position": position or {},
+        "rotation": rotation or {},
+    }
+
+
+def run_tick(*batches):
+    """Jede Liste von Updates landet in einem eigenen Tick."""
+
+    async def run():
+        sent = []
+        coalescer = MoveCoalescer("r", 1000, lambda room, msg: sent.append(msg))
+        for moves in batches:
+            for msg in moves:
+                coalescer.submit(msg)
+            coalescer.close()
+        return sent
+
+    return asyncio.run(run())
+
+
+def test_partial_updates_in_one_tick_are_merged_per_axis():
+    sent = run_tick([move("a", {"x": 5}), move("a", {"y": 3})])
+    assert len(sent) == 1
+    assert sent[0]["position"] == {"x": 5, "y": 3}
+
+
+def test_noop_check_uses_merged_state():
+    sent = run_tick(
+        [move("a", {"x": 5, "y": 1})],
+        [move("a", {"y": 3})],
+        # x=5 wurde schon gesendet, y=3 auch → nichts Neues
+        [move("a", {"x": 5}), move("a", {"y": 3})],
+        [move("a", {"x": 6})],
+    )
+    assert [m["position"] for m in sent] == [{"x": 5, "y": 1}, {"y": 3}, {"x": 6}]
+
+
+def test_several_objects_of_one_user_go_out_as_batch():
+    sent = run_tick([move("a", {"x": 1}), move("b", {"x": 2}), move("c", {"x": 3}, user="v")])
+    assert [m["type"] for m in sent] == ["object_move_batch", "object_move"]
+    assert [o["id"] for o in sent[0]["objects"]] == ["a", "b"]
@@ -0,0 +1,93 @@
+import math
+
+import pytest
+
+import wire
+from connection import pack_batch
+
+
+@pytest.fixture
+def index():
+    idx = wire.ObjectIndex()
+    idx.register("cube-1")
+    idx.register("crate-7")
+    return idx
+
+
+MOVE = {
+    "position": {"x": 1.25, "y": -2.5, "z": 3.0},
+    "rotation": {"x": 0.1, "y": -0.2, "z": 3.0},
+}
+
+
+def test_f32_round_trip(index):
+    frame = wire.encode_move(wire.F32, 1, 7, 1_760_000_000_123, MOVE)
+    assert len(frame) == 36
+    msg = wire.decode_move(frame, index)
+    assert msg["id"] == "crate-7"
+    assert msg["position"] == MOVE["position"]
+    for axis, value in MOVE["rotation"].items():
+        assert msg["rotation"][axis] == pytest.approx(value, abs=1e-6)
+
+
+def test_f32_header_carries_seq_and_ts_mod_2_32(index):
+    frame = wire.encode_move(wire.F32, 0, 2**32 + 5, 2**40 + 9, MOVE)
+    _kind, _flags, _idx, seq, ts = wire._F32.unpack(frame)[:5]
+    assert (seq, ts) == (5, 9)
+
+
+def test_i16_round_trip(index):
+    frame = wire.encode_move(wire.I16, 0, 1, 2, MOVE)
+    assert len(frame) == 24
+    assert frame[1] & wire.FLAG_I16
+    msg = wire.decode_move(frame, index)
+    assert msg["position"] == {"x": 1.25, "y": -2.5, "z": 3.0}
+    assert msg["rotation"]["x"] == pytest.approx(0.1, abs=1e-4)
+    assert msg["rotation"]["z"] == pytest.approx(3.0, abs=1e-4)
+
+
+def test_i16_wraps_rotation(index):
+    move = {"position": {}, "rotation": {"y": 2 * math.pi + 0.5}}
+    frame = wire.encode_move(wire.I16, 0, 1, 2, move)
+    msg = wire.decode_move(frame, index)
+    assert msg["rotation"]["y"] == pytest.approx(0.5, abs=1e-4)
+
+
+def test_i16_keeps_range_edge(index):
+    move = {"position": {"x": -wire.I16_POS_MAX}, "rotation": {}}
+    frame = wire.encode_move(wire.I16, 0, 1, 2, move)
+    assert len(frame) == 24
+    assert wire.decode_move(frame, index)["position"] == {"x": -327.67}
+
+
+def test_i16_out_of_range_falls_back_to_f32(index):
+    move = {"position": {"x": 1000.5}, "rotation": {}}
+    frame = wire.encode_move(wire.I16, 0, 1, 2, move)
+    assert len(frame) == 36
+    assert not frame[1] & wire.FLAG_I16
+    assert wire.decode_move(frame, index)["position"] == {"x": 1000.5}
+
+
+def test_missing_axes_stay_missing(index):
+    move = {"position": {"y": 1.0}, "rotation": {}}
+    for fmt in wire.SUBPROTOCOLS:
+        msg = wire.decode_move(wire.encode_move(fmt, 0, 1, 2, move), index)
+        assert msg["position"] == {"y": 1.0}
+        assert msg["rotation"] == {}
+
+
+def test_decode_rejects_unknown_index_and_size(index):
+    assert wire.decode_move(wire.encode_move(wire.F32, 9, 1, 2, MOVE), index) is None
+    assert wire.decode_move(b"\x01\x00", index) is None
+
+
+def test_batch_envelope_decodes_to_batch(index):
+    frames = [
+        wire.encode_move(wire.I16, 0, 1, 2, MOVE),
+        wire.encode_move(wire.F32, 1, 1, 2, {"position": {"x": 500.0}, "rotation": {}}),
+    ]
+    msg = wire.decode_frame(pack_batch(frames), index, max_moves=8)
+    assert msg["type"] == "object_move_batch"
+    assert [o["id"] for o in msg["objects"]] == ["cube-1", "crate-7"]
+    assert msg["objects"][1]["position"] == {"x": 500.0}
+    assert wire.decode_frame(pack_batch(frames), index, max_moves=1) is None
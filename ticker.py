@@ -0,0 +1,158 @@
+"""Tick-basiertes Zusammenfassen von ``object_move`` (latest-wins pro Achse).
+
+Innerhalb eines Ticks werden die Updates pro Objekt-ID achsenweise
+zusammengeführt wie in ``scene.SceneStore`` (auch Einträge aus
+``object_move_batch``): ein späteres ``{"y": 3}`` überschreibt ein früheres
+``{"x": 5}`` nicht, sondern ergänzt es. Am Tick-Ende geht pro Objekt
+höchstens ein Update raus, pro User zu einem ``object_move_batch``
+zusammengefasst; Updates, die an keiner Achse etwas gegenüber dem zuletzt
+gesendeten Stand ändern, entfallen.
+
+Es läuft kein Task dauerhaft: ein Flush wird nur eingeplant, wenn im
+aktuellen Tick tatsächlich etwas ankam.
+"""
+import asyncio
+import math
+from typing import Any, Callable, Dict, List, Optional
+
+import codec
+
+Message = Dict[str, Any]
+
+
+def _merge(state: Message, update: Message) -> Message:
+    return {
+        **update,
+        "position": {**state["position"], **update["position"]},
+        "rotation": {**state["rotation"], **update["rotation"]},
+    }
+
+
+def _unchanged(state: Message, update: Message) -> bool:
+    return all(
+        state[part].get(axis) == value
+        for part in ("position", "rotation")
+        for axis, value in update[part].items()
+    )
+
+
+class TickStats:
+    __slots__ = ("received", "superseded", "noop", "flushed")
+
+    def __init__(self) -> None:
+        self.received = 0
+        # im selben Tick mit einem neueren Update zusammengeführt
+        self.superseded = 0
+        # ändert keine Achse gegenüber dem zuletzt gesendeten Stand
+        self.noop = 0
+        self.flushed = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+stats = TickStats()
+
+
+class MoveCoalescer:
+    """Sammelt die ``object_move``-Updates eines Rooms bis zum nächsten Tick."""
+
+    __slots__ = ("room", "interval", "_emit", "_pending", "_last_sent", "_handle")
+
+    def __init__(
+        self, room: str, hz: float, emit: Callable[[str, Message], None]
+    ) -> None:
+        self.room = room
+        self.interval = 1.0 / hz
+        self._emit = emit
+        # id → Updates des laufenden Ticks, achsenweise zusammengeführt
+        self._pending: Dict[str, Message] = {}
+        # id → zusammengeführter Stand aller bisher gesendeten Updates
+        self._last_sent: Dict[str, Message] = {}
+        self._handle: Optional[asyncio.TimerHandle] = None
+
+    def submit(self, msg: Message) -> None:
+        stats.received += 1
+        previous = self._pending.pop(msg["id"], None)
+        if previous is not None:
+            stats.superseded += 1
+            msg = _merge(previous, msg)
+        self._pending[msg["id"]] = msg
+
+        if self._handle is None:
+            # Auf das nächste Tick-Raster legen, damit alle Rooms mit
+            # gleicher Rate im Gleichschritt flushen
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            due = (math.floor(now / self.interval) + 1) * self.interval
+            self._handle = loop.call_at(due, self.flush)
+
+    def flush(self) -> None:
+        self._handle = None
+        pending, self._pending = self._pending, {}
+        by_user: Dict[str, List[Message]] = {}
+        for obj_id, msg in pending.items():
+            sent = self._last_sent.get(obj_id)
+            if sent is not None and _unchanged(sent, msg):
+                stats.noop += 1
+                continue
+            self._last_sent[obj_id] = msg if sent is None else _merge(sent, msg)
+            stats.flushed += 1
+            by_user.setdefault(msg["user"], []).append(msg)
+        for user, moves in by_user.items():
+            if len(moves) == 1:
+                self._emit(self.room, moves[0])
+                continue
+            self._emit(
+                self.room,
+                codec.batch_message(
+                    user,
+                    [
+                        {"id": m["id"], "position": m["position"], "rotation": m["rotation"]}
+                        for m in moves
+                    ],
+                ),
+            )
+
+    def close(self) -> None:
+        """Ausstehende Updates sofort senden und den Tick stoppen."""
+        if self._handle is not None:
+            self._handle.cancel()
+        self.flush()
+
+
+class TickScheduler:
+    """Verwaltet die ``MoveCoalescer`` aller Rooms mit aktivem Tick."""
+
+    def __init__(
+        self,
+        emit: Callable[[str, Message], None],
+        hz_for_room: Callable[[str], float],
+    ) -> None:
+        self._emit = emit
+        self._hz_for_room = hz_for_room
+        self._rooms: Dict[str, Optional[MoveCoalescer]] = {}
+
+    def submit(self, room: str, msg: Message) -> bool:
+        """Update einplanen; ``False``, wenn der Room ohne Tick läuft."""
+        try:
+            coalescer = self._rooms[room]
+        except KeyError:
+            hz = self._hz_for_room(room)
+            coalescer = MoveCoalescer(room, hz, self._emit) if hz > 0 else None
+            self._rooms[room] = coalescer
+        if coalescer is None:
+            return False
+        if msg["type"] == "object_move_batch":
+            user = msg["user"]
+            for entry in msg["objects"]:
+                coalescer.submit({"type": "object_move", "user": user, **entry})
+        else:
+            coalescer.submit(msg)
+        return True
+
+    def discard(self, room: str) -> None:
+        """Room ist lokal leer: ausstehende Updates noch senden, dann vergessen."""
+        coalescer = self._rooms.pop(room, None)
+        if coalescer is not None:
+            coalescer.close()
@@ -0,0 +1,221 @@
+"""Kompaktes Binärformat für ``object_move`` (WebSocket-Subprotokoll).
+
+Clients wählen das Format beim Verbindungsaufbau über ein Subprotokoll:
+
+- ``transform.f32.v2`` – Position/Rotation als float32 (36 Bytes)
+- ``transform.i16.v2`` – quantisiert als int16 (24 Bytes): Position in
+  Zentimetern (±327,67), Rotation in 1/10000 rad
+
+Liegt eine Position außerhalb des int16-Bereichs, geht das Update auch in
+``transform.i16.v2`` als float32-Frame raus (``flags`` bit 0 = 0); Empfänger
+unterscheiden die Layouts an ``flags`` bzw. der Länge.
+
+Layout (little-endian)::
+
+    uint8  kind      (1 = transform)
+    uint8  flags     (bit 0: int16-quantisiert)
+    uint16 index     Objekt-Index (pro Room vergeben, siehe ``object_ids``)
+    uint32 seq       Sequenznummer pro Room (wie ``"seq"`` in JSON, mod 2³²)
+    uint32 ts        Server-Zeit in ms (wie ``"ts"`` in JSON, mod 2³²)
+    6 × f32 | 6 × i16  px py pz rx ry rz
+
+``ts`` läuft alle ~49 Tage über; Clients ergänzen die oberen Bits aus ihrer
+abgeglichenen Server-Uhr (nächstliegender Wert). In Frames von Clients
+ignoriert der Server ``seq`` und ``ts``. Die ``v1``-Layouts ohne ``ts`` werden
+nicht mehr angeboten; solche Clients bekommen JSON.
+
+Mehrere Updates (z.B. ein ``object_move_batch``) gehen in einem Umschlag:
+``uint8 2``, dann pro Update ``uint16 Länge`` + Frame (siehe
+``connection.pack_batch``). Clients dürfen solche Umschläge auch senden.
+
+Fehlende Koordinaten werden als NaN (f32) bzw. -32768 (i16) übertragen und
+bedeuten "unverändert". Alle anderen Nachrichten bleiben JSON-Text; JSON- und
+Binär-Clients können im selben Room sein, übersetzt wird am Rand.
+"""
+import math
+import struct
+from typing import Any, Dict, List, Optional
+
+F32 = "transform.f32.v2"
+I16 = "transform.i16.v2"
+SUBPROTOCOLS = (F32, I16)
+
+KIND_TRANSFORM = 1
+KIND_BATCH = 2
+# Komprimierter Text-Frame (siehe ``compression``)
+KIND_DEFLATE = 3
+FLAG_I16 = 0x01
+
+_F32 = struct.Struct("<BBHII6f")
+_I16 = struct.Struct("<BBHII6h")
+
+# Quantisierung für I16
+POS_SCALE = 100.0
+ROT_SCALE = 10000.0
+I16_MISSING = -32768
+# Größter Betrag einer Position, die als int16 passt
+I16_POS_MAX = 32767 / POS_SCALE
+
+_AXES = ("x", "y", "z")
+
+# Größter als float32 darstellbarer Wert
+_F32_MAX = 3.4028234663852886e38
+
+# Mehr Objekte passen nicht in den uint16-Index
+MAX_INDEX = 0xFFFF
+
+Message = Dict[str, Any]
+
+
+def choose_subprotocol(offered: List[str]) -> Optional[str]:
+    """Erstes vom Client angebotenes Subprotokoll, das der Server kennt."""
+    for name in offered:
+        if name in SUBPROTOCOLS:
+            return name
+    return None
+
+
+class ObjectIndex:
+    """Objekt-ID ↔ uint16-Index eines Rooms."""
+
+    __slots__ = ("ids", "names")
+
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def lookup(self, obj_id: str) -> Optional[int]:
+        return self.ids.get(obj_id)
+
+    def register(self, obj_id: str) -> Optional[int]:
+        """Index vergeben; ``None``, wenn der Index-Raum voll ist."""
+        if len(self.names) > MAX_INDEX:
+            return None
+        index = self.ids[obj_id] = len(self.names)
+        self.names.append(obj_id)
+        return index
+
+    def table(self) -> Message:
+        return {"type": "object_ids", "ids": self.ids}
+
+
+def _f32_values(vec: Any) -> List[float]:
+    if not isinstance(vec, dict):
+        vec = {}
+    out = []
+    for axis in _AXES:
+        value = vec.get(axis)
+        if isinstance(value, (int, float)) and abs(value) <= _F32_MAX:
+            out.append(float(value))
+        else:
+            out.append(math.nan)
+    return out
+
+
+def _fits_i16(vec: Dict[str, Any]) -> bool:
+    """Passen alle Koordinaten ohne Abschneiden in int16?"""
+    for axis in _AXES:
+        value = vec.get(axis)
+        if isinstance(value, (int, float)) and math.isfinite(value):
+            if abs(value) > I16_POS_MAX:
+                return False
+    return True
+
+
+def _quantize(value: Any, scale: float) -> int:
+    if not isinstance(value, (int, float)) or not math.isfinite(value):
+        return I16_MISSING
+    return max(-32767, min(32767, round(value * scale)))
+
+
+def _wrap_angle(value: Any) -> Any:
+    if isinstance(value, (int, float)) and math.isfinite(value):
+        return math.remainder(value, math.tau)
+    return value
+
+
+def encode_move(wire: str, index: int, seq: int, ts: int, msg: Message) -> bytes:
+    """``object_move`` als Binär-Frame im Format ``wire`` kodieren.
+
+    ``seq`` und ``ts`` (Server-Zeit in ms) werden auf 32 Bit gekürzt. Passt
+    die Position nicht in int16, wird statt ``I16`` float32 kodiert.
+    """
+    seq &= 0xFFFFFFFF
+    ts &= 0xFFFFFFFF
+    position = msg.get("position")
+    rotation = msg.get("rotation")
+    if wire == I16:
+        position = position if isinstance(position, dict) else {}
+        rotation = rotation if isinstance(rotation, dict) else {}
+        if _fits_i16(position):
+            return _I16.pack(
+                KIND_TRANSFORM,
+                FLAG_I16,
+                index,
+                seq,
+                ts,
+                *(_quantize(position.get(a), POS_SCALE) for a in _AXES),
+                *(_quantize(_wrap_angle(rotation.get(a)), ROT_SCALE) for a in _AXES),
+            )
+    return _F32.pack(
+        KIND_TRANSFORM,
+        0,
+        index,
+        seq,
+        ts,
+        *_f32_values(position),
+        *_f32_values(rotation),
+    )
+
+
+def decode_move(payload: bytes, index: ObjectIndex) -> Optional[Message]:
+    """Binär-Frame eines Clients in ein ``object_move``-Dict übersetzen.
+
+    Gibt ``None`` zurück bei unbekanntem Format oder Objekt-Index.
+    """
+    if len(payload) == _F32.size:
+        kind, flags, idx, _seq, _ts, *values = _F32.unpack(payload)
+        coords = [None if math.isnan(v) else v for v in values]
+    elif len(payload) == _I16.size:
+        kind, flags, idx, _seq, _ts, *raw = _I16.unpack(payload)
+        coords = [
+            None if v == I16_MISSING else v / (POS_SCALE if i < 3 else ROT_SCALE)
+            for i, v in enumerate(raw)
+        ]
+    else:
+        return None
+
+    if kind != KIND_TRANSFORM or idx >= len(index.names):
+        return None
+
+    return {
+        "type": "object_move",
+        "id": index.names[idx],
+        "position": {a: v for a, v in zip(_AXES, coords[:3]) if v is not None},
+        "rotation": {a: v for a, v in zip(_AXES, coords[3:]) if v is not None},
+    }
+
+
+def decode_frame(payload: bytes, index: ObjectIndex, max_moves: int) -> Optional[Message]:
+    """Binär-Frame eines Clients: einzelnes Update oder Umschlag.
+
+    Ein Umschlag wird zu einem ``object_move_batch``; ``None`` bei einem
+    ungültigen Eintrag oder mehr als ``max_moves`` Einträgen.
+    """
+    if not payload or payload[0] != KIND_BATCH:
+        return decode_move(payload, index)
+    objects = []
+    off, end = 1, len(payload)
+    while off + 2 <= end:
+        if len(objects) >= max_moves:
+            return None
+        size = int.from_bytes(payload[off : off + 2], "little")
+        move = decode_move(payload[off + 2 : off + 2 + size], index)
+        if move is None:
+            return None
+        del move["type"]
+        objects.append(move)
+        off += 2 + size
+    if off != end or not objects:
+        return None
+    return {"type": "object_move_batch", "objects": objects}